@@ -0,0 +1,599 @@
+"""
+Precomputed summary tables over the db_setup.py schema, and query routing to them.
+
+    python aggregates.py              # create missing tables, fold in new sales
+    python aggregates.py --rebuild    # drop and rebuild everything
+    python aggregates.py --status
+
+Sales summaries hold COUNT(*), COUNT(amount), SUM/MIN/MAX(amount) per group and
+are refreshed incrementally: only sales past the stored high-water mark (rowid
+on SQLite, id on Postgres) are aggregated and upserted. Triggers on the source
+tables count every other change in agg_versions (updated or deleted sales, a
+sale inserted below the mark, a customer changing city, any change to employees
+or projects); a summary whose sources changed that way is rebuilt in full by
+the next refresh, and is not current until then.
+
+The app rewrites generated aggregate queries over `sales` to the smallest
+summary table that holds every column they use (see rewrite_sql), as long as
+the table is up to date with `sales`. Only up-to-date summaries are shown to
+the SQL Generator (annotate_catalog), and statements that read a stale one
+directly are refused (stale_summaries).
+"""
+import os
+import re
+import sys
+import time
+import sqlite3
+import argparse
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+STATE_TABLE = "agg_state"
+VERSION_TABLE = "agg_versions"
+
+# must match what rewrite_sql() maps to the month column
+MONTH_EXPR = {"sqlite": "strftime('%Y-%m', s.sale_date)", "postgres": "to_char(s.sale_date, 'YYYY-MM')"}
+WATERMARK = {"sqlite": "rowid", "postgres": "id"}
+
+SALES_MEASURES = (
+    ("sale_count", "COUNT(*)", "+"),
+    ("amount_count", "COUNT(s.amount)", "+"),
+    ("total_amount", "SUM(s.amount)", "+"),
+    ("min_amount", "MIN(s.amount)", "min"),
+    ("max_amount", "MAX(s.amount)", "max"),
+)
+
+# name -> dimension columns (in key order) with their source expression, the joins they need
+# and a note for the SQL Generator. "month" is 'YYYY-MM' text on both backends.
+SALES_AGGREGATES: Dict[str, Dict[str, Any]] = {
+    "agg_sales_monthly": {
+        "dims": {"month": None},
+        "joins": "",
+        "note": "one row per month",
+    },
+    "agg_sales_monthly_employee": {
+        "dims": {"month": None, "employee_id": "s.employee_id"},
+        "joins": "",
+        "note": "one row per month and employee_id; join employees on employees.id = employee_id",
+    },
+    "agg_sales_employee": {
+        "dims": {"employee_id": "s.employee_id"},
+        "joins": "",
+        "note": "one row per employee_id; join employees on employees.id = employee_id",
+    },
+    "agg_sales_monthly_city": {
+        "dims": {"month": None, "city": "c.city"},
+        "joins": "JOIN customers c ON c.id = s.customer_id",
+        "note": "one row per month and customer city (sales whose customer exists)",
+    },
+    "agg_sales_customer": {
+        "dims": {"customer_id": "s.customer_id"},
+        "joins": "",
+        "note": "one row per customer_id; join customers on customers.id = customer_id",
+    },
+}
+
+# summaries with more rows than this fraction of sales save too little to route to
+ROUTE_MAX_FRACTION = 0.5
+
+PROJECT_STAFFING = "agg_project_staffing"
+PROJECT_STAFFING_SQL = """
+SELECT p.id, p.name, p.budget, COUNT(e.id), SUM(e.salary)
+FROM projects p LEFT JOIN employees e ON e.project_id = p.id
+GROUP BY p.id, p.name, p.budget
+"""
+
+# source tables whose changes (beyond sales appended past the mark) invalidate each summary
+SOURCES = {name: ("sales", "customers") if spec["joins"] else ("sales",) for name, spec in SALES_AGGREGATES.items()}
+SOURCES[PROJECT_STAFFING] = ("employees", "projects")
+
+# trigger name -> (table, event, extra condition); customer inserts are not counted, since a sale
+# can only reference an existing customer (foreign key)
+TRIGGERS = {
+    "aggv_sales_insert": ("sales", "INSERT", "below_mark"),
+    "aggv_sales_update": ("sales", "UPDATE", None),
+    "aggv_sales_delete": ("sales", "DELETE", None),
+    "aggv_customers_update": ("customers", "UPDATE OF id, city", None),
+    "aggv_customers_delete": ("customers", "DELETE", None),
+    **{f"aggv_{t}_{e.lower()}": (t, e, None) for t in ("employees", "projects") for e in ("INSERT", "UPDATE", "DELETE")},
+}
+
+NOTES = {
+    **{name: f"precomputed sales summary, {spec['note']}" for name, spec in SALES_AGGREGATES.items()},
+    PROJECT_STAFFING: "precomputed per project: budget, headcount and total_salary of its employees",
+}
+SUMMARY_TABLES = (*SALES_AGGREGATES, PROJECT_STAFFING)
+# for scripts that recreate the source tables: summaries of the old rows must go with them
+DROP_SQL = "".join(f"DROP TABLE IF EXISTS {t};\n" for t in (*SUMMARY_TABLES, STATE_TABLE, VERSION_TABLE))
+SUMMARY_RE = re.compile(rf"\b({'|'.join(SUMMARY_TABLES)})\b", re.IGNORECASE)
+MEASURE_NOTE = ("Summary columns: sale_count = COUNT(*), amount_count = COUNT(amount), total_amount = SUM(amount), "
+                "min_amount/max_amount; month is 'YYYY-MM'. AVG(amount) = SUM(total_amount) / SUM(amount_count). "
+                "Prefer these tables over scanning sales for totals, counts and averages.")
+
+
+def _dim_type(dim: str) -> str:
+    return "INTEGER" if dim.endswith("_id") else "TEXT"
+
+
+def create_sql(backend: str) -> List[str]:
+    num = "DOUBLE PRECISION" if backend == "postgres" else "REAL"
+    stmts = [f"CREATE TABLE IF NOT EXISTS {STATE_TABLE} (name TEXT PRIMARY KEY, high_water BIGINT, "
+             f"row_count BIGINT, refreshed_at TEXT, source_mark TEXT)"]
+    for name, spec in SALES_AGGREGATES.items():
+        dims = ", ".join(f"{d} {_dim_type(d)}" for d in spec["dims"])
+        stmts.append(f"CREATE TABLE IF NOT EXISTS {name} ({dims}, sale_count BIGINT, amount_count BIGINT, "
+                     f"total_amount {num}, min_amount {num}, max_amount {num})")
+        # the upsert target; NULL keys (a sale without employee_id) are kept as their own rows
+        stmts.append(f"CREATE UNIQUE INDEX IF NOT EXISTS {name}_key ON {name} ({', '.join(spec['dims'])})")
+    stmts.append(f"CREATE TABLE IF NOT EXISTS {PROJECT_STAFFING} (project_id INTEGER PRIMARY KEY, name TEXT, "
+                 f"budget {num}, headcount BIGINT, total_salary {num})")
+    stmts.append(f"CREATE TABLE IF NOT EXISTS {VERSION_TABLE} (source TEXT PRIMARY KEY, version BIGINT)")
+    stmts += [f"INSERT INTO {VERSION_TABLE} VALUES ('{t}', 0) ON CONFLICT (source) DO NOTHING"
+              for t in ("sales", "customers", "employees", "projects")]
+    return stmts + trigger_sql(backend)
+
+
+def trigger_sql(backend: str) -> List[str]:
+    """Triggers that bump agg_versions for every source change a refresh cannot fold in."""
+    bump = f"UPDATE {VERSION_TABLE} SET version = version + 1 WHERE source = {{source}}"
+    mark = f"(SELECT COALESCE(MAX(high_water), 0) FROM {STATE_TABLE})"
+    if backend != "postgres":
+        # row-level; appends past the mark get rowids above it and skip the WHEN
+        stmts = []
+        for name, (table, event, cond) in TRIGGERS.items():
+            when = f" WHEN NEW.rowid <= {mark}" if cond == "below_mark" else ""
+            source = f"'{table}'"
+            stmts.append(f"CREATE TRIGGER IF NOT EXISTS {name} AFTER {event} ON {table}{when} "
+                         f"BEGIN {bump.format(source=source)}; END")
+        return stmts
+    # statement-level, so bulk writes bump once; the insert trigger checks the new rows as a set
+    stmts = [
+        f"CREATE OR REPLACE FUNCTION aggv_bump() RETURNS trigger LANGUAGE plpgsql AS $$ BEGIN "
+        f"{bump.format(source='TG_TABLE_NAME')}; RETURN NULL; END $$",
+        f"CREATE OR REPLACE FUNCTION aggv_bump_below_mark() RETURNS trigger LANGUAGE plpgsql AS $$ BEGIN "
+        f"IF EXISTS (SELECT 1 FROM aggv_new_rows WHERE id <= {mark}) THEN "
+        f"{bump.format(source='TG_TABLE_NAME')}; END IF; RETURN NULL; END $$",
+    ]
+    for name, (table, event, cond) in TRIGGERS.items():
+        if cond == "below_mark":
+            event, fn = f"{event} ON {table} REFERENCING NEW TABLE AS aggv_new_rows", "aggv_bump_below_mark"
+        else:
+            event, fn = f"{event} OR TRUNCATE" if event == "DELETE" else event, "aggv_bump"
+            event = f"{event} ON {table}"
+        stmts.append(f"DROP TRIGGER IF EXISTS {name} ON {table}")
+        stmts.append(f"CREATE TRIGGER {name} AFTER {event} FOR EACH STATEMENT EXECUTE FUNCTION {fn}()")
+    return stmts
+
+
+def _trigger_count_sql(backend: str) -> str:
+    if backend == "postgres":
+        return r"SELECT COUNT(*) FROM pg_trigger WHERE tgname LIKE 'aggv\_%' AND NOT tgisinternal"
+    return r"SELECT COUNT(*) FROM sqlite_master WHERE type = 'trigger' AND name LIKE 'aggv\_%' ESCAPE '\'"
+
+
+def _delta_select(name: str, backend: str) -> str:
+    spec = SALES_AGGREGATES[name]
+    dims = [MONTH_EXPR[backend] if expr is None else expr for expr in spec["dims"].values()]
+    measures = ", ".join(expr for _, expr, _ in SALES_MEASURES)
+    wm = f"s.{WATERMARK[backend]}"
+    return (f"SELECT {', '.join(dims)}, {measures} FROM sales s {spec['joins']} "
+            f"WHERE {wm} > %(lo)s AND {wm} <= %(hi)s GROUP BY {', '.join(dims)}")
+
+
+def _upsert_sql(name: str, backend: str) -> str:
+    spec = SALES_AGGREGATES[name]
+    keys = list(spec["dims"])
+    pick = {"min": "LEAST" if backend == "postgres" else "min", "max": "GREATEST" if backend == "postgres" else "max"}
+    sets = []
+    for col, _, combine in SALES_MEASURES:
+        old, new = f"{name}.{col}", f"excluded.{col}"
+        if combine == "+":
+            sets.append(f"{col} = {old} + {new}")
+        else:
+            # SQLite's scalar min()/max() return NULL if either side is NULL
+            sets.append(f"{col} = {pick[combine]}(COALESCE({old}, {new}), COALESCE({new}, {old}))")
+    cols = keys + [c for c, _, _ in SALES_MEASURES]
+    # "WHERE true" keeps SQLite from parsing ON CONFLICT as a join constraint of the SELECT
+    return (f"INSERT INTO {name} ({', '.join(cols)}) SELECT * FROM ({_delta_select(name, backend)}) d WHERE true "
+            f"ON CONFLICT ({', '.join(keys)}) DO UPDATE SET {', '.join(sets)}")
+
+
+def _params(sql: str, backend: str, params: Dict[str, Any]):
+    if backend == "postgres":
+        return sql, params
+    return re.sub(r"%\((\w+)\)s", r":\1", sql), params
+
+
+def _execute(cur, backend: str, sql: str, params: Optional[Dict[str, Any]] = None):
+    if params is None:
+        cur.execute(sql)
+    else:
+        cur.execute(*_params(sql, backend, params))
+
+
+def _fold_in(cur, name: str, backend: str, lo: int, hi: int) -> int:
+    """Upsert sales in (lo, hi] into `name`; returns how many groups were new (no COUNT(*) of the summary)."""
+    upsert = _upsert_sql(name, backend)
+    if backend == "postgres":
+        # xmax is 0 for freshly inserted row versions, set for the ones ON CONFLICT updated
+        _execute(cur, backend, f"WITH up AS ({upsert} RETURNING xmax = 0 AS inserted) "
+                               f"SELECT COUNT(*) FILTER (WHERE inserted) FROM up", {"lo": lo, "hi": hi})
+        return cur.fetchone()[0]
+    # summaries are only appended to between rebuilds, so new rows get rowids past the old maximum
+    cur.execute(f"SELECT COALESCE(MAX(rowid), 0) FROM {name}")
+    before = cur.fetchone()[0]
+    _execute(cur, backend, upsert, {"lo": lo, "hi": hi})
+    cur.execute(f"SELECT COALESCE(MAX(rowid), 0) FROM {name}")
+    return cur.fetchone()[0] - before
+
+
+def _source_marks(cur) -> Dict[str, str]:
+    """{summary: change counts of its source tables}, e.g. 'sales:3,customers:0'."""
+    cur.execute(f"SELECT source, version FROM {VERSION_TABLE}")
+    versions = dict(cur.fetchall())
+    return {name: ",".join(f"{t}:{versions.get(t)}" for t in tables) for name, tables in SOURCES.items()}
+
+
+def _tracked(cur, backend: str) -> bool:
+    """Whether every change trigger exists (a table recreated since, e.g. by an export, loses them)."""
+    cur.execute(_trigger_count_sql(backend))
+    return cur.fetchone()[0] == len(TRIGGERS)
+
+
+def refresh(conn, backend: str, rebuild: bool = False, commit: bool = True) -> Dict[str, Dict[str, Any]]:
+    """
+    Create missing summary tables and triggers and bring every summary up to
+    date, in one transaction (left open with commit=False): sales appended past
+    the mark are folded in, and summaries whose sources changed otherwise (or
+    were not tracked) are rebuilt. Returns {table: {'mode', 'new_sales', 'rows', 'ms'}}.
+    """
+    cur = conn.cursor()
+    if backend == "sqlite" and not conn.in_transaction:
+        cur.execute("BEGIN")
+    if rebuild:
+        for name in [*SALES_AGGREGATES, PROJECT_STAFFING, STATE_TABLE, VERSION_TABLE]:
+            cur.execute(f"DROP TABLE IF EXISTS {name}")
+    tracked = _tracked(cur, backend)
+    for stmt in create_sql(backend):
+        cur.execute(stmt)
+    cur.execute(f"SELECT MAX({WATERMARK[backend]}) FROM sales")
+    hi = cur.fetchone()[0] or 0
+    cur.execute(f"SELECT name, high_water, row_count, source_mark FROM {STATE_TABLE}")
+    state = {name: (mark, rows, source) for name, mark, rows, source in cur.fetchall()}
+    marks = _source_marks(cur)
+    now = time.strftime("%Y-%m-%dT%H:%M:%S")
+    report = {}
+
+    for name in SALES_AGGREGATES:
+        started = time.perf_counter()
+        lo, rows, previous = state.get(name, (None, 0, None))
+        mode = "incremental"
+        if lo is None or previous != marks[name] or not tracked:
+            mode, lo, rows = "full", 0, 0
+            cur.execute(f"DELETE FROM {name}")
+        if hi > lo:
+            rows += _fold_in(cur, name, backend, lo, hi)
+        _execute(cur, backend, f"DELETE FROM {STATE_TABLE} WHERE name = %(name)s", {"name": name})
+        _execute(cur, backend, f"INSERT INTO {STATE_TABLE} VALUES (%(name)s, %(hi)s, %(rows)s, %(now)s, %(source)s)",
+                 {"name": name, "hi": hi, "rows": rows, "now": now, "source": marks[name]})
+        report[name] = {"mode": mode, "new_sales": hi - lo, "rows": rows,
+                        "ms": round((time.perf_counter() - started) * 1000, 1)}
+
+    started = time.perf_counter()
+    _, rows, previous = state.get(PROJECT_STAFFING, (None, 0, None))
+    mode = "unchanged" if previous == marks[PROJECT_STAFFING] and tracked else "full"
+    if mode == "full":
+        cur.execute(f"DELETE FROM {PROJECT_STAFFING}")
+        cur.execute(f"INSERT INTO {PROJECT_STAFFING} {PROJECT_STAFFING_SQL}")
+        rows = cur.rowcount
+    _execute(cur, backend, f"DELETE FROM {STATE_TABLE} WHERE name = %(name)s", {"name": PROJECT_STAFFING})
+    _execute(cur, backend, f"INSERT INTO {STATE_TABLE} VALUES (%(name)s, NULL, %(rows)s, %(now)s, %(source)s)",
+             {"name": PROJECT_STAFFING, "rows": rows, "now": now, "source": marks[PROJECT_STAFFING]})
+    report[PROJECT_STAFFING] = {"mode": mode, "new_sales": None, "rows": rows,
+                                "ms": round((time.perf_counter() - started) * 1000, 1)}
+    if commit:
+        conn.commit()
+    return report
+
+
+def _current(conn, backend: str) -> Tuple[Dict[str, int], int]:
+    """
+    ({summary: rows} for every summary up to date with its sources, MAX of the
+    sales watermark). Current means the triggers exist, no tracked change
+    happened since the refresh and, for sales summaries, no sale was appended.
+    """
+    cur = conn.cursor()
+    try:
+        if not _tracked(cur, backend):
+            return {}, 0
+        cur.execute(f"SELECT name, high_water, row_count, source_mark FROM {STATE_TABLE}")
+        state = cur.fetchall()
+        marks = _source_marks(cur)
+        cur.execute(f"SELECT MAX({WATERMARK[backend]}) FROM sales")
+        hi = cur.fetchone()[0] or 0
+    except Exception:
+        if backend == "postgres":
+            conn.rollback()
+        return {}, 0
+    finally:
+        cur.close()
+    return {name: rows for name, mark, rows, source in state
+            if name in marks and source == marks[name] and (name == PROJECT_STAFFING or mark == hi)}, hi
+
+
+def fresh_aggregates(conn, backend: str, max_fraction: Optional[float] = ROUTE_MAX_FRACTION) -> Dict[str, int]:
+    """
+    Sales summary tables that are current (see _current), with their row counts,
+    leaving out those with more than `max_fraction` rows per sale (None keeps all).
+    """
+    current, hi = _current(conn, backend)
+    limit = hi * max_fraction if max_fraction is not None else None
+    return {name: rows for name, rows in current.items()
+            if name in SALES_AGGREGATES and (limit is None or rows <= limit)}
+
+
+def current_summaries(conn, backend: str) -> List[str]:
+    """Every summary table, sales or staffing, that is up to date with its source tables."""
+    return sorted(_current(conn, backend)[0])
+
+
+def stale_summaries(conn, backend: str, sql: str) -> List[str]:
+    """Summary tables a statement reads that are not up to date (no DB work unless it names one)."""
+    named = {m.lower() for m in SUMMARY_RE.findall(_mask_literals(sql))}
+    if not named:
+        return []
+    return sorted(named - set(current_summaries(conn, backend)))
+
+
+def annotate_catalog(catalog: Dict[str, Any], current: Iterable[str] = ()) -> Dict[str, Any]:
+    """
+    Hide the refresh bookkeeping tables and the summary tables not in `current`
+    (see current_summaries), and describe the remaining ones for the prompt.
+    """
+    current = set(current)
+    tables = {t: info for t, info in catalog["tables"].items()
+              if t not in (STATE_TABLE, VERSION_TABLE) and (t not in SUMMARY_TABLES or t in current)}
+    notes = {t: NOTES[t] for t in tables if t in NOTES}
+    out = {**catalog, "tables": tables}
+    if notes:
+        out["notes"] = notes
+    if tables.keys() & SALES_AGGREGATES.keys():
+        out["footer"] = MEASURE_NOTE
+    return out
+
+
+# Routing
+
+def _mask_literals(sql: str) -> str:
+    """Blank out string literals, keeping offsets, so keyword checks cannot match inside them."""
+    return re.sub(r"'(?:[^']|'')*'", lambda m: "'" + " " * (len(m.group()) - 2) + "'", sql)
+
+
+AGG_FUNC_RE = re.compile(r"\b(COUNT|SUM|AVG|MIN|MAX|TOTAL|GROUP_CONCAT|STRING_AGG|ARRAY_AGG)\s*\(", re.IGNORECASE)
+CLAUSE_WORDS = r"(?:JOIN|INNER|LEFT|RIGHT|FULL|CROSS|NATURAL|WHERE|GROUP|ORDER|LIMIT|HAVING|ON|OFFSET)"
+FROM_SALES_RE = re.compile(rf"\bFROM\s+sales\b(?:\s+(?:AS\s+)?(?!{CLAUSE_WORDS}\b)(\w+))?", re.IGNORECASE)
+JOIN_RE = re.compile(
+    rf"\s+(INNER\s+|LEFT\s+(?:OUTER\s+)?)?JOIN\s+(\w+)(?:\s+(?:AS\s+)?(?!ON\b)(\w+))?\s+ON\s+"
+    rf"(\w+)\.(\w+)\s*=\s*(\w+)\.(\w+)(?=\s*(?:$|\b{CLAUSE_WORDS}\b))", re.IGNORECASE)
+ALIASED_RE = re.compile(r'(?:\bAS\s+|[\w)"]\s+)("[^"]+"|\w+)$', re.IGNORECASE)
+DIMENSION_FKS = {"employees": "employee_id", "customers": "customer_id"}
+
+
+def _substitutions(backend: str, q: str, has_joins: bool) -> List[Tuple[str, str, Optional[str]]]:
+    """(regex, replacement, dimension it needs) for sales expressions the summaries can answer."""
+    col = rf"(?:\b{q}\.)?\b{{name}}\b"
+    amount, sale_date = col.format(name="amount"), col.format(name="sale_date")
+    sale_id = rf"\b{q}\.id\b" if has_joins else col.format(name="id")
+    subs = [
+        (rf"\bSUM\(\s*{amount}\s*\)", "SUM({q}.total_amount)", None),
+        (rf"\bAVG\(\s*{amount}\s*\)", "(SUM({q}.total_amount) * 1.0 / NULLIF(SUM({q}.amount_count), 0))", None),
+        (rf"\bMIN\(\s*{amount}\s*\)", "MIN({q}.min_amount)", None),
+        (rf"\bMAX\(\s*{amount}\s*\)", "MAX({q}.max_amount)", None),
+        (rf"\bCOUNT\(\s*{amount}\s*\)", "COALESCE(SUM({q}.amount_count), 0)", None),
+        (rf"\bCOUNT\(\s*(?:\*|{sale_id})\s*\)", "COALESCE(SUM({q}.sale_count), 0)", None),
+    ]
+    if backend == "postgres":
+        subs += [
+            (rf"\bto_char\(\s*{sale_date}\s*,\s*'YYYY-MM'\s*\)", "{q}.month", "month"),
+            (rf"\bto_char\(\s*{sale_date}\s*,\s*'YYYY'\s*\)", "substr({q}.month, 1, 4)", "month"),
+        ]
+    else:
+        subs += [
+            (rf"\bstrftime\(\s*'%Y-%m'\s*,\s*{sale_date}\s*\)", "{q}.month", "month"),
+            (rf"\bstrftime\(\s*'%Y'\s*,\s*{sale_date}\s*\)", "substr({q}.month, 1, 4)", "month"),
+            (rf"\bstrftime\(\s*'%m'\s*,\s*{sale_date}\s*\)", "substr({q}.month, 6, 2)", "month"),
+        ]
+    return subs
+
+
+def _keep_column_names(body: str, originals: List[str], backend: str) -> str:
+    """Alias rewritten select items that had no alias, so result columns keep their names."""
+    masked = _mask_literals(body)
+    select = re.search(r"\bSELECT\s+", masked, re.IGNORECASE)
+    frm = re.search(r"\bFROM\b", masked[select.end():], re.IGNORECASE)
+    start, stop = select.end(), select.end() + frm.start()
+    items, depth, last = [], 0, start
+    for i in range(start, stop):
+        ch = masked[i]
+        depth += ch == "("
+        depth -= ch == ")"
+        if ch == "," and depth == 0:
+            items.append((last, i))
+            last = i + 1
+    items.append((last, stop))
+    out, pos = [], 0
+    for a, b in items:
+        item = body[a:b].rstrip()
+        b = a + len(item)
+        held = re.findall(r"__agg(\d+)__", item)
+        if held and not ALIASED_RE.search(item.strip()):
+            name = re.sub(r"__agg(\d+)__", lambda m: originals[int(m.group(1))], item.strip())
+            if backend == "postgres":
+                name = re.match(r"\s*(\w+)", name).group(1).lower()  # Postgres names f(...) columns "f"
+            out.append(body[pos:b] + ' AS "' + name.replace('"', '""') + '"')
+            pos = b
+    out.append(body[pos:])
+    return "".join(out)
+
+
+def rewrite_sql(sql: str, backend: str, available: Dict[str, int]) -> Optional[Tuple[str, str]]:
+    """
+    Rewrite an aggregate query over `sales` (optionally joined to employees or
+    customers on their keys) to read a summary table instead. `available` maps
+    usable summary tables to their row counts; the smallest one holding every
+    dimension the query needs wins. Returns (sql, table) or None when the query
+    is not provably equivalent: any raw sales row, DISTINCT, window, subquery,
+    aggregate over a joined table's column, or date filter finer than a month.
+    """
+    if not available:
+        return None
+    sql = sql.strip().rstrip(";").strip()
+    masked = _mask_literals(sql)
+    if (";" in masked or len(re.findall(r"\bSELECT\b", masked, re.I)) != 1
+            or re.search(r"\b(DISTINCT|OVER|UNION|INTERSECT|EXCEPT|WINDOW|USING|NATURAL)\b", masked, re.I)
+            or len(re.findall(r"\b(?:FROM|JOIN)\s+sales\b", masked, re.I)) != 1):
+        return None
+    m = FROM_SALES_RE.search(sql)
+    if not m or re.match(r"\s*,", sql[m.end():]):
+        return None
+    q = m.group(1) or "sales"
+
+    # joins directly after FROM sales, each to a dimension table on its key
+    joins = []
+    pos = m.end()
+    while True:
+        j = JOIN_RE.match(sql, pos)
+        if not j:
+            break
+        kind, table, alias, a1, c1, a2, c2 = j.groups()
+        table = table.lower()
+        alias = alias or table
+        fk = DIMENSION_FKS.get(table)
+        if fk is None or {(a1, c1), (a2, c2)} != {(alias, "id"), (q, fk)}:
+            return None
+        joins.append({"table": table, "alias": alias, "inner": not (kind or "").upper().startswith("LEFT"),
+                      "text": j.group()})
+        pos = j.end()
+    if len(re.findall(r"\bJOIN\b", masked, re.I)) != len(joins) or len({j["table"] for j in joins}) != len(joins):
+        return None
+
+    placeholders: List[str] = []
+    originals: List[str] = []
+    need = set()
+    found_aggregate = False
+
+    def hold(replacement: str, dim: Optional[str]):
+        def fn(match):
+            nonlocal found_aggregate
+            if dim:
+                need.add(dim)
+            else:
+                found_aggregate = True
+            placeholders.append(replacement.format(q=q))
+            originals.append(match.group())
+            return f"__agg{len(placeholders) - 1}__"
+        return fn
+
+    body = sql
+    for pattern, replacement, dim in _substitutions(backend, q, bool(joins)):
+        body = re.sub(pattern, hold(replacement, dim), body, flags=re.IGNORECASE)
+
+    masked = _mask_literals(body)
+    if AGG_FUNC_RE.search(masked) or "*" in masked:
+        return None  # an aggregate the summaries cannot answer
+    if not found_aggregate and not re.search(r"\bGROUP\s+BY\b", masked, re.I):
+        return None  # row-level query
+    # of sales itself, only key columns may be left
+    for ref in re.findall(rf"\b{q}\.(\w+)", masked):
+        if ref not in ("employee_id", "customer_id"):
+            return None
+        need.add(ref)
+    unqualified = re.sub(r"\bAS\s+\w+", "", re.sub(r"\w+\.\w+", "", masked), flags=re.I)
+    if re.search(r"\b(amount|sale_date|id)\b", unqualified, re.I):
+        return None
+    for key in ("employee_id", "customer_id"):
+        if re.search(rf"\b{key}\b", unqualified, re.I):
+            need.add(key)
+
+    for j in joins:
+        need.add(DIMENSION_FKS[j["table"]])
+    # an inner join to customers used only for city can be answered by the city summary, which
+    # was built with the same join
+    customer_join = next((j for j in joins if j["table"] == "customers"), None)
+    city_only = False
+    if customer_join is not None and customer_join["inner"]:
+        outside = _mask_literals(body.replace(customer_join["text"], " ", 1))
+        city_only = (set(re.findall(rf"\b{customer_join['alias']}\.(\w+)", outside)) <= {"city"}
+                     and not re.search(r"\bcustomer_id\b", outside))
+
+    options = []
+    for name, rows in sorted(available.items(), key=lambda kv: kv[1]):
+        spec = SALES_AGGREGATES[name]
+        dims = set(spec["dims"])
+        if not spec["joins"] and need <= dims:
+            options.append((name, False))
+        elif spec["joins"] and city_only and "city" in dims and (need - {"customer_id"}) <= dims:
+            options.append((name, True))
+    if not options:
+        return None
+    name, drop_customers = options[0]
+
+    if drop_customers:
+        body = body.replace(customer_join["text"], "", 1)
+        body = re.sub(rf"\b{customer_join['alias']}\.city\b", f"{q}.city", body)
+    body = _keep_column_names(body, originals, backend)
+    from_match = FROM_SALES_RE.search(body)
+    body = body[:from_match.start()] + f"FROM {name} {q}" + body[from_match.end():]
+    for i, expr in enumerate(placeholders):
+        body = body.replace(f"__agg{i}__", expr)
+    return body, name
+
+
+class AggregateRouter:
+    """Rewrites statements to summary tables that are current with `sales`."""
+
+    def __init__(self, backend: str):
+        self.backend = backend
+        self.routed: Dict[str, int] = {}
+
+    def rewrite(self, conn, sql: str) -> Optional[Tuple[str, str]]:
+        if not re.search(r"\bFROM\s+sales\b", sql, re.IGNORECASE):
+            return None
+        routed = rewrite_sql(sql, self.backend, fresh_aggregates(conn, self.backend))
+        if routed is not None:
+            self.routed[routed[1]] = self.routed.get(routed[1], 0) + 1
+        return routed
+
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rebuild", action="store_true", help="drop and rebuild every summary table")
+    parser.add_argument("--status", action="store_true", help="only show which summaries are current")
+    args = parser.parse_args()
+
+    backend = os.getenv("DB_BACKEND", "sqlite").lower()
+    if backend == "postgres":
+        import psycopg2
+        conn = psycopg2.connect(host=os.getenv("PG_HOST", "localhost"), port=os.getenv("PG_PORT", "5432"),
+                                dbname=os.getenv("PG_DATABASE", "company"), user=os.getenv("PG_USER", "postgres"),
+                                password=os.getenv("PG_PASSWORD", ""))
+    else:
+        conn = sqlite3.connect(os.getenv("SQLITE_PATH", "company.db"), isolation_level=None)
+
+    if args.status:
+        fresh, routed = fresh_aggregates(conn, backend, None), fresh_aggregates(conn, backend)
+        for name in SALES_AGGREGATES:
+            status = "stale or missing" if name not in fresh else "current" if name in routed else "current, too large to route"
+            print(f"{name:28s} {status}")
+        sys.exit(0)
+
+    for name, r in refresh(conn, backend, args.rebuild).items():
+        new = "" if r["new_sales"] is None else f"{r['new_sales']:>12,d} new sales"
+        print(f"{name:28s} {r['mode']:12s} {r['rows']:>10,d} rows {new:>22s} {r['ms']:>10.1f} ms")
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
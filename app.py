@@ -1,10 +1,15 @@
 import os
 import re
+import time
+import uuid
+import asyncio
+import logging
+import contextvars
 import json
-import sqlite3
-from typing import Any, Dict
+from typing import Any, Dict, List, Optional
+from contextvars import ContextVar
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
-from decimal import Decimal
 
 load_dotenv()
 
@@ -17,25 +22,54 @@ PG_DATABASE = os.getenv("PG_DATABASE", "company")
 PG_USER = os.getenv("PG_USER", "postgres")
 PG_PASSWORD = os.getenv("PG_PASSWORD", "")
 
+LLM_PROVIDER = os.getenv("LLM_PROVIDER", "gemini").lower()  # 'gemini' or 'fake' (offline stub)
 GEMINI_KEY = os.getenv("GEMINI_API_KEY", "")
 GEN_MODEL = os.getenv("GEN_MODEL", "models/gemini-2.5-flash")
-
-if not GEMINI_KEY:
-    print("WARNING: GEMINI_API_KEY not set. Set it in .env or environment variables.")
-
-# import LLM SDK late (avoid error if not installed)
-try:
-    import google.generativeai as genai
-    genai.configure(api_key=GEMINI_KEY)
-except Exception as e:
-    genai = None
-    print("Warning: google.generativeai not available or not configured:", e)
+# Fake provider settings (used when LLM_PROVIDER == "fake")
+FAKE_LLM_LATENCY_MS = float(os.getenv("FAKE_LLM_LATENCY_MS", "0"))
+FAKE_LLM_JITTER_MS = float(os.getenv("FAKE_LLM_JITTER_MS", "0"))
+FAKE_LLM_CORPUS = os.getenv("FAKE_LLM_CORPUS", os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                             "benchmarks", "question_corpus.json"))
+
+genai = None
+if LLM_PROVIDER == "gemini":
+    if not GEMINI_KEY:
+        print("WARNING: GEMINI_API_KEY not set. Set it in .env or environment variables.")
+
+    # import LLM SDK late (avoid error if not installed)
+    try:
+        import google.generativeai as genai
+        genai.configure(api_key=GEMINI_KEY)
+    except Exception as e:
+        genai = None
+        print("Warning: google.generativeai not available or not configured:", e)
 
 # FastAPI and Gradio
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException, Query
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, Response, StreamingResponse
 from pydantic import BaseModel
 import gradio as gr
+import orjson
+
+from aggregates import AggregateRouter, annotate_catalog, current_summaries, stale_summaries
+from db_pool import PostgresPool, SQLitePool, connect_sqlite, sqlite_file_id
+from example_store import ExampleStore
+from index_advisor import WorkloadLog
+from llm_providers import FakeLLMProvider, GeminiProvider, LLMProvider, load_corpus
+from metrics import SIZE_BUCKETS, Registry
+from query_cache import SQLCache, normalize_question
+from query_guard import CostGuard, QueryGuardError, statement_timeout
+from result_cache import ResultCache, normalize_sql, pg_table_changes, sqlite_data_version
+from result_fetch import compact_result_for_prompt, fetch_bounded, json_default, statement_result
+from result_format import FORMATS, encode_result, encode_statement
+from result_format import pa as pyarrow
+from result_store import ResultStore, needs_paging, page, preview
+from schema_catalog import SchemaCatalog
+from schema_index import SchemaIndex
+from schema_stats import SchemaStats
+from shared_cache import SharedCache
+from stage_scheduler import Stage, critical_path, run_stages
 
 app = FastAPI(title="DataAnalyser Team")
 
@@ -47,26 +81,82 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-from decimal import Decimal
-
-def convert_json_safe(obj):
-    """Convert Decimal, date, tuple etc. into JSON-safe objects."""
-    if isinstance(obj, Decimal):
-        return float(obj)
-    if isinstance(obj, bytes):
-        return obj.decode("utf-8")
-    if hasattr(obj, "isoformat"): 
-        return obj.isoformat()
-    if isinstance(obj, tuple):
-        return [convert_json_safe(i) for i in obj]
-    if isinstance(obj, list):
-        return [convert_json_safe(i) for i in obj]
-    if isinstance(obj, dict):
-        return {k: convert_json_safe(v) for k, v in obj.items()}
-    return obj
+class FastJSONResponse(Response):
+    """JSON response encoded with orjson; rows are already JSON-native, json_default catches the rest."""
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        started = time.perf_counter()
+        body = orjson.dumps(content, default=json_default, option=orjson.OPT_NON_STR_KEYS)
+        JSON_SECONDS.observe(time.perf_counter() - started)
+        return body
+
+def dumps_text(obj: Any) -> str:
+    return orjson.dumps(obj, default=json_default).decode()
+
+
+# Instrumentation
+SLOW_REQUEST_MS = float(os.getenv("SLOW_REQUEST_MS", "0"))  # log the stage breakdown of slower requests; 0 = off
+ASK_INCLUDE_TIMINGS = os.getenv("ASK_INCLUDE_TIMINGS", "false").lower() in ("1", "true", "yes")
+
+logger = logging.getLogger("dataanalyser")
+
+metrics_registry = Registry()
+STAGE_SECONDS = metrics_registry.histogram("rag_stage_duration_seconds", "Wall time of each pipeline stage.", ["stage"])
+REQUEST_SECONDS = metrics_registry.histogram("rag_request_duration_seconds", "Wall time of a whole question.")
+LLM_SECONDS = metrics_registry.histogram("rag_llm_call_seconds", "Latency of LLM calls.", ["agent"])
+LLM_PROMPT_CHARS = metrics_registry.histogram("rag_llm_prompt_chars", "Prompt size in characters.", ["agent"],
+                                              buckets=SIZE_BUCKETS)
+LLM_RESPONSE_CHARS = metrics_registry.histogram("rag_llm_response_chars", "Response size in characters.", ["agent"],
+                                                buckets=SIZE_BUCKETS)
+DB_STATEMENT_SECONDS = metrics_registry.histogram("rag_db_statement_seconds", "Execution and fetch time per statement.")
+DB_ROWS = metrics_registry.histogram("rag_db_rows_returned", "Rows produced per statement.", buckets=SIZE_BUCKETS)
+JSON_SECONDS = metrics_registry.histogram("rag_json_encode_seconds", "Time spent encoding /ask responses to JSON.")
+CACHE_LOOKUPS = metrics_registry.counter("rag_cache_lookups_total", "Cache lookups by cache and outcome.",
+                                         ["cache", "result"])
+SQL_VALIDATIONS = metrics_registry.counter("rag_sql_validations_total",
+                                           "Generated SQL by validation outcome (valid, repaired, invalid).",
+                                           ["outcome"])
+AGGREGATE_ROUTES = metrics_registry.counter("rag_aggregate_routes_total",
+                                            "Statements rewritten to a precomputed summary table.", ["table"])
+QUERY_GUARD_EVENTS = metrics_registry.counter("rag_query_guard_total",
+                                              "Statements stopped or limited by the cost guard, by outcome.",
+                                              ["outcome"])
+
+# Per-request breakdown, filled in by the stages and the helpers they call.
+current_trace: ContextVar[Optional[Dict[str, Any]]] = ContextVar("current_trace", default=None)
+
+def new_trace() -> Dict[str, Any]:
+    return {"llm": {}, "db": {"ms": 0.0, "statements": 0, "rows": 0, "cached": 0}, "json_ms": 0.0}
+
+def approx_tokens(text: str) -> int:
+    return (len(text) + 3) // 4
+
+def record_llm_call(agent: str, seconds: float, prompt: str, response: str):
+    LLM_SECONDS.observe(seconds, agent)
+    LLM_PROMPT_CHARS.observe(len(prompt), agent)
+    LLM_RESPONSE_CHARS.observe(len(response), agent)
+    trace = current_trace.get()
+    if trace is not None:
+        trace["llm"][agent] = {
+            "ms": round(seconds * 1000, 1),
+            "prompt_chars": len(prompt),
+            "response_chars": len(response),
+            "prompt_tokens_est": approx_tokens(prompt),
+            "response_tokens_est": approx_tokens(response),
+        }
 
 
 #Database connection 
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "8"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))  # seconds to wait for a free connection
+DB_POOL_HEALTH_CHECK = float(os.getenv("DB_POOL_HEALTH_CHECK", "30"))  # ping connections idle this long
+# SQLite access profile (see db_pool.SQLITE_PROFILES): default, readonly, immutable or replica
+SQLITE_PROFILE = os.getenv("SQLITE_PROFILE", "readonly").lower()
+SQLITE_MMAP_MB = int(os.getenv("SQLITE_MMAP_MB", "1024"))  # per file, shared through the OS page cache
+SQLITE_CACHE_MB = int(os.getenv("SQLITE_CACHE_MB", "0"))  # page cache per pooled connection; 0 = SQLite's
+SQLITE_TEMP_STORE = os.getenv("SQLITE_TEMP_STORE", "default").lower()  # default | file | memory
+
 def get_pg_connection():
     import psycopg2
     return psycopg2.connect(
@@ -74,7 +164,99 @@ def get_pg_connection():
     )
 
 def get_sqlite_connection():
-    return sqlite3.connect(DB_PATH)
+    # pooled connections stay on one thread but are closed from whichever thread prunes them
+    return connect_sqlite(DB_PATH, SQLITE_PROFILE, mmap_mb=SQLITE_MMAP_MB, cache_mb=SQLITE_CACHE_MB,
+                          temp_store=SQLITE_TEMP_STORE, check_same_thread=False)
+
+if DB_BACKEND == "postgres":
+    db_pool = PostgresPool(get_pg_connection, max_size=DB_POOL_SIZE,
+                           timeout=DB_POOL_TIMEOUT, health_check_interval=DB_POOL_HEALTH_CHECK)
+else:
+    # reopen connections when the file is replaced (a full pg_to_sqlite_export.py run)
+    db_pool = SQLitePool(get_sqlite_connection, max_size=DB_POOL_SIZE,
+                         timeout=DB_POOL_TIMEOUT, health_check_interval=DB_POOL_HEALTH_CHECK,
+                         generation=lambda: sqlite_file_id(DB_PATH))
+
+# Cross-process cache tier: with several uvicorn workers (see serve.py), generated SQL, query
+# results and paged results are shared through one SQLite file instead of living per process.
+# Use one file per database.
+SHARED_CACHE_PATH = os.getenv("SHARED_CACHE_PATH", "")  # empty = per-process caches only
+SHARED_CACHE_MAX_MB = float(os.getenv("SHARED_CACHE_MAX_MB", "256"))
+
+shared_cache = (SharedCache(SHARED_CACHE_PATH, max_bytes=int(SHARED_CACHE_MAX_MB * 1024 * 1024))
+                if SHARED_CACHE_PATH else None)
+
+# Query result cache
+RESULT_CACHE_ENABLED = os.getenv("RESULT_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+RESULT_CACHE_MAX_MB = float(os.getenv("RESULT_CACHE_MAX_MB", "64"))  # budget for all cached rows
+RESULT_CACHE_MAX_ENTRY_MB = float(os.getenv("RESULT_CACHE_MAX_ENTRY_MB", "8"))  # larger results are not cached
+# SQLite results are invalidated by file changes, so the TTL is only a backstop there;
+# Postgres relies on it unless table-level change tracking is switched on.
+RESULT_CACHE_TTL = float(os.getenv("RESULT_CACHE_TTL", "60" if DB_BACKEND == "postgres" else "3600"))
+RESULT_CACHE_PG_TRACK_TABLES = os.getenv("RESULT_CACHE_PG_TRACK_TABLES", "false").lower() in ("1", "true", "yes")
+
+result_cache = ResultCache(
+    max_bytes=int(RESULT_CACHE_MAX_MB * 1024 * 1024),
+    max_entry_bytes=int(RESULT_CACHE_MAX_ENTRY_MB * 1024 * 1024),
+    ttl=RESULT_CACHE_TTL,
+    shared=shared_cache,
+) if RESULT_CACHE_ENABLED else None
+
+def referenced_tables(stmt: str) -> list:
+    """Catalog tables whose names appear in the statement."""
+    words = set(re.findall(r'\w+', stmt.lower()))
+    return [t for t in get_schema_snapshot()["catalog"]["tables"] if t.lower() in words]
+
+# Result size limits
+RESULT_MAX_ROWS = int(os.getenv("RESULT_MAX_ROWS", "1000"))  # rows kept per statement
+RESULT_MAX_BYTES = int(os.getenv("RESULT_MAX_BYTES", str(1024 * 1024)))  # JSON bytes kept per statement
+RESULT_FETCH_BATCH = int(os.getenv("RESULT_FETCH_BATCH", "500"))
+RESULT_COUNT_LIMIT = int(os.getenv("RESULT_COUNT_LIMIT", "100000"))  # stop counting truncated results here
+SYNTH_MAX_ROWS = int(os.getenv("SYNTH_MAX_ROWS", "50"))  # larger results reach the synthesizer as a summary
+SYNTH_TOP_ROWS = int(os.getenv("SYNTH_TOP_ROWS", "10"))
+
+# Result previews and paging: responses carry the first rows, /results/{id} serves the rest
+RESULT_PREVIEW_ROWS = int(os.getenv("RESULT_PREVIEW_ROWS", "100"))  # 0 = send every kept row
+RESULT_PAGE_SIZE = int(os.getenv("RESULT_PAGE_SIZE", "500"))
+RESULT_PAGE_MAX = int(os.getenv("RESULT_PAGE_MAX", "5000"))
+RESULT_STORE_MAX_ENTRIES = int(os.getenv("RESULT_STORE_MAX_ENTRIES", "256"))
+RESULT_STORE_TTL = float(os.getenv("RESULT_STORE_TTL", "900"))  # seconds
+
+result_store = (ResultStore(RESULT_STORE_MAX_ENTRIES, RESULT_STORE_TTL, shared=shared_cache)
+                if RESULT_PREVIEW_ROWS > 0 else None)
+
+# Query cost guard
+QUERY_TIMEOUT_S = float(os.getenv("QUERY_TIMEOUT_S", "30"))  # per statement; 0 = no limit
+QUERY_MAX_COST = float(os.getenv("QUERY_MAX_COST", "0"))  # PG planner cost / SQLite est. rows visited; 0 = off
+QUERY_COST_ACTION = os.getenv("QUERY_COST_ACTION", "reject").lower()  # reject | limit
+
+cost_guard = CostGuard(DB_BACKEND, QUERY_MAX_COST, QUERY_COST_ACTION, RESULT_MAX_ROWS) if QUERY_MAX_COST > 0 else None
+
+# Summary tables built by aggregates.py; aggregate queries over sales are rewritten to current ones
+AGGREGATE_ROUTING = os.getenv("AGGREGATE_ROUTING", "true").lower() in ("1", "true", "yes")
+aggregate_router = AggregateRouter(DB_BACKEND) if AGGREGATE_ROUTING else None
+
+def stale_summary_message(tables: List[str]) -> str:
+    return (f"Summary table(s) {', '.join(tables)} are out of date with their source tables; "
+            f"query sales, employees, customers and projects directly.")
+
+# Executed statements, for index_advisor.py; empty = off
+WORKLOAD_LOG_PATH = os.getenv("WORKLOAD_LOG_PATH", "")
+workload_log = WorkloadLog(WORKLOAD_LOG_PATH) if WORKLOAD_LOG_PATH else None
+
+def execute_bounded(conn, stmt: str) -> Dict[str, Any]:
+    """Execute one statement and stream its rows through fetch_bounded()."""
+    if DB_BACKEND == "postgres":
+        # named cursor = server-side: rows stay on the server until fetched
+        cur = conn.cursor(name=f"rq_{uuid.uuid4().hex}")
+        cur.itersize = RESULT_FETCH_BATCH
+    else:
+        cur = conn.cursor()
+    try:
+        cur.execute(stmt)
+        return fetch_bounded(cur, RESULT_MAX_ROWS, RESULT_MAX_BYTES, RESULT_FETCH_BATCH, RESULT_COUNT_LIMIT)
+    finally:
+        cur.close()
 
 def run_query_statements(sql: str) -> Dict[str, Any]:
     """
@@ -88,49 +270,163 @@ def run_query_statements(sql: str) -> Dict[str, Any]:
     
     statements = [s.strip() for s in sql.split(";") if s.strip()]
     results = []
+    trace = current_trace.get()
     try:
-        if DB_BACKEND == "postgres":
-            conn = get_pg_connection()
-            cur = conn.cursor()
+        # resolved before checking out a connection: the catalog may need one itself
+        track_tables = {}
+        if result_cache is not None and DB_BACKEND == "postgres" and RESULT_CACHE_PG_TRACK_TABLES:
+            track_tables = {stmt: referenced_tables(stmt) for stmt in statements}
+
+        with db_pool.connection() as conn:
             for stmt in statements:
                 if not re.match(r'^\s*(SELECT|WITH)\b', stmt, flags=re.IGNORECASE):
                     results.append({"query": stmt, "error": "Only SELECT/WITH allowed for safety."})
                     continue
-                
-                cur.execute(stmt)
+                stale = stale_summaries(conn, DB_BACKEND, stmt)
+                if stale:
+                    results.append({"query": stmt, "error": stale_summary_message(stale),
+                                    "error_type": "stale_summary"})
+                    continue
+
+                if result_cache is not None:
+                    cache_key = normalize_sql(stmt)
+                    if DB_BACKEND == "postgres":
+                        data_version = pg_table_changes(conn, track_tables[stmt]) if track_tables else None
+                    else:
+                        data_version = sqlite_data_version(DB_PATH)
+                    cached = result_cache.get(cache_key, data_version)
+                    CACHE_LOOKUPS.inc("result", "hit" if cached is not None else "miss")
+                    if cached is not None:
+                        if trace is not None:
+                            trace["db"]["cached"] += 1
+                        results.append({"query": stmt, **cached, "cached": True})
+                        continue
+
+                routed = aggregate_router.rewrite(conn, stmt) if aggregate_router is not None else None
+                if routed is not None:
+                    AGGREGATE_ROUTES.inc(routed[1])
                 try:
-                    cols = [d[0] for d in cur.description] if cur.description else []
-                    rows = cur.fetchall()
-                except Exception:
-                    cols, rows = [], []
-                results.append({
-                    "query": stmt,
-                    "columns": convert_json_safe(cols),
-                    "rows": convert_json_safe(rows)
-                })
-            conn.close()
-        else:
-            conn = get_sqlite_connection()
-            cur = conn.cursor()
-            for stmt in statements:
-                if not re.match(r'^\s*(SELECT|WITH)\b', stmt, flags=re.IGNORECASE):
-                    results.append({"query": stmt, "error": "Only SELECT/WITH allowed for safety."})
+                    run_stmt = routed[0] if routed is not None else stmt
+                    run_stmt, guard = cost_guard.check(conn, run_stmt) if cost_guard is not None else (run_stmt, {})
+                    started = time.perf_counter()
+                    with statement_timeout(conn, DB_BACKEND, QUERY_TIMEOUT_S):
+                        fetched = execute_bounded(conn, run_stmt)
+                except QueryGuardError as e:
+                    QUERY_GUARD_EVENTS.inc(e.error_type)
+                    results.append({"query": stmt, **e.as_result()})
                     continue
-                cur.execute(stmt)
-                cols = [d[0] for d in cur.description] if cur.description else []
-                rows = cur.fetchall()
-                results.append({
-                    "query": stmt,
-                    "columns": convert_json_safe(cols),
-                    "rows": convert_json_safe(rows)
-                })
-            conn.close()
+                elapsed = time.perf_counter() - started
+                DB_STATEMENT_SECONDS.observe(elapsed)
+                DB_ROWS.observe(fetched["total_rows"])
+                if workload_log is not None:
+                    workload_log.record(run_stmt, DB_BACKEND, elapsed * 1000, fetched["total_rows"])
+                if trace is not None:
+                    trace["db"]["ms"] = round(trace["db"]["ms"] + elapsed * 1000, 1)
+                    trace["db"]["statements"] += 1
+                    trace["db"]["rows"] += fetched["total_rows"]
+                    trace["json_ms"] = round(trace["json_ms"] + fetched["encode_ms"], 1)
+                entry = statement_result(fetched)
+                if routed is not None:
+                    entry["aggregate_table"] = routed[1]
+                if "limit_added" in guard:
+                    QUERY_GUARD_EVENTS.inc("limit_added")
+                    entry["limit_added"] = guard["limit_added"]
+                if result_cache is not None:
+                    result_cache.put(cache_key, data_version, entry)
+                results.append({"query": stmt, **entry})
         return {"multi_results": results}
     except Exception as e:
         return {"error": f"SQL execution error: {str(e)}"}
 
+def validate_sql(sql: str) -> Optional[str]:
+    """
+    Compile every statement without running it (EXPLAIN on both backends).
+    Returns the first error message, or None when the SQL is valid.
+    """
+    statements = [s.strip() for s in sql.strip().split(";") if s.strip()]
+    if not statements:
+        return "Empty SQL after cleaning."
+    with db_pool.connection() as conn:
+        for stmt in statements:
+            if not re.match(r'^\s*(SELECT|WITH)\b', stmt, flags=re.IGNORECASE):
+                return "Only SELECT/WITH allowed for safety."
+            stale = stale_summaries(conn, DB_BACKEND, stmt)
+            if stale:
+                return stale_summary_message(stale)
+            cur = conn.cursor()
+            try:
+                cur.execute(f"EXPLAIN {stmt}")
+                cur.fetchall()
+            except Exception as e:
+                if DB_BACKEND == "postgres":
+                    conn.rollback()
+                return str(e).strip()
+            finally:
+                cur.close()
+    return None
+
+
+metrics_registry.gauge_callback(
+    "rag_db_pool", "Connection pool counters and wait times.",
+    lambda: {(k,): v for k, v in db_pool.stats().items() if isinstance(v, (int, float))}, ["stat"],
+)
+
+
+# Extracting Schema
+
+SCHEMA_CACHE_TTL = float(os.getenv("SCHEMA_CACHE_TTL", "300"))  # seconds before a forced rebuild
+SCHEMA_CHECK_INTERVAL = float(os.getenv("SCHEMA_CHECK_INTERVAL", "5"))  # seconds between version probes
+# Types, keys, row counts, date ranges and category values in the schema prompt
+SCHEMA_STATS = os.getenv("SCHEMA_STATS", "true").lower() in ("1", "true", "yes")
+SCHEMA_STATS_INTERVAL = float(os.getenv("SCHEMA_STATS_INTERVAL", "60"))  # seconds between incremental refreshes
+SCHEMA_STATS_SAMPLE_ROWS = int(os.getenv("SCHEMA_STATS_SAMPLE_ROWS", "10000"))
+SCHEMA_STATS_MAX_VALUES = int(os.getenv("SCHEMA_STATS_MAX_VALUES", "8"))  # more distinct values: not listed
+SCHEMA_PROMPT_TOKEN_BUDGET = int(os.getenv("SCHEMA_PROMPT_TOKEN_BUDGET", "1500"))  # 0 = unlimited
+
+schema_stats = SchemaStats(DB_BACKEND, sample_rows=SCHEMA_STATS_SAMPLE_ROWS,
+                           max_values=SCHEMA_STATS_MAX_VALUES) if SCHEMA_STATS else None
+
+def annotate_schema(catalog: Dict[str, Any], conn) -> Dict[str, Any]:
+    # summary tables behind sales are left out of the prompt until aggregates.py catches them up
+    return annotate_catalog(catalog, current_summaries(conn, DB_BACKEND))
 
-# Extracting Schema 
+schema_catalog = SchemaCatalog(
+    db_pool.connection, DB_BACKEND, ttl=SCHEMA_CACHE_TTL, check_interval=SCHEMA_CHECK_INTERVAL,
+    annotate=annotate_schema, extra_version=lambda conn: ",".join(current_summaries(conn, DB_BACKEND)),
+    stats=schema_stats, stats_interval=SCHEMA_STATS_INTERVAL,
+    token_budget=SCHEMA_PROMPT_TOKEN_BUDGET,
+)
+
+def get_schema_snapshot() -> Dict[str, Any]:
+    """
+    Cached schema: {'text', 'catalog', 'fingerprint', 'version'}.
+    Introspection only runs again when the schema version changes or the TTL expires;
+    the statistics in the text are refreshed every SCHEMA_STATS_INTERVAL seconds.
+    """
+    return schema_catalog.get()
+
+# Retrieval-based schema pruning
+SCHEMA_RETRIEVAL_MIN_TABLES = int(os.getenv("SCHEMA_RETRIEVAL_MIN_TABLES", "30"))  # smaller schemas go in whole
+SCHEMA_RETRIEVAL_TOP_K = int(os.getenv("SCHEMA_RETRIEVAL_TOP_K", "8"))
+SCHEMA_INDEX_SAMPLE_VALUES = os.getenv("SCHEMA_INDEX_SAMPLE_VALUES", "true").lower() in ("1", "true", "yes")
+
+schema_index = SchemaIndex(db_pool.connection, sample_values=SCHEMA_INDEX_SAMPLE_VALUES)
+
+def get_relevant_schema(question: str, snapshot: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Schema text for one question. Large schemas are cut down to the top-K tables
+    retrieved for the question plus their foreign-key neighbours; if nothing
+    matches, the full schema is used.
+    """
+    tables = snapshot.get("catalog", {}).get("tables", {})
+    if len(tables) < SCHEMA_RETRIEVAL_MIN_TABLES:
+        return {"text": snapshot["text"], "tables": None}
+    schema_index.refresh(snapshot)
+    selected = schema_index.retrieve(question, SCHEMA_RETRIEVAL_TOP_K)
+    if not selected:
+        return {"text": snapshot["text"], "tables": None}
+    subset = {**snapshot["catalog"], "tables": {t: tables[t] for t in selected}}
+    return {"text": schema_catalog.render(subset), "tables": selected}
 
 def get_schema_description() -> str:
     """
@@ -138,32 +434,7 @@ def get_schema_description() -> str:
     Works for both DB backends.
     """
     try:
-        if DB_BACKEND == "postgres":
-            conn = get_pg_connection()
-            cur = conn.cursor()
-            cur.execute("""
-                SELECT table_name FROM information_schema.tables
-                WHERE table_schema = 'public' AND table_type='BASE TABLE';
-            """)
-            tables = [r[0] for r in cur.fetchall()]
-            schema_lines = []
-            for t in tables:
-                cur.execute(f"SELECT column_name FROM information_schema.columns WHERE table_name = %s;", (t,))
-                cols = [r[0] for r in cur.fetchall()]
-                schema_lines.append(f"{t}({', '.join(cols)})")
-            conn.close()
-        else:
-            conn = get_sqlite_connection()
-            cur = conn.cursor()
-            cur.execute("SELECT name FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%';")
-            tables = [r[0] for r in cur.fetchall()]
-            schema_lines = []
-            for t in tables:
-                cur.execute(f"PRAGMA table_info({t});")
-                cols = [r[1] for r in cur.fetchall()]
-                schema_lines.append(f"{t}({', '.join(cols)})")
-            conn.close()
-        return "Tables:\n" + "\n".join(schema_lines)
+        return get_schema_snapshot()["text"]
     except Exception as e:
         return f"Schema unavailable: {str(e)}"
 
@@ -183,23 +454,103 @@ def clean_sql_from_llm(raw_sql: str) -> str:
     sql = re.sub(r'^(ite|lite|qlite|sqlite)\s*[:\-]*\s*', '', sql, flags=re.IGNORECASE)
     return sql
 
+def make_llm_provider() -> LLMProvider:
+    if LLM_PROVIDER == "fake":
+        corpus = load_corpus(FAKE_LLM_CORPUS) if os.path.exists(FAKE_LLM_CORPUS) else []
+        return FakeLLMProvider(corpus, latency=FAKE_LLM_LATENCY_MS / 1000, jitter=FAKE_LLM_JITTER_MS / 1000)
+    return GeminiProvider(genai, GEN_MODEL)
+
+llm_provider = make_llm_provider()
+
 def generate_with_model(prompt: str) -> str:
-    if genai is None:
-        return "LLM not configured. Set GEMINI_API_KEY in .env."
-    model = genai.GenerativeModel(GEN_MODEL)
-    resp = model.generate_content(prompt)
-    return resp.text if hasattr(resp, "text") else str(resp)
+    return llm_provider.generate(prompt)
+
+def stream_with_model(prompt: str):
+    return llm_provider.stream(prompt)
+
+
+# Off-loop execution
+# The Gemini SDK and both DB drivers are blocking, so the async pipeline hands them to
+# bounded thread pools; the pool sizes are the concurrency limits per worker process.
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+DB_MAX_CONCURRENCY = int(os.getenv("DB_MAX_CONCURRENCY", str(DB_POOL_SIZE)))
+
+llm_executor = ThreadPoolExecutor(max_workers=LLM_MAX_CONCURRENCY, thread_name_prefix="llm")
+db_executor = ThreadPoolExecutor(max_workers=DB_MAX_CONCURRENCY, thread_name_prefix="db")
+
+# run_in_executor does not carry context variables over, so the request trace is passed explicitly
+async def run_in_llm_pool(fn, *args):
+    ctx = contextvars.copy_context()
+    return await asyncio.get_running_loop().run_in_executor(llm_executor, ctx.run, fn, *args)
+
+async def run_in_db_pool(fn, *args):
+    ctx = contextvars.copy_context()
+    return await asyncio.get_running_loop().run_in_executor(db_executor, ctx.run, fn, *args)
+
+async def generate_with_model_async(prompt: str, agent: str = "llm") -> str:
+    started = time.perf_counter()
+    response = await run_in_llm_pool(generate_with_model, prompt)
+    record_llm_call(agent, time.perf_counter() - started, prompt, response)
+    return response
+
+async def stream_with_model_async(prompt: str, agent: str = "llm"):
+    """Yield text chunks as the model produces them; each blocking read runs in the LLM pool."""
+    started = time.perf_counter()
+    parts = []
+    chunks = await run_in_llm_pool(lambda: iter(stream_with_model(prompt)))
+    done = object()
+    while True:
+        chunk = await run_in_llm_pool(next, chunks, done)
+        if chunk is done:
+            break
+        parts.append(chunk)
+        yield chunk
+    record_llm_call(agent, time.perf_counter() - started, prompt, "".join(parts))
 
 
 # Pipeline
 
 def process_question(question: str) -> Dict[str, Any]:
-    if not question or not question.strip():
-        return {"error": "Empty question."}
-    schema_description = get_schema_description()
-
-    # Schema Agent prompt
-    schema_prompt = f"""
+    """Blocking entry point for scripts; must not be called from a running event loop."""
+    return asyncio.run(process_question_async(question))
+
+# Question -> SQL cache
+SQL_CACHE_ENABLED = os.getenv("SQL_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+SQL_CACHE_MAX_ENTRIES = int(os.getenv("SQL_CACHE_MAX_ENTRIES", "1000"))
+SQL_CACHE_TTL = float(os.getenv("SQL_CACHE_TTL", "86400"))  # seconds
+SQL_CACHE_PATH = os.getenv("SQL_CACHE_PATH", "")  # SQLite file to persist entries; empty = memory only
+
+sql_cache = (SQLCache(SQL_CACHE_MAX_ENTRIES, SQL_CACHE_TTL, SQL_CACHE_PATH, shared=shared_cache)
+             if SQL_CACHE_ENABLED else None)
+
+def query_succeeded(run_result: Dict[str, Any]) -> bool:
+    if not run_result or "error" in run_result:
+        return False
+    return all("error" not in r for r in run_result.get("multi_results", []))
+
+# Few-shot example store of executed question/SQL pairs
+EXAMPLE_STORE_ENABLED = os.getenv("EXAMPLE_STORE_ENABLED", "true").lower() in ("1", "true", "yes")
+EXAMPLE_STORE_PATH = os.getenv("EXAMPLE_STORE_PATH", "example_store.db")  # empty = memory only
+EXAMPLE_STORE_MAX_ENTRIES = int(os.getenv("EXAMPLE_STORE_MAX_ENTRIES", "5000"))
+EXAMPLE_STORE_MAX_AGE_DAYS = float(os.getenv("EXAMPLE_STORE_MAX_AGE_DAYS", "90"))  # since last use
+FEW_SHOT_EXAMPLES = int(os.getenv("FEW_SHOT_EXAMPLES", "3"))  # similar pairs shown to the SQL Generator
+EXAMPLE_EXACT_MATCH = os.getenv("EXAMPLE_EXACT_MATCH", "true").lower() in ("1", "true", "yes")
+
+# with SHARED_CACHE_PATH set, the examples live in the shared cache file instead of EXAMPLE_STORE_PATH
+example_store = (ExampleStore(EXAMPLE_STORE_PATH, EXAMPLE_STORE_MAX_ENTRIES, EXAMPLE_STORE_MAX_AGE_DAYS * 86400,
+                              shared=shared_cache)
+                 if EXAMPLE_STORE_ENABLED else None)
+
+def tables_summary(sql_query: str, catalog: Dict[str, Any]) -> str:
+    """Schema Agent-style table list for SQL reused without calling the agent."""
+    words = set(re.findall(r'\w+', sql_query.lower()))
+    tables = [t for t in catalog.get("tables", {}) if t.lower() in words]
+    return "Relevant Tables:\n" + "\n".join(f" - {t}" for t in tables)
+
+SCHEMA_PRUNE_SQL_PROMPT = os.getenv("SCHEMA_PRUNE_SQL_PROMPT", "false").lower() in ("1", "true", "yes")
+
+def build_schema_prompt(schema_description: str, question: str) -> str:
+    return f"""
 You are the Schema Agent.
 Your job is to identify the relevant tables and columns needed for the user's question.
 You MUST ALWAYS respond using EXACTLY this structured format:
@@ -224,19 +575,22 @@ Question:
 
 Return a concise plain-text answer listing relevant tables and fields.
 """
-    try:
-        schema_output = generate_with_model(schema_prompt)
-    except Exception as e:
-        schema_output = f"Schema agent error: {str(e)}"
 
+def build_sql_prompt(schema_description: str, question: str, examples: Optional[List[Dict[str, Any]]] = None) -> str:
     # SQL generator prompt: ask for PostgreSQL SQL when DB_BACKEND==postgres else request SQLite-compatible SQL.
     dialect_hint = "PostgreSQL" if DB_BACKEND == "postgres" else "SQLite"
     extra_hint = """
 Use only SELECT or WITH queries (no DROP/DELETE/INSERT/UPDATE). Use correct date functions for {dialect}.
 Return only the SQL query or queries needed with no surrounding explanation.
 """.replace("{dialect}", dialect_hint)
+    if examples:
+        shots = "\n\n".join(f"Example question: {e['question']}\nSQL: {e['sql_query']}" for e in examples)
+        extra_hint += f"""
+Previously answered questions that ran successfully on this database, for reference:
+{shots}
+"""
 
-    sql_prompt = f"""
+    return f"""
 You are SQL Generator Agent.
 Convert this natural language question into a valid {dialect_hint} SQL query using the schema below.
 {extra_hint}
@@ -246,26 +600,66 @@ Schema:
 Question:
 {question}
 """
-    try:
-        raw_sql = generate_with_model(sql_prompt)
-        sql_query = clean_sql_from_llm(raw_sql)
-    except Exception as e:
-        raw_sql = ""
-        sql_query = ""
-        sql_error = f"Error generating SQL: {str(e)}"
 
-    if not sql_query:
-        return {
-            "schema_agent_output": schema_output,
-            "sql_query": sql_query,
-            "query_result": {"error": "SQL generation returned empty result.", "raw_sql": raw_sql},
-            "final_answer": "I couldn't generate a SQL query for that question. Try rephrasing."
-        }
+def build_repair_prompt(sql_query: str, error: str, schema_description: str) -> str:
+    dialect_hint = "PostgreSQL" if DB_BACKEND == "postgres" else "SQLite"
+    return f"""
+You are the SQL Repair Agent.
+This {dialect_hint} SQL failed validation. Fix it and return only the corrected SQL.
+Use only SELECT or WITH queries.
+
+Error:
+{error}
+
+SQL:
+{sql_query}
+
+{schema_description}
+"""
 
-    run_result = run_query_statements(sql_query)
+# Pre-execution validation and repair of generated SQL
+SQL_VALIDATE = os.getenv("SQL_VALIDATE", "true").lower() in ("1", "true", "yes")
+SQL_REPAIR_MAX_ATTEMPTS = int(os.getenv("SQL_REPAIR_MAX_ATTEMPTS", "2"))
+SQL_REPAIR_TIME_BUDGET_S = float(os.getenv("SQL_REPAIR_TIME_BUDGET_S", "20"))  # LLM time across repair attempts
 
-    # synthesizer agent prompt
-    synth_prompt = f"""
+async def validate_and_repair(sql_query: str, schema_description: str):
+    """
+    Validate generated SQL before it runs and, while it fails, send the error and
+    the SQL back to the LLM for a fix, up to SQL_REPAIR_MAX_ATTEMPTS times and
+    SQL_REPAIR_TIME_BUDGET_S seconds of LLM time.
+    Returns (sql_query, {'valid', 'attempts', 'errors', 'llm_ms'}).
+    """
+    report = {"valid": True, "attempts": 0, "errors": [], "llm_ms": 0.0}
+    if not SQL_VALIDATE or not sql_query:
+        return sql_query, report
+    error = await run_in_db_pool(validate_sql, sql_query)
+    while error is not None:
+        report["errors"].append(error)
+        remaining = SQL_REPAIR_TIME_BUDGET_S - report["llm_ms"] / 1000
+        if report["attempts"] >= SQL_REPAIR_MAX_ATTEMPTS or remaining <= 0:
+            report["valid"] = False
+            break
+        report["attempts"] += 1
+        # only the schema lines of tables the SQL mentions (all of them if it names none)
+        tables = re.findall(r'\w+', sql_query.lower())
+        prompt = build_repair_prompt(sql_query, error, prune_schema_description(schema_description, tables))
+        started = time.perf_counter()
+        try:
+            raw_sql = await asyncio.wait_for(generate_with_model_async(prompt, agent="sql_repair"), remaining)
+        except Exception as e:
+            report["errors"].append("Repair timed out." if isinstance(e, asyncio.TimeoutError)
+                                    else f"Repair failed: {str(e)}")
+            report["valid"] = False
+            break
+        finally:
+            report["llm_ms"] = round(report["llm_ms"] + (time.perf_counter() - started) * 1000, 1)
+        sql_query = clean_sql_from_llm(raw_sql)
+        error = await run_in_db_pool(validate_sql, sql_query)
+    SQL_VALIDATIONS.inc("invalid" if not report["valid"] else "repaired" if report["attempts"] else "valid")
+    return sql_query, report
+
+def build_synth_prompt(question: str, sql_query: str, run_result: Dict[str, Any]) -> str:
+    return f"""
         You are the Synthesizer Agent.
         Your job: Convert SQL results into a clear, short natural-language answer.
 
@@ -274,6 +668,12 @@ Question:
         2. If rows exist → summarize them briefly, correctly, and factually.
         3. DO NOT invent or hallucinate numbers.
         4. Write in maximum 4 lines if possible also the output formatting should be professional.
+        5. Large results arrive as a summary (total_rows, numeric_stats, first rows). Use those
+           figures and mention when a result was truncated.
+        6. An error_type of 'timeout' or 'cost_limit' means the query was stopped for being too
+           expensive; suggest narrowing it (a date range, a filter, fewer rows). A 'limit_added'
+           field means only the first rows were fetched. 'stale_summary' means the query read a
+           precomputed table that is behind the live data; say so and suggest asking again.
 
         User question: {question}
 
@@ -281,22 +681,349 @@ Question:
         {sql_query}
 
         The SQL execution result was:
-        {json.dumps(convert_json_safe(run_result))}
+        {dumps_text(compact_result_for_prompt(run_result, SYNTH_MAX_ROWS, SYNTH_TOP_ROWS))}
 
         If the SQL execution result contains an 'error', explain why and give a helpful suggestion
         (e.g., column/table not found, check field names, or adjust the question). Otherwise,
         return a brief natural language answer summarizing the results. Do not fabricate numbers.
         """
+
+def parse_relevant_tables(schema_output: str) -> list:
+    """Table names listed under 'Relevant Tables:' in the Schema Agent's answer."""
+    m = re.search(r'Relevant Tables:\s*(.*?)(?:\n\s*\n|Relevant Columns:|$)', schema_output or "",
+                  flags=re.DOTALL | re.IGNORECASE)
+    if not m:
+        return []
+    return [t.strip().strip('`*').lower() for t in re.findall(r'^\s*-\s*(\S+)', m.group(1), flags=re.MULTILINE)]
+
+def prune_schema_description(schema_description: str, tables: list) -> str:
+    """Keep only the schema lines for `tables`; fall back to the full text if none match."""
+    wanted = set(tables)
+    lines = schema_description.splitlines()
+    kept = [l for l in lines[1:] if l.split("(", 1)[0].strip().lower() in wanted]
+    if not kept:
+        return schema_description
+    return "\n".join([lines[0]] + kept)
+
+async def process_question_async(question: str, include_timings: bool = False,
+                                 batch: Optional["BatchContext"] = None) -> Dict[str, Any]:
+    response: Dict[str, Any] = {}
+    async for event, data in iter_question_events(question, include_timings=include_timings, batch=batch):
+        if event == "done":
+            response = data
+    return response
+
+# Stage results surfaced to streaming clients, as (event name, payload builder)
+STAGE_EVENTS = {
+    "schema_agent": ("schema_agent", lambda r: {"schema_agent_output": r.strip()}),
+    "sql_generator": ("sql", lambda r: {"sql_query": r["sql_query"].strip()}),
+    "executor": ("execution", lambda r: {"query_result": preview(r, RESULT_PREVIEW_ROWS)} if r is not None else None),
+}
+
+async def iter_question_events(question: str, stream_answer: bool = False, include_timings: bool = False,
+                               batch: Optional["BatchContext"] = None):
+    """
+    Run the pipeline and yield (event, data) pairs as stages finish: 'schema_agent',
+    'sql', 'execution', then 'answer_token' chunks when `stream_answer` is set, and
+    finally 'done' carrying the same response /ask returns (plus a 'timings'
+    breakdown when `include_timings` is set). Within a batch, the schema snapshot and
+    executions of identical SQL are shared through `batch`.
+    """
+    if not question or not question.strip():
+        yield "done", {"error": "Empty question."}
+        return
+
+    queue: asyncio.Queue = asyncio.Queue()
+
+    async def on_stage_done(name, result):
+        if name in STAGE_EVENTS:
+            event, payload = STAGE_EVENTS[name]
+            data = payload(result)
+            if data is not None:
+                await queue.put((event, data))
+
+    # Stages only wait on real data dependencies: the Schema Agent and SQL Generator both
+    # need just the schema text, so they run concurrently unless SCHEMA_PRUNE_SQL_PROMPT
+    # asks for the Schema Agent's table list to narrow the SQL prompt. A SQL cache hit
+    # answers both agents without calling the LLM.
+    async def introspect_stage(results):
+        if batch is not None and batch.schema_snapshot is not None:
+            return batch.schema_snapshot
+        try:
+            return await run_in_db_pool(get_schema_snapshot)
+        except Exception as e:
+            return {"text": f"Schema unavailable: {str(e)}", "fingerprint": None}
+
+    async def retrieval_stage(results):
+        if results["schema"]["fingerprint"] is None:
+            return results["schema"]
+        return await run_in_db_pool(get_relevant_schema, question, results["schema"])
+
+    async def cache_stage(results):
+        fingerprint = results["schema"]["fingerprint"]
+        if sql_cache is None or fingerprint is None:
+            return None
+        cached = await run_in_db_pool(sql_cache.get, question, fingerprint, DB_BACKEND)
+        CACHE_LOOKUPS.inc("sql", "hit" if cached is not None else "miss")
+        return cached
+
+    async def examples_stage(results):
+        if example_store is None or results["sql_cache"] is not None:
+            return None
+        found = await run_in_db_pool(example_store.lookup, question, DB_BACKEND, results["schema"]["fingerprint"],
+                                     FEW_SHOT_EXAMPLES, EXAMPLE_EXACT_MATCH)
+        CACHE_LOOKUPS.inc("examples", "exact" if found["exact"] else "similar" if found["similar"] else "miss")
+        return found
+
+    def exact_example(results):
+        return results["examples"]["exact"] if results["examples"] else None
+
+    async def schema_agent_stage(results):
+        if results["sql_cache"] is not None:
+            return results["sql_cache"]["schema_agent_output"]
+        if exact_example(results):
+            return tables_summary(exact_example(results)["sql_query"], results["schema"].get("catalog", {}))
+        try:
+            return await generate_with_model_async(build_schema_prompt(results["schema_retrieval"]["text"], question),
+                                                   agent="schema_agent")
+        except Exception as e:
+            return f"Schema agent error: {str(e)}"
+
+    async def sql_generator_stage(results):
+        if results["sql_cache"] is not None:
+            return {"raw_sql": "", "sql_query": results["sql_cache"]["sql_query"]}
+        if exact_example(results):
+            return {"raw_sql": "", "sql_query": exact_example(results)["sql_query"]}
+        schema_description = results["schema_retrieval"]["text"]
+        if SCHEMA_PRUNE_SQL_PROMPT:
+            schema_description = prune_schema_description(
+                schema_description, parse_relevant_tables(results["schema_agent"])
+            )
+        try:
+            examples = results["examples"]["similar"] if results["examples"] else None
+            raw_sql = await generate_with_model_async(build_sql_prompt(schema_description, question, examples),
+                                                      agent="sql_generator")
+            sql_query, validation = await validate_and_repair(clean_sql_from_llm(raw_sql), schema_description)
+            return {"raw_sql": raw_sql, "sql_query": sql_query, "validation": validation}
+        except Exception as e:
+            return {"raw_sql": "", "sql_query": "", "error": f"Error generating SQL: {str(e)}"}
+
+    async def executor_stage(results):
+        sql_query = results["sql_generator"]["sql_query"]
+        if not sql_query:
+            return None
+        validation = results["sql_generator"].get("validation")
+        if validation and not validation["valid"]:
+            return {"error": f"SQL validation failed: {validation['errors'][-1]}", "validation_failed": True}
+        exec_started = time.perf_counter()
+        if batch is not None:
+            run_result = await batch.run_sql(sql_query)
+        else:
+            run_result = await run_in_db_pool(run_query_statements, sql_query)
+        fingerprint = results["schema"]["fingerprint"]
+        if example_store is not None and fingerprint is not None:
+            try:
+                await run_in_db_pool(example_store.record, question, DB_BACKEND, fingerprint, sql_query,
+                                     query_succeeded(run_result), (time.perf_counter() - exec_started) * 1000)
+            except Exception as e:  # the query already ran; losing one example must not fail the request
+                logger.warning("example store record failed: %s", e)
+        if (sql_cache is not None and fingerprint is not None and results["sql_cache"] is None
+                and query_succeeded(run_result)):
+            try:
+                await run_in_db_pool(sql_cache.put, question, fingerprint, DB_BACKEND,
+                                     results["schema_agent"], sql_query)
+            except Exception:  # a cache write (locked file, full disk) must not fail an answered request
+                logger.exception("sql cache put failed")
+        if result_store is not None and needs_paging(run_result, RESULT_PREVIEW_ROWS):
+            # the full rows stay here for paging; clients get preview() of them
+            run_result = {**run_result, "result_id": result_store.put(run_result)}
+        return run_result
+
+    async def synthesizer_stage(results):
+        run_result = results["executor"]
+        if run_result is None:
+            return "I couldn't generate a SQL query for that question. Try rephrasing."
+        if run_result.get("validation_failed"):
+            # no LLM call needed to explain SQL that never ran
+            attempts = results["sql_generator"]["validation"]["attempts"]
+            return (f"I couldn't produce a valid SQL query for that question ({attempts} repair attempt(s)). "
+                    f"{run_result['error']}. Try rephrasing or naming the tables and columns you mean.")
+        synth_prompt = build_synth_prompt(question, results["sql_generator"]["sql_query"], run_result)
+        if not stream_answer:
+            try:
+                return await generate_with_model_async(synth_prompt, agent="synthesizer")
+            except Exception as e:
+                return f"Synthesizer error: {str(e)}"
+        parts = []
+        try:
+            async for chunk in stream_with_model_async(synth_prompt, agent="synthesizer"):
+                parts.append(chunk)
+                await queue.put(("answer_token", {"text": chunk}))
+        except Exception as e:
+            parts.append(f"Synthesizer error: {str(e)}")
+        return "".join(parts)
+
+    sql_deps = ["sql_cache", "examples", "schema_retrieval"] + (["schema_agent"] if SCHEMA_PRUNE_SQL_PROMPT else [])
+    finished = object()
+
+    trace = new_trace()
+    started = time.perf_counter()
+
+    async def run_pipeline():
+        current_trace.set(trace)  # the task runs in its own copy of the context
+        try:
+            return await run_stages([
+                Stage("schema", introspect_stage),
+                Stage("sql_cache", cache_stage, deps=["schema"]),
+                Stage("schema_retrieval", retrieval_stage, deps=["schema"]),
+                Stage("examples", examples_stage, deps=["sql_cache"]),
+                Stage("schema_agent", schema_agent_stage, deps=["sql_cache", "examples", "schema_retrieval"]),
+                Stage("sql_generator", sql_generator_stage, deps=sql_deps),
+                Stage("executor", executor_stage, deps=["sql_generator"]),
+                Stage("synthesizer", synthesizer_stage, deps=["executor"]),
+            ], on_done=on_stage_done)
+        finally:
+            await queue.put(finished)
+
+    task = asyncio.ensure_future(run_pipeline())
     try:
-        final_answer = generate_with_model(synth_prompt)
-    except Exception as e:
-        final_answer = f"Synthesizer error: {str(e)}"
+        while True:
+            item = await queue.get()
+            if item is finished:
+                break
+            yield item
+        results, timings = await task
+    finally:
+        # the consumer went away (e.g. the client disconnected) before the pipeline ended
+        if not task.done():
+            task.cancel()
+
+    response = build_response(results, timings, trace)
+    total = time.perf_counter() - started
+    REQUEST_SECONDS.observe(total)
+    for name, t in timings.items():
+        STAGE_SECONDS.observe(t["duration_ms"] / 1000, name)
+    breakdown = {
+        "total_ms": round(total * 1000, 1),
+        "stages_ms": {name: t["duration_ms"] for name, t in timings.items()},
+        **trace,
+    }
+    if SLOW_REQUEST_MS and breakdown["total_ms"] >= SLOW_REQUEST_MS:
+        logger.warning("slow request (%.0f ms): %s", breakdown["total_ms"],
+                       json.dumps({"question": question, "timings": breakdown}))
+    if include_timings:
+        response["timings"] = breakdown
+    yield "done", response
+
+def build_response(results: Dict[str, Any], timings: Dict[str, Any], trace: Dict[str, Any]) -> Dict[str, Any]:
+    schema_output = results["schema_agent"]
+    sql_query = results["sql_generator"]["sql_query"]
+    run_result = results["executor"]
+    path = critical_path(timings)
+    exact_hit = bool(results["examples"] and results["examples"]["exact"])
+    stage_report = {
+        "stages": timings,
+        "critical_path": path,
+        "critical_path_ms": round(sum(timings[n]["duration_ms"] for n in path), 1),
+        "sql_validation": results["sql_generator"].get("validation"),
+        "cache": {
+            "sql": "hit" if results["sql_cache"] is not None else "miss",
+            "examples": ("exact" if exact_hit else "similar" if results["examples"] and results["examples"]["similar"]
+                         else "miss"),
+        },
+    }
+
+    if not sql_query:
+        return {
+            "schema_agent_output": schema_output,
+            "sql_query": sql_query,
+            "query_result": {"error": "SQL generation returned empty result.",
+                             "raw_sql": results["sql_generator"]["raw_sql"]},
+            "final_answer": results["synthesizer"],
+            **stage_report,
+        }
 
+    # rows were made JSON-native once, at fetch time; the response class encodes them
     return {
         "schema_agent_output": schema_output.strip(),
         "sql_query": sql_query.strip(),
-        "query_result": json.loads(json.dumps(convert_json_safe(run_result))),
-        "final_answer": final_answer.strip()
+        "query_result": preview(run_result, RESULT_PREVIEW_ROWS),
+        "final_answer": results["synthesizer"].strip(),
+        **stage_report,
+    }
+
+
+# Batches
+
+BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", "8"))
+BATCH_MAX_QUESTIONS = int(os.getenv("BATCH_MAX_QUESTIONS", "1000"))
+
+class BatchContext:
+    """State shared by the questions of one batch: a single schema snapshot and one execution per distinct SQL."""
+
+    def __init__(self, schema_snapshot: Optional[Dict[str, Any]]):
+        self.schema_snapshot = schema_snapshot
+        self._sql_runs: Dict[str, asyncio.Future] = {}
+        self.sql_executions = 0
+        self.sql_shared = 0
+
+    async def run_sql(self, sql_query: str) -> Dict[str, Any]:
+        key = normalize_sql(sql_query)
+        task = self._sql_runs.get(key)
+        if task is None:
+            task = asyncio.ensure_future(run_in_db_pool(run_query_statements, sql_query))
+            self._sql_runs[key] = task
+            self.sql_executions += 1
+        else:
+            self.sql_shared += 1
+        # shield: one caller being cancelled must not cancel the run the others wait on
+        return await asyncio.shield(task)
+
+async def iter_batch_results(questions: list, concurrency: int, batch: BatchContext):
+    """
+    Answer every question with at most `concurrency` pipelines in flight and yield
+    (index, response, duplicate_of) as each finishes. Questions that normalize to the
+    same text run once; later copies are reported with the index of the first.
+    """
+    groups: Dict[Any, list] = {}
+    for i, q in enumerate(questions):
+        template, numbers = normalize_question(q or "")
+        groups.setdefault((template, tuple(numbers)), []).append(i)
+
+    sem = asyncio.Semaphore(max(1, concurrency))
+    queue: asyncio.Queue = asyncio.Queue()
+
+    async def run_group(indices):
+        async with sem:
+            try:
+                resp = await process_question_async(questions[indices[0]], batch=batch)
+            except Exception as e:
+                resp = {"error": f"Pipeline error: {str(e)}"}
+        for n, i in enumerate(indices):
+            await queue.put((i, resp, indices[0] if n else None))
+
+    tasks = [asyncio.ensure_future(run_group(indices)) for indices in groups.values()]
+    try:
+        for _ in range(len(questions)):
+            yield await queue.get()
+    finally:
+        for t in tasks:
+            t.cancel()
+
+async def start_batch(questions: list) -> BatchContext:
+    try:
+        snapshot = await run_in_db_pool(get_schema_snapshot)
+    except Exception:
+        snapshot = None  # every question reports the introspection error itself
+    return BatchContext(snapshot)
+
+def batch_stats(batch: BatchContext, questions: list, started: float) -> Dict[str, Any]:
+    return {
+        "questions": len(questions),
+        "unique_questions": len({tuple(map(str, normalize_question(q or ""))) for q in questions}),
+        "sql_executions": batch.sql_executions,
+        "sql_shared": batch.sql_shared,
+        "elapsed_ms": round((time.perf_counter() - started) * 1000, 1),
     }
 
 
@@ -305,9 +1032,103 @@ Question:
 class QueryRequest(BaseModel):
     question: str
 
+def check_format(fmt: str):
+    if fmt not in FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of {', '.join(FORMATS)}.")
+    if fmt == "arrow" and pyarrow is None:
+        raise HTTPException(status_code=400, detail="format=arrow needs pyarrow installed on the server.")
+
 @app.post("/ask")
-async def ask_api(req: QueryRequest):
-    return process_question(req.question)
+async def ask_api(req: QueryRequest, timings: bool = ASK_INCLUDE_TIMINGS, fmt: str = Query("rows", alias="format")):
+    check_format(fmt)
+    response = await process_question_async(req.question, include_timings=timings)
+    if "query_result" in response:
+        response["query_result"] = encode_result(response["query_result"], fmt)
+    # returned as a Response so FastAPI skips its jsonable_encoder walk over the rows
+    return FastJSONResponse(response)
+
+@app.get("/results/{result_id}")
+async def results_api(result_id: str, statement: int = 0, offset: int = 0, limit: int = RESULT_PAGE_SIZE,
+                      fmt: str = Query("rows", alias="format")):
+    check_format(fmt)
+    run_result = result_store.get(result_id) if result_store is not None else None
+    if run_result is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired result id.")
+    statements = run_result.get("multi_results", [])
+    if not 0 <= statement < len(statements):
+        raise HTTPException(status_code=404, detail=f"Result has {len(statements)} statement(s).")
+    if offset < 0 or limit < 1:
+        raise HTTPException(status_code=400, detail="offset must be >= 0 and limit >= 1.")
+    chunk = page(statements[statement], offset, min(limit, RESULT_PAGE_MAX))
+    return FastJSONResponse({"result_id": result_id, "statement": statement, **encode_statement(chunk, fmt)})
+
+async def sse_events(question: str):
+    async for event, data in iter_question_events(question, stream_answer=True):
+        yield f"event: {event}\ndata: {dumps_text(data)}\n\n"
+
+@app.post("/ask/stream")
+async def ask_stream_api(req: QueryRequest):
+    return StreamingResponse(sse_events(req.question), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.get("/ask/stream")
+async def ask_stream_get_api(question: str):
+    # GET variant for browser EventSource clients, which cannot send a body
+    return StreamingResponse(sse_events(question), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+class BatchRequest(BaseModel):
+    questions: List[str]
+    concurrency: Optional[int] = None
+    stream: bool = False
+
+@app.post("/ask_batch")
+async def ask_batch_api(req: BatchRequest):
+    if len(req.questions) > BATCH_MAX_QUESTIONS:
+        raise HTTPException(status_code=413, detail=f"At most {BATCH_MAX_QUESTIONS} questions per batch.")
+    concurrency = min(req.concurrency or BATCH_MAX_CONCURRENCY, BATCH_MAX_CONCURRENCY)
+    started = time.perf_counter()
+    batch = await start_batch(req.questions)
+
+    if req.stream:
+        async def ndjson():
+            async for i, resp, duplicate_of in iter_batch_results(req.questions, concurrency, batch):
+                line = {"index": i, "question": req.questions[i], "response": resp}
+                if duplicate_of is not None:
+                    line["duplicate_of"] = duplicate_of
+                yield dumps_text(line) + "\n"
+            yield dumps_text({"stats": batch_stats(batch, req.questions, started)}) + "\n"
+        return StreamingResponse(ndjson(), media_type="application/x-ndjson")
+
+    results: list = [None] * len(req.questions)
+    async for i, resp, _ in iter_batch_results(req.questions, concurrency, batch):
+        results[i] = resp
+    return FastJSONResponse({"results": results, "stats": batch_stats(batch, req.questions, started)})
+
+@app.get("/schema")
+async def schema_api():
+    snap = await run_in_db_pool(get_schema_snapshot)
+    stats = {t: {k: st[k] for k in ("rows", "ranges", "values")}
+             for t, st in (schema_stats.tables.items() if schema_stats is not None else ())}
+    return {"fingerprint": snap["fingerprint"], "version": snap["version"], **snap["catalog"], "stats": stats}
+
+@app.get("/health/db")
+async def db_health_api():
+    return {**db_pool.stats(), "workload_log": workload_log.stats() if workload_log is not None else None}
+
+@app.get("/cache/stats")
+async def cache_stats_api():
+    return {
+        "sql": sql_cache.stats() if sql_cache is not None else None,
+        "results": result_cache.stats() if result_cache is not None else None,
+        "examples": example_store.stats() if example_store is not None else None,
+        "result_store": result_store.stats() if result_store is not None else None,
+        "shared": shared_cache.stats() if shared_cache is not None else None,
+    }
+
+@app.get("/metrics")
+async def metrics_api():
+    return PlainTextResponse(metrics_registry.render(), media_type="text/plain; version=0.0.4")
 
 @app.get("/")
 async def root():
@@ -393,26 +1214,41 @@ def build_gradio_ui():
                 final_card = gr.HTML(card_body_start + "" + card_body_end)
 
         # Logic
-        def ui_ask(question):
+        async def ui_ask(question):
             if not question.strip():
-                return (
+                yield (
                     "<p>Please enter a question.</p>",
                     "",
                     {},
                     "<p>Please enter a question.</p>"
                 )
-
-            resp = process_question(question)
-
-            schema_html = card_body_start + resp["schema_agent_output"] + card_body_end
-            final_html = card_body_start + resp["final_answer"] + card_body_end
-
-            return (
-                schema_html,
-                resp["sql_query"],
-                resp["query_result"],
-                final_html
-            )
+                return
+
+            # each card is filled in as soon as its stage finishes
+            schema_html = card_body_start + "" + card_body_end
+            sql_text, query_result, answer = "", {}, ""
+            async for event, data in iter_question_events(question, stream_answer=True):
+                if event == "schema_agent":
+                    schema_html = card_body_start + data["schema_agent_output"] + card_body_end
+                elif event == "sql":
+                    sql_text = data["sql_query"]
+                elif event == "execution":
+                    query_result = data["query_result"]
+                elif event == "answer_token":
+                    answer += data["text"]
+                elif event == "done":
+                    if "error" in data and "final_answer" not in data:
+                        answer = data["error"]
+                    else:
+                        schema_html = card_body_start + data["schema_agent_output"] + card_body_end
+                        sql_text, query_result = data["sql_query"], data["query_result"]
+                        answer = data["final_answer"]
+                yield (
+                    schema_html,
+                    sql_text,
+                    query_result,
+                    card_body_start + answer + card_body_end
+                )
 
         submit.click(
             fn=ui_ask,
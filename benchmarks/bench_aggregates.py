@@ -0,0 +1,89 @@
+"""
+Summary tables vs. scanning sales: build, incremental refresh and query latency.
+
+Builds (or reuses) the summary tables in a SQLite database, times an incremental
+refresh over --new-sales freshly inserted sales (rolled back afterwards), then
+runs every corpus query that the router rewrites, both as written and rewritten,
+checking that the results match.
+
+    python db_setup.py --scale 10000 --db /tmp/big.db --anchor-date 2025-01-01
+    python -m benchmarks.bench_aggregates --db /tmp/big.db
+
+The database gets the summary tables added (once, unless --rebuild).
+"""
+import json
+import time
+import sqlite3
+import argparse
+
+from aggregates import SALES_AGGREGATES, fresh_aggregates, refresh, rewrite_sql
+from benchmarks.bench_pipeline import DEFAULT_CORPUS, percentile
+
+
+def timed(conn, sql: str, repeat: int):
+    times, rows = [], None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        rows = conn.execute(sql).fetchall()
+        times.append((time.perf_counter() - start) * 1000)
+    return percentile(times, 50), rows
+
+
+def same_rows(a, b) -> bool:
+    def norm(rows):
+        return sorted((tuple(round(v, 6) if isinstance(v, float) else v for v in r) for r in rows), key=repr)
+    return norm(a) == norm(b)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", required=True)
+    parser.add_argument("--corpus", default=str(DEFAULT_CORPUS))
+    parser.add_argument("--new-sales", type=int, default=10000, help="sales inserted to time an incremental refresh")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--rebuild", action="store_true")
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db, isolation_level=None)
+    (sales,) = conn.execute("SELECT COUNT(*) FROM sales").fetchone()
+    print(f"{args.db}: {sales:,d} sales")
+
+    if args.rebuild or len(fresh_aggregates(conn, "sqlite", None)) < len(SALES_AGGREGATES):
+        start = time.perf_counter()
+        report = refresh(conn, "sqlite", rebuild=True)
+        print(f"full build: {time.perf_counter() - start:.1f} s")
+        for name, r in report.items():
+            print(f"  {name:28s} {r['rows']:>10,d} rows {r['ms'] / 1000:8.1f} s")
+
+    conn.execute("BEGIN")
+    conn.execute("INSERT INTO sales (customer_id, employee_id, amount, sale_date) "
+                 "SELECT customer_id, employee_id, amount, sale_date FROM sales "
+                 f"WHERE rowid > (SELECT MAX(rowid) FROM sales) - {args.new_sales}")
+    start = time.perf_counter()
+    refresh(conn, "sqlite", commit=False)
+    print(f"incremental refresh of {args.new_sales:,d} new sales: {(time.perf_counter() - start) * 1000:.0f} ms")
+    conn.execute("ROLLBACK")
+
+    available = fresh_aggregates(conn, "sqlite")
+    with open(args.corpus, encoding="utf-8") as f:
+        corpus = json.load(f)
+    print(f"\n{'question':52s} {'table':28s} {'sales ms':>10s} {'summary ms':>11s} {'speedup':>8s}")
+    base_total = agg_total = 0.0
+    for item in corpus:
+        routed = rewrite_sql(item["sql"], "sqlite", available)
+        if routed is None:
+            continue
+        base_ms, base_rows = timed(conn, item["sql"], args.repeat)
+        agg_ms, agg_rows = timed(conn, routed[0], args.repeat)
+        base_total += base_ms
+        agg_total += agg_ms
+        flag = "" if same_rows(base_rows, agg_rows) else "  RESULTS DIFFER"
+        print(f"{item['question'][:52]:52s} {routed[1]:28s} {base_ms:>10.1f} {agg_ms:>11.2f} "
+              f"{base_ms / max(agg_ms, 1e-3):>7.0f}x{flag}")
+    if agg_total:
+        print(f"{'all routed queries':52s} {'':28s} {base_total:>10.1f} {agg_total:>11.2f} "
+              f"{base_total / agg_total:>7.0f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""
+Concurrent /ask throughput with a stubbed LLM.
+
+Compares the current non-blocking /ask against the old behaviour, where the
+synchronous pipeline ran directly on the event loop. Every LLM call goes to
+the fake provider and sleeps for --llm-latency seconds instead of calling
+Gemini, so the numbers show how many questions one worker overlaps rather
+than model speed.
+
+    python -m benchmarks.bench_async --requests 64 --concurrency 16
+"""
+import time
+import asyncio
+import argparse
+
+import httpx
+
+import app
+from llm_providers import FakeLLMProvider
+
+CANNED_SQL = FakeLLMProvider.DEFAULT_SQL
+
+
+def blocking_pipeline(question: str):
+    # The pre-async request path: three LLM calls and the query, all blocking the loop.
+    app.generate_with_model(f"Schema Agent\nQuestion:\n{question}")
+    app.clean_sql_from_llm(app.generate_with_model(f"SQL Generator Agent\n{question}"))
+    result = app.run_query_statements(CANNED_SQL)
+    app.generate_with_model(f"Synthesizer Agent\n{result}")
+    return result
+
+
+@app.app.post("/_bench/ask_blocking")
+async def ask_blocking(req: app.QueryRequest):
+    return blocking_pipeline(req.question)
+
+
+async def drive(path: str, requests: int, concurrency: int) -> float:
+    transport = httpx.ASGITransport(app=app.app)
+    sem = asyncio.Semaphore(concurrency)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        async def one(i: int):
+            async with sem:
+                r = await client.post(path, json={"question": f"total sales #{i}"})
+                r.raise_for_status()
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(requests)))
+        return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=64)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="seconds per stubbed LLM call")
+    args = parser.parse_args()
+
+    app.llm_provider = FakeLLMProvider(latency=args.llm_latency)
+
+    print(f"{args.requests} requests, concurrency {args.concurrency}, "
+          f"LLM latency {args.llm_latency * 1000:.0f} ms, "
+          f"LLM_MAX_CONCURRENCY={app.LLM_MAX_CONCURRENCY}, DB_MAX_CONCURRENCY={app.DB_MAX_CONCURRENCY}")
+    for label, path in [("blocking (old)", "/_bench/ask_blocking"), ("async /ask", "/ask")]:
+        elapsed = asyncio.run(drive(path, args.requests, args.concurrency))
+        print(f"{label:16s} {elapsed:7.2f} s  {args.requests / elapsed:7.1f} req/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+"""
+Result encoding cost: fetch -> JSON-safe rows -> prompt -> response body.
+
+Compares the single-pass path (per-column converters at fetch time, orjson for
+the prompt and the response) against the old one, which sized every row with
+json.dumps, ran convert_json_safe recursively twice, round-tripped the result
+through json.loads(json.dumps(...)) and left the response to FastAPI's
+jsonable_encoder and json.dumps. Two result shapes are measured: SQLite-style
+rows (ints, floats, text) and Postgres-style rows (Decimal, date, timestamp),
+the latter served from an in-memory cursor that reports psycopg2 type codes.
+
+    python -m benchmarks.bench_encoding --rows 10000 50000
+"""
+import json
+import time
+import sqlite3
+import argparse
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+import orjson
+from fastapi.encoders import jsonable_encoder
+
+from result_fetch import compact_result_for_prompt, fetch_bounded, json_default, statement_result
+from benchmarks.bench_pipeline import percentile
+
+COLUMNS = ("id", "customer", "city", "amount", "sale_date", "created_at")
+
+
+class ListCursor:
+    """DB-API cursor over prepared rows, with psycopg2's numeric/date/timestamp type codes."""
+
+    description = [("id", 23), ("customer", 25), ("city", 25), ("amount", 1700), ("sale_date", 1082),
+                   ("created_at", 1114)]
+
+    def __init__(self, rows):
+        self._rows = rows
+        self._pos = 0
+
+    def fetchmany(self, size):
+        batch = self._rows[self._pos:self._pos + size]
+        self._pos += size
+        return batch
+
+
+def sqlite_cursor(n: int):
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE t (id INTEGER, customer TEXT, city TEXT, amount REAL, sale_date TEXT, created_at TEXT)")
+    conn.executemany("INSERT INTO t VALUES (?, ?, ?, ?, ?, ?)",
+                     ((i, f"Customer {i % 997}", f"City {i % 53}", (i * 37 % 10000) / 7,
+                       f"2025-{i % 12 + 1:02d}-{i % 28 + 1:02d}", f"2025-01-01T{i % 24:02d}:00:00")
+                      for i in range(n)))
+    return lambda: conn.execute("SELECT * FROM t")
+
+
+def pg_cursor(n: int):
+    base = datetime(2025, 1, 1)
+    rows = [(i, f"Customer {i % 997}", f"City {i % 53}", Decimal(i * 37 % 10000) / 7,
+             date(2025, 1, 1) + timedelta(days=i % 365), base + timedelta(minutes=i)) for i in range(n)]
+    return lambda: ListCursor(rows)
+
+
+# The old response path, kept here as the baseline.
+
+def convert_json_safe(obj):
+    if isinstance(obj, Decimal):
+        return float(obj)
+    if isinstance(obj, bytes):
+        return obj.decode("utf-8")
+    if hasattr(obj, "isoformat"):
+        return obj.isoformat()
+    if isinstance(obj, (tuple, list)):
+        return [convert_json_safe(i) for i in obj]
+    if isinstance(obj, dict):
+        return {k: convert_json_safe(v) for k, v in obj.items()}
+    return obj
+
+
+def legacy_fetch(cur, max_rows, max_bytes, batch_size=500):
+    rows, kept, truncated = [], 0, False
+    batch = cur.fetchmany(batch_size)
+    while batch:
+        for row in batch:
+            if not truncated:
+                size = len(json.dumps(row, default=str))
+                if len(rows) >= max_rows or kept + size > max_bytes:
+                    truncated = True
+                else:
+                    rows.append(row)
+                    kept += size
+        batch = cur.fetchmany(batch_size)
+    return {"columns": list(COLUMNS), "rows": rows, "truncated": truncated}
+
+
+def legacy_path(cur, max_rows, max_bytes):
+    fetched = legacy_fetch(cur, max_rows, max_bytes)
+    entry = {"columns": convert_json_safe(fetched["columns"]), "rows": convert_json_safe(fetched["rows"])}
+    run_result = {"multi_results": [entry]}
+    prompt = json.dumps(convert_json_safe(compact_result_for_prompt(run_result, 50, 10)))
+    query_result = json.loads(json.dumps(convert_json_safe(run_result)))
+    body = json.dumps(jsonable_encoder({"query_result": query_result})).encode()
+    return len(prompt), len(body)
+
+
+def single_pass_path(cur, max_rows, max_bytes):
+    run_result = {"multi_results": [statement_result(fetch_bounded(cur, max_rows, max_bytes, 500, max_rows))]}
+    prompt = orjson.dumps(compact_result_for_prompt(run_result, 50, 10), default=json_default).decode()
+    body = orjson.dumps({"query_result": run_result}, default=json_default, option=orjson.OPT_NON_STR_KEYS)
+    return len(prompt), len(body)
+
+
+def measure(fn, make_cursor, rows, repeat):
+    times = []
+    for _ in range(repeat):
+        cur = make_cursor()
+        start = time.perf_counter()
+        fn(cur, rows, 1 << 30)
+        times.append((time.perf_counter() - start) * 1000)
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=[10000, 50000])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'shape':8s} {'rows':>8s} {'legacy p50':>12s} {'single p50':>12s} {'speedup':>8s}")
+    for n in args.rows:
+        for shape, make in (("sqlite", sqlite_cursor(n)), ("postgres", pg_cursor(n))):
+            old = measure(legacy_path, make, n, args.repeat)
+            new = measure(single_pass_path, make, n, args.repeat)
+            p_old, p_new = percentile(old, 50), percentile(new, 50)
+            print(f"{shape:8s} {n:>8,d} {p_old:>10.1f}ms {p_new:>10.1f}ms {p_old / p_new:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""
+Offline end-to-end benchmark of the question pipeline.
+
+Builds a fresh company.db with db_setup.py in a temporary directory, switches
+the app to the deterministic fake LLM (LLM_PROVIDER=fake) and drives either
+process_question_async directly or POST /ask at a fixed concurrency, cycling
+through the question corpus. Reports p50/p95/p99 latency per stage and end to
+end, plus throughput.
+
+    python -m benchmarks.bench_pipeline --mode both --requests 200 --concurrency 16 --llm-latency-ms 50
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+import tempfile
+import importlib
+import subprocess
+from pathlib import Path
+from typing import Dict, List
+
+ROOT = Path(__file__).resolve().parents[1]
+DEFAULT_CORPUS = ROOT / "benchmarks" / "question_corpus.json"
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, int(round(pct / 100.0 * len(ordered) + 0.5)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def build_database(workdir: Path, extra_args: List[str]) -> Path:
+    subprocess.run([sys.executable, str(ROOT / "db_setup.py"), *extra_args], cwd=workdir, check=True,
+                   stdout=subprocess.DEVNULL)
+    return workdir / "company.db"
+
+
+def report(label: str, elapsed: float, e2e: List[float], stages: Dict[str, List[float]]):
+    n = len(e2e)
+    print(f"\n== {label}: {n} requests in {elapsed:.2f} s -> {n / elapsed:.1f} req/s")
+    print(f"{'stage':16s} {'p50 ms':>9s} {'p95 ms':>9s} {'p99 ms':>9s} {'count':>7s}")
+    rows = [("end_to_end", e2e)] + sorted(stages.items())
+    for name, values in rows:
+        print(f"{name:16s} {percentile(values, 50):9.1f} {percentile(values, 95):9.1f} "
+              f"{percentile(values, 99):9.1f} {len(values):7d}")
+
+
+async def run_load(call, questions: List[str], requests: int, concurrency: int):
+    sem = asyncio.Semaphore(concurrency)
+    e2e: List[float] = []
+    stages: Dict[str, List[float]] = {}
+
+    async def one(i: int):
+        async with sem:
+            start = time.perf_counter()
+            resp = await call(questions[i % len(questions)])
+            e2e.append((time.perf_counter() - start) * 1000)
+            for name, t in resp.get("stages", {}).items():
+                stages.setdefault(name, []).append(t["duration_ms"])
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    return time.perf_counter() - start, e2e, stages
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mode", choices=["pipeline", "http", "both"], default="both")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--llm-latency-ms", type=float, default=50.0)
+    parser.add_argument("--llm-jitter-ms", type=float, default=0.0)
+    parser.add_argument("--corpus", default=str(DEFAULT_CORPUS))
+    parser.add_argument("--db", help="use an existing SQLite file instead of generating one")
+    parser.add_argument("--setup-args", default="", help="extra arguments passed to db_setup.py")
+    parser.add_argument("--with-cache", action="store_true",
+                        help="keep the SQL/result caches and example store on (off by default so every request runs every stage)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = Path(args.db) if args.db else build_database(Path(tmp), args.setup_args.split())
+        os.environ.update({
+            "DB_BACKEND": "sqlite",
+            "SQLITE_PATH": str(db_path),
+            "LLM_PROVIDER": "fake",
+            "FAKE_LLM_CORPUS": args.corpus,
+            "FAKE_LLM_LATENCY_MS": str(args.llm_latency_ms),
+            "FAKE_LLM_JITTER_MS": str(args.llm_jitter_ms),
+        })
+        if not args.with_cache:
+            os.environ["SQL_CACHE_ENABLED"] = "false"
+            os.environ["RESULT_CACHE_ENABLED"] = "false"
+            os.environ["EXAMPLE_STORE_ENABLED"] = "false"
+        app = importlib.import_module("app")
+
+        from llm_providers import load_corpus
+        questions = [item["question"] for item in load_corpus(args.corpus)]
+        print(f"db={db_path} requests={args.requests} concurrency={args.concurrency} "
+              f"llm_latency={args.llm_latency_ms:.0f}ms LLM_MAX_CONCURRENCY={app.LLM_MAX_CONCURRENCY} "
+              f"DB_MAX_CONCURRENCY={app.DB_MAX_CONCURRENCY}")
+
+        if args.mode in ("pipeline", "both"):
+            result = asyncio.run(run_load(app.process_question_async, questions, args.requests, args.concurrency))
+            report("process_question", *result)
+
+        if args.mode in ("http", "both"):
+            import httpx
+
+            async def http_load():
+                transport = httpx.ASGITransport(app=app.app)
+                async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+                    async def ask(question: str):
+                        r = await client.post("/ask", json={"question": question})
+                        r.raise_for_status()
+                        return r.json()
+                    return await run_load(ask, questions, args.requests, args.concurrency)
+
+            report("POST /ask", *asyncio.run(http_load()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+"""
+Schema prompt size and SQL grounding: the plain `table(col, ...)` text against
+the compact form with types, keys and value statistics (schema_stats), at each
+--budgets token budget.
+
+For every corpus question it reports the SQL Generator prompt size and whether
+the schema text states the facts the corpus SQL relies on beyond column names:
+the join edges it uses (as foreign keys), the date format of the columns it
+applies date functions to (as a date range), and the category values it
+compares against. That check is an offline proxy for first-try success. With
+--llm gemini each prompt is also sent to the model once, and a question counts
+as a first-try success when the generated SQL passes validation without repair
+and returns the same rows as the corpus SQL.
+
+    python -m benchmarks.bench_schema_prompt --budgets 0 150 100
+    python -m benchmarks.bench_schema_prompt --llm gemini --db company.db
+"""
+import os
+import re
+import time
+import argparse
+import importlib
+
+from benchmarks.bench_pipeline import DEFAULT_CORPUS, ROOT, percentile
+from llm_providers import load_corpus
+
+JOIN_EQ_RE = re.compile(r"\bON\s+(\w+)\.(\w+)\s*=\s*(\w+)\.(\w+)", re.IGNORECASE)
+ALIAS_RE = re.compile(r"\b(?:FROM|JOIN)\s+(\w+)(?:\s+(?:AS\s+)?(?!ON\b|WHERE\b|GROUP\b|ORDER\b|LEFT\b|JOIN\b)(\w+))?",
+                      re.IGNORECASE)
+DATE_FUNC_RE = re.compile(r"\b(?:strftime|date|datetime|date_trunc|to_char|extract)\s*\(([^)]*)\)", re.IGNORECASE)
+COMPARE_RE = re.compile(r"(?:(\w+)\.)?(\w+)\s*(?:=|<>|!=|IN\s*\()\s*'([^']*)'", re.IGNORECASE)
+
+
+def required_facts(sql: str, catalog) -> set:
+    """Facts the SQL depends on: ('join', a.x, b.y), ('dates', t.col), ('value', t.col, v)."""
+    tables = catalog["tables"]
+    aliases = {}
+    for table, alias in ALIAS_RE.findall(sql):
+        if table in tables:
+            aliases[table] = table
+            if alias:
+                aliases[alias] = table
+    facts = set()
+    for a, x, b, y in JOIN_EQ_RE.findall(sql):
+        if a in aliases and b in aliases:
+            facts.add(("join",) + tuple(sorted([f"{aliases[a]}.{x}", f"{aliases[b]}.{y}"])))
+
+    def owner(alias, col):
+        if alias:
+            return aliases.get(alias)
+        return next((t for t in set(aliases.values()) if any(c["name"] == col for c in tables[t]["columns"])), None)
+
+    for args in DATE_FUNC_RE.findall(sql):
+        for alias, col in re.findall(r"(?:(\w+)\.)?\b([a-z_]\w*)\b", args, re.IGNORECASE):
+            t = owner(alias, col)
+            if t and any(c["name"] == col for c in tables[t]["columns"]):
+                facts.add(("dates", f"{t}.{col}"))
+    for alias, col, value in COMPARE_RE.findall(sql):
+        t = owner(alias, col)
+        if t and any(c["name"] == col for c in tables[t]["columns"]):
+            facts.add(("value", f"{t}.{col}", value))
+    return facts
+
+
+def stated(fact, text: str) -> bool:
+    lines = {line.split("(", 1)[0]: line for line in text.splitlines()[1:]}
+    if fact[0] == "join":
+        (ta, ca), (tb, cb) = (f.split(".") for f in fact[1:])
+        edge = r"\b{}(?: \w+)?(?: PK)?->{}\b"
+        return (re.search(edge.format(ca, re.escape(f"{tb}.{cb}")), lines.get(ta, "")) is not None
+                or re.search(edge.format(cb, re.escape(f"{ta}.{ca}")), lines.get(tb, "")) is not None)
+    table, col = fact[1].split(".")
+    line = lines.get(table, "")
+    if fact[0] == "dates":
+        return re.search(rf"[;)] {re.escape(col)} '", line) is not None
+    return f"{col} in " in line and f"'{fact[2]}'" in line
+
+
+def same_rows(a, b) -> bool:
+    def norm(rows):
+        return sorted(tuple(round(v, 4) if isinstance(v, float) else v for v in row) for row in rows)
+    return norm(a) == norm(b)
+
+
+def first_try(app, text: str, question: str, gold_sql: str):
+    """(success, llm ms) for one generation with this schema text and no repair."""
+    start = time.perf_counter()
+    raw = app.generate_with_model(app.build_sql_prompt(text, question))
+    llm_ms = (time.perf_counter() - start) * 1000
+    sql = app.clean_sql_from_llm(raw)
+    if app.validate_sql(sql) is not None:
+        return False, llm_ms
+    with app.db_pool.connection() as conn:
+        try:
+            got = conn.execute(sql).fetchall()
+        except Exception:
+            return False, llm_ms
+        expected = conn.execute(gold_sql).fetchall()
+    return same_rows(got, expected), llm_ms
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", default=str(ROOT / "company.db"), help="SQLite database (opened read-only)")
+    parser.add_argument("--corpus", default=str(DEFAULT_CORPUS))
+    parser.add_argument("--budgets", type=int, nargs="+", default=[0, 150, 100],
+                        help="token budgets for the compact form, 0 = unlimited")
+    parser.add_argument("--llm", default="fake", choices=["fake", "gemini"],
+                        help="gemini also measures first-try success against the live model")
+    args = parser.parse_args()
+
+    os.environ.update({
+        "DB_BACKEND": "sqlite",
+        "SQLITE_PATH": args.db,
+        "LLM_PROVIDER": args.llm,
+        "FAKE_LLM_CORPUS": args.corpus,
+        "SQL_CACHE_ENABLED": "false",
+        "RESULT_CACHE_ENABLED": "false",
+        "EXAMPLE_STORE_ENABLED": "false",
+        "SCHEMA_STATS": "true",
+    })
+    app = importlib.import_module("app")
+    from schema_catalog import render_schema_text
+    from schema_stats import render_compact_schema
+
+    start = time.perf_counter()
+    app.get_schema_snapshot()
+    build_ms = (time.perf_counter() - start) * 1000
+    timings = []
+    for _ in range(2):  # the first pass computes everything, the second finds nothing changed
+        start = time.perf_counter()
+        app.schema_catalog.refresh_stats()  # what the background thread runs
+        timings.append((time.perf_counter() - start) * 1000)
+    snapshot = app.get_schema_snapshot()
+    catalog, stats = snapshot["catalog"], app.schema_stats.tables
+    print(f"catalog: {build_ms:.0f} ms; statistics (background): {timings[0]:.0f} ms first pass, "
+          f"{timings[1]:.1f} ms refresh with no changes")
+
+    variants = [("plain", render_schema_text(catalog))]
+    variants += [(f"compact/{b or 'inf'}", render_compact_schema(catalog, stats, b)) for b in args.budgets]
+    corpus = load_corpus(args.corpus)
+    facts = [required_facts(item["sql"], catalog) for item in corpus]
+    n_facts = sum(len(f) for f in facts)
+
+    header = f"{'variant':14s} {'schema tok':>10s} {'prompt tok p50':>14s} {'facts stated':>13s} {'grounded':>9s}"
+    if args.llm != "fake":
+        header += f" {'first try':>10s} {'llm p50 ms':>10s}"
+    print(f"{len(corpus)} questions, {n_facts} facts beyond column names\n" + header)
+    for label, text in variants:
+        prompt_tokens = [app.approx_tokens(app.build_sql_prompt(text, item["question"])) for item in corpus]
+        per_q = [[stated(f, text) for f in fs] for fs in facts]
+        line = (f"{label:14s} {app.approx_tokens(text):>10d} {percentile(prompt_tokens, 50):>14.0f} "
+                f"{sum(map(sum, per_q)):>6d}/{n_facts:<6d} {sum(all(q) for q in per_q):>4d}/{len(corpus):<4d}")
+        if args.llm != "fake":
+            runs = [first_try(app, text, item["question"], item["sql"]) for item in corpus]
+            line += f" {sum(ok for ok, _ in runs):>5d}/{len(corpus):<4d} {percentile([ms for _, ms in runs], 50):>10.0f}"
+        print(line)
+    print("\ncompact text:\n" + snapshot["text"])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""
+Schema-pruning benchmark on a synthetic wide schema.
+
+Copies company.db into a temporary directory and adds deterministic distractor
+tables (names drawn from the same business vocabulary, with foreign keys into
+each other and into the real tables) until the database has --tables tables.
+Then it compares the full schema prompt against the retrieval-pruned one for
+every corpus question, checks that the tables listed in the corpus were
+retrieved, and times index build, incremental refresh after one ALTER TABLE
+and per-question retrieval.
+
+    python -m benchmarks.bench_schema_pruning --tables 500 --top-k 8
+"""
+import time
+import random
+import shutil
+import sqlite3
+import argparse
+import tempfile
+from contextlib import contextmanager
+from pathlib import Path
+
+from benchmarks.bench_pipeline import DEFAULT_CORPUS, ROOT, percentile
+from llm_providers import load_corpus
+from schema_catalog import SchemaCatalog, render_schema_text
+from schema_index import SchemaIndex
+
+PREFIXES = ["vendor", "invoice", "shipment", "warehouse", "payroll", "ticket", "campaign", "asset", "contract",
+            "audit", "region", "product", "supplier", "budget", "lead", "order", "refund", "department",
+            "inventory", "vehicle", "license", "training", "survey", "partner", "tax"]
+SUFFIXES = ["items", "history", "logs", "events", "lines", "snapshots", "notes", "targets", "approvals",
+            "metrics", "versions", "assignments", "rates", "archive", "details", "links", "queue", "stats",
+            "reviews", "plans"]
+COLUMNS = [("name", "TEXT"), ("status", "TEXT"), ("code", "TEXT"), ("quantity", "INTEGER"), ("price", "REAL"),
+           ("created_at", "DATE"), ("updated_at", "DATE"), ("description", "TEXT"), ("score", "REAL"),
+           ("category", "TEXT"), ("owner", "TEXT"), ("due_date", "DATE")]
+
+
+def add_distractors(db_path: Path, target: int, seed: int = 7):
+    rng = random.Random(seed)
+    conn = sqlite3.connect(db_path)
+    existing = [r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type='table' "
+                                           "AND name NOT LIKE 'sqlite_%'")]
+    names = [f"{p}_{s}" for p in PREFIXES for s in SUFFIXES]
+    rng.shuffle(names)
+    created = list(existing)
+    for name in names[:max(0, target - len(existing))]:
+        cols = rng.sample(COLUMNS, rng.randint(3, 6))
+        ref = rng.choice(created)
+        ddl = ", ".join(f"{c} {t}" for c, t in cols)
+        conn.execute(f'CREATE TABLE "{name}" (id INTEGER PRIMARY KEY, {ddl}, '
+                     f'{ref}_id INTEGER, FOREIGN KEY({ref}_id) REFERENCES "{ref}"(id))')
+        rows = [tuple(rng.choice(["open", "closed", "pending", "north", "south"]) if t == "TEXT"
+                      else rng.randint(1, 100) for _, t in cols) + (rng.randint(1, 50),) for _ in range(3)]
+        marks = ", ".join("?" * (len(cols) + 1))
+        conn.executemany(f'INSERT INTO "{name}" VALUES (NULL, {marks})', rows)
+        created.append(name)
+    conn.commit()
+    conn.close()
+    return len(created)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tables", type=int, default=500)
+    parser.add_argument("--top-k", type=int, default=8)
+    parser.add_argument("--corpus", default=str(DEFAULT_CORPUS))
+    parser.add_argument("--db", default=str(ROOT / "company.db"), help="source SQLite database (copied, not modified)")
+    parser.add_argument("--no-samples", action="store_true", help="index without sampled column values")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = Path(tmp) / "wide.db"
+        shutil.copy(args.db, db_path)
+        n_tables = add_distractors(db_path, args.tables)
+
+        @contextmanager
+        def connection():
+            conn = sqlite3.connect(db_path)
+            try:
+                yield conn
+            finally:
+                conn.close()
+
+        catalog = SchemaCatalog(connection, "sqlite", ttl=0, check_interval=0)
+        snapshot = catalog.get()
+        index = SchemaIndex(connection, sample_values=not args.no_samples)
+
+        start = time.perf_counter()
+        index.refresh(snapshot)
+        build_ms = (time.perf_counter() - start) * 1000
+
+        with connection() as conn:
+            conn.execute('ALTER TABLE sales ADD COLUMN channel TEXT')
+            conn.commit()
+        catalog.invalidate()
+        snapshot = catalog.get()
+        before = index.reindexed
+        start = time.perf_counter()
+        index.refresh(snapshot)
+        refresh_ms = (time.perf_counter() - start) * 1000
+        refreshed = index.reindexed - before
+
+        tables = snapshot["catalog"]["tables"]
+        full_chars = len(snapshot["text"])
+        corpus = load_corpus(args.corpus)
+        pruned_chars, latencies, selected_counts = [], [], []
+        hits = 0
+        misses = []
+        for item in corpus:
+            start = time.perf_counter()
+            selected = index.retrieve(item["question"], args.top_k)
+            latencies.append((time.perf_counter() - start) * 1000)
+            text = render_schema_text({"tables": {t: tables[t] for t in selected}}) if selected else snapshot["text"]
+            pruned_chars.append(len(text))
+            selected_counts.append(len(selected))
+            if set(item["tables"]) <= set(selected):
+                hits += 1
+            else:
+                misses.append((item["question"], sorted(set(item["tables"]) - set(selected))))
+
+    avg_pruned = sum(pruned_chars) / len(pruned_chars)
+    print(f"tables={n_tables} top_k={args.top_k} samples={not args.no_samples} questions={len(corpus)}")
+    print(f"index build: {build_ms:.1f} ms   incremental refresh after ALTER: {refresh_ms:.1f} ms "
+          f"({refreshed} table re-indexed)")
+    print(f"retrieval latency: p50 {percentile(latencies, 50):.2f} ms  p95 {percentile(latencies, 95):.2f} ms")
+    print(f"schema prompt: full {full_chars} chars (~{full_chars // 4} tokens)  "
+          f"pruned avg {avg_pruned:.0f} chars (~{avg_pruned / 4:.0f} tokens), "
+          f"{avg_pruned / full_chars:.1%} of full; avg {sum(selected_counts) / len(selected_counts):.1f} tables")
+    print(f"recall of corpus tables: {hits}/{len(corpus)}")
+    for question, missing in misses:
+        print(f"  missed {missing} for: {question}")
+
+
+if __name__ == "__main__":
+    main()
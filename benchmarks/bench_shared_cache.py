@@ -0,0 +1,85 @@
+"""
+Throughput and latency of the cross-process cache tier (shared_cache.SharedCache).
+
+Each of --procs worker processes runs --ops operations against one cache file:
+--read-ratio gets, the rest puts, over a key space of --keys result-sized values
+(--value-kb) that is filled before the workers start. Reports total ops/s and
+get/put latency percentiles (ms) per process count. --max-mb below the working
+set exercises eviction.
+
+    python -m benchmarks.bench_shared_cache --procs 1 2 4 --ops 5000
+"""
+import os
+import time
+import random
+import argparse
+import tempfile
+import multiprocessing
+
+from shared_cache import SharedCache
+from benchmarks.bench_pipeline import percentile
+
+
+def make_value(value_kb: int):
+    return {"columns": ["id", "name", "total"],
+            "rows": [[i, f"name {i}", i * 1.5] for i in range(max(1, value_kb * 1024 // 30))]}
+
+
+def worker(path: str, max_bytes: int, ops: int, keys: int, value_kb: int, read_ratio: float, seed: int, out):
+    cache = SharedCache(path, max_bytes=max_bytes)
+    rng = random.Random(seed)
+    value = make_value(value_kb)
+    gets, puts = [], []
+    for _ in range(ops):
+        key = f"q{rng.randrange(keys)}"
+        start = time.perf_counter()
+        if rng.random() < read_ratio:
+            cache.get("results", key, "v1")
+            gets.append((time.perf_counter() - start) * 1000)
+        else:
+            cache.put("results", key, value, 3600, "v1")
+            puts.append((time.perf_counter() - start) * 1000)
+    out.put((gets, puts, cache.stats()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--procs", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--ops", type=int, default=5000, help="operations per process")
+    parser.add_argument("--keys", type=int, default=2000)
+    parser.add_argument("--value-kb", type=int, default=4)
+    parser.add_argument("--read-ratio", type=float, default=0.9)
+    parser.add_argument("--max-mb", type=float, default=256)
+    args = parser.parse_args()
+
+    print(f"{'procs':>5s} {'ops/s':>9s} {'get p50':>9s} {'get p99':>9s} {'put p50':>9s} {'put p99':>9s} "
+          f"{'hit rate':>9s} {'evictions':>10s} {'errors':>7s}")
+    for procs in args.procs:
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "shared.db")
+            cache = SharedCache(path, max_bytes=int(args.max_mb * 1024 * 1024))
+            for k in range(args.keys):
+                cache.put("results", f"q{k}", make_value(args.value_kb), 3600, "v1")
+            out = multiprocessing.Queue()
+            pool = [multiprocessing.Process(target=worker, args=(path, int(args.max_mb * 1024 * 1024), args.ops,
+                                                                 args.keys, args.value_kb, args.read_ratio, i, out))
+                    for i in range(procs)]
+            start = time.perf_counter()
+            for p in pool:
+                p.start()
+            results = [out.get() for _ in pool]
+            elapsed = time.perf_counter() - start
+            for p in pool:
+                p.join()
+        gets = [ms for r in results for ms in r[0]]
+        puts = [ms for r in results for ms in r[1]]
+        hits = sum(r[2]["hits"] for r in results)
+        lookups = hits + sum(r[2]["misses"] for r in results)
+        print(f"{procs:>5d} {procs * args.ops / elapsed:>9.0f} {percentile(gets, 50):>9.3f} "
+              f"{percentile(gets, 99):>9.3f} {percentile(puts, 50):>9.3f} {percentile(puts, 99):>9.3f} "
+              f"{hits / max(lookups, 1):>9.2%} {sum(r[2]['evictions'] for r in results):>10d} "
+              f"{sum(r[2]['errors'] for r in results):>7d}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Aggregate-query latency per SQLite access profile (db_pool.SQLITE_PROFILES).
+
+Runs the corpus' aggregate queries over a large generated database through
+each profile: the first run on a fresh connection, then the p50 of the
+repeats. With --threads N, N connections (one per thread, as the pool hands
+them out) run the same queries at once, which is where a per-connection page
+cache and the shared mmap differ most. --temp-store runs the tuned profiles once
+per temp_store setting.
+
+    python db_setup.py --scale 10000 --db /tmp/big.db --anchor-date 2025-01-01
+    python -m benchmarks.bench_sqlite_profiles --db /tmp/big.db --threads 1 4
+
+The OS page cache is not dropped between profiles, so "first" measures a cold
+SQLite cache on a warm file; the profiles run in the order given. The replica
+profile switches the file to WAL (persistent).
+"""
+import re
+import json
+import time
+import argparse
+import threading
+
+from db_pool import SQLITE_PROFILES, TEMP_STORES, connect_sqlite
+from benchmarks.bench_pipeline import DEFAULT_CORPUS, percentile
+
+
+def aggregate_queries(corpus_path: str, limit: int):
+    with open(corpus_path, encoding="utf-8") as f:
+        corpus = json.load(f)
+    picked = [item["sql"] for item in corpus
+              if re.search(r"\b(COUNT|SUM|AVG|MIN|MAX)\s*\(", item["sql"], re.I)
+              and re.search(r"\bFROM\s+sales\b", item["sql"], re.I)]
+    return picked[:limit]
+
+
+def run_profile(db: str, profile: str, queries, repeat: int, threads: int, mmap_mb: int, cache_mb: int,
+                temp_store: str):
+    """Returns (first-run ms, p50 ms) per query, over all threads."""
+    first = {q: [] for q in queries}
+    warm = {q: [] for q in queries}
+    lock = threading.Lock()
+
+    def worker():
+        conn = connect_sqlite(db, profile, mmap_mb=mmap_mb, cache_mb=cache_mb, temp_store=temp_store)
+        for i in range(repeat + 1):
+            for q in queries:
+                start = time.perf_counter()
+                conn.execute(q).fetchall()
+                ms = (time.perf_counter() - start) * 1000
+                with lock:
+                    (first if i == 0 else warm)[q].append(ms)
+        conn.close()
+
+    pool = [threading.Thread(target=worker) for _ in range(threads)]
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    return {q: (percentile(first[q], 50), percentile(warm[q], 50)) for q in queries}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", required=True)
+    parser.add_argument("--corpus", default=str(DEFAULT_CORPUS))
+    parser.add_argument("--profiles", nargs="+", default=list(SQLITE_PROFILES), choices=SQLITE_PROFILES)
+    parser.add_argument("--threads", type=int, nargs="+", default=[1])
+    parser.add_argument("--queries", type=int, default=6, help="aggregate corpus queries to run")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--mmap-mb", type=int, default=1024)
+    parser.add_argument("--cache-mb", type=int, default=0, help="0 = SQLite's default page cache")
+    parser.add_argument("--temp-store", nargs="+", default=["default"], choices=TEMP_STORES)
+    args = parser.parse_args()
+
+    queries = aggregate_queries(args.corpus, args.queries)
+    for i, q in enumerate(queries):
+        print(f"q{i}: {q}")
+    for threads in args.threads:
+        cache = f"{args.cache_mb} MB" if args.cache_mb else "default"
+        print(f"\n{threads} thread(s), mmap {args.mmap_mb} MB, page cache {cache} per connection; ms")
+        print(f"{'profile':20s} " + " ".join(f"{f'q{i} first/p50':>18s}" for i in range(len(queries)))
+              + f" {'total p50':>10s}")
+        for profile in args.profiles:
+            for temp_store in (["default"] if profile == "default" else args.temp_store):
+                res = run_profile(args.db, profile, queries, args.repeat, threads, args.mmap_mb, args.cache_mb,
+                                  temp_store)
+                label = profile if temp_store == "default" else f"{profile}/{temp_store}"
+                cells = " ".join(f"{res[q][0]:>8.0f}/{res[q][1]:<9.0f}" for q in queries)
+                print(f"{label:20s} {cells} {sum(p50 for _, p50 in res.values()):>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
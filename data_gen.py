@@ -0,0 +1,104 @@
+import random
+import multiprocessing
+from datetime import date, timedelta
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from faker import Faker
+
+# Rows per table at scale 1; every table grows linearly with the scale factor.
+BASE_ROWS = {"projects": 30, "customers": 200, "employees": 50, "sales": 1000}
+TABLES = ("projects", "customers", "employees", "sales")  # load order: referenced tables first
+COLUMNS = {
+    "projects": ("id", "name", "start_date", "end_date", "budget"),
+    "customers": ("id", "name", "city", "join_date"),
+    "employees": ("id", "name", "role", "salary", "project_id"),
+    "sales": ("id", "customer_id", "employee_id", "amount", "sale_date"),
+}
+ROLES = ["Manager", "Analyst", "Sales Executive", "Engineer"]
+
+# Rows are generated in fixed-size chunks, each from its own seeded RNG, so the
+# data depends only on (seed, scale, anchor date) and not on the worker count
+# or the loader's batch size.
+GEN_CHUNK = 10000
+# Faker calls cost ~100 us each, so each chunk draws names, cities and project
+# names from small Faker-generated pools instead of calling Faker per row.
+FAKER_POOL = 500
+
+_faker: Optional[Faker] = None
+
+
+def table_sizes(scale: float) -> Dict[str, int]:
+    return {t: max(1, int(round(n * scale))) for t, n in BASE_ROWS.items()}
+
+
+def _days(anchor: date, rng: random.Random, back: int) -> date:
+    return anchor - timedelta(days=rng.randint(0, back))
+
+
+def generate_chunk(task: Tuple[str, int, int, int, Dict[str, int], str]) -> List[tuple]:
+    """Rows with ids start+1 .. stop of one table; dates are ISO strings."""
+    table, start, stop, seed, sizes, anchor_iso = task
+    global _faker
+    if _faker is None:
+        _faker = Faker()
+    key = f"{seed}:{table}:{start}"
+    rng = random.Random(key)
+    _faker.seed_instance(key)
+    anchor = date.fromisoformat(anchor_iso)
+    pool_size = min(stop - start, FAKER_POOL)
+    rows: List[tuple] = []
+
+    def names():
+        firsts = [_faker.first_name() for _ in range(pool_size)]
+        lasts = [_faker.last_name() for _ in range(pool_size)]
+        return lambda: f"{rng.choice(firsts)} {rng.choice(lasts)}"
+
+    if table == "projects":
+        titles = [_faker.bs().title() for _ in range(pool_size)]
+        for i in range(start + 1, stop + 1):
+            start_date = _days(anchor, rng, 730)
+            end_date = start_date + timedelta(days=rng.randint(0, (anchor - start_date).days + 365))
+            rows.append((i, rng.choice(titles), start_date.isoformat(), end_date.isoformat(),
+                         rng.randint(100000, 1000000)))
+    elif table == "customers":
+        name = names()
+        cities = [_faker.city() for _ in range(pool_size)]
+        for i in range(start + 1, stop + 1):
+            rows.append((i, name(), rng.choice(cities), _days(anchor, rng, 1095).isoformat()))
+    elif table == "employees":
+        name = names()
+        for i in range(start + 1, stop + 1):
+            rows.append((i, name(), rng.choice(ROLES), rng.randint(40000, 120000),
+                         rng.randint(1, sizes["projects"])))
+    elif table == "sales":
+        # no Faker here: this is the big table, so keep it to cheap integer draws
+        dates = [(anchor - timedelta(days=d)).isoformat() for d in range(731)]
+        customers, employees = sizes["customers"], sizes["employees"]
+        randint = rng.randint
+        for i in range(start + 1, stop + 1):
+            rows.append((i, randint(1, customers), randint(1, employees), randint(500, 10000),
+                         dates[randint(0, 730)]))
+    else:
+        raise ValueError(f"unknown table {table}")
+    return rows
+
+
+def iter_rows(table: str, sizes: Dict[str, int], seed: int, anchor: date,
+              pool: Optional["multiprocessing.pool.Pool"] = None) -> Iterator[List[tuple]]:
+    """Chunks of rows for `table` in id order, generated on `pool` when given."""
+    tasks = [(table, s, min(s + GEN_CHUNK, sizes[table]), seed, sizes, anchor.isoformat())
+             for s in range(0, sizes[table], GEN_CHUNK)]
+    if pool is None or len(tasks) == 1:
+        return map(generate_chunk, tasks)
+    return pool.imap(generate_chunk, tasks)
+
+
+def add_generator_args(parser):
+    """Options shared by the SQLite and Postgres loaders, so both can hold identical data."""
+    parser.add_argument("--scale", type=float, default=1.0,
+                        help="scale factor; 1 = 30 projects, 200 customers, 50 employees, 1000 sales")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--anchor-date", default=date.today().isoformat(),
+                        help="dates are generated relative to this day (YYYY-MM-DD); fix it to reproduce data exactly")
+    parser.add_argument("--workers", type=int, default=multiprocessing.cpu_count(),
+                        help="processes generating rows; 1 = in-process")
@@ -0,0 +1,338 @@
+import os
+import time
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+from urllib.parse import quote
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class PoolMetrics:
+    """Checkout counters and wait times shared by both pool types."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.created = 0
+        self.discarded = 0
+        self.timeouts = 0
+        self.in_use = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def checked_out(self, waited: float):
+        with self._lock:
+            self.checkouts += 1
+            self.in_use += 1
+            self.wait_total += waited
+            self.wait_max = max(self.wait_max, waited)
+
+    def incr(self, field: str):
+        with self._lock:
+            setattr(self, field, getattr(self, field) + 1)
+
+    def checked_in(self):
+        with self._lock:
+            self.in_use -= 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "checkouts": self.checkouts,
+                "created": self.created,
+                "discarded": self.discarded,
+                "timeouts": self.timeouts,
+                "in_use": self.in_use,
+                "wait_seconds_total": round(self.wait_total, 6),
+                "wait_seconds_max": round(self.wait_max, 6),
+                "wait_seconds_avg": round(self.wait_total / self.checkouts, 6) if self.checkouts else 0.0,
+            }
+
+
+# How pooled SQLite connections open the database file:
+#   default   - read-write, SQLite's default page cache, no mmap
+#   readonly  - mode=ro URI with query_only and mmap (page cache size and temp_store configurable)
+#   immutable - like readonly, but immutable=1: no file locking and no change detection at all,
+#               only for files nothing writes to while the app runs (replaced files are picked up)
+#   replica   - like readonly on a WAL database, so a background refresh (pg_to_sqlite_export.py
+#               --incremental, aggregates.py) never blocks or is blocked by queries
+SQLITE_PROFILES = ("default", "readonly", "immutable", "replica")
+TEMP_STORES = ("default", "file", "memory")
+
+
+def sqlite_uri(path: str, profile: str) -> str:
+    uri = "file:" + quote(os.path.abspath(path))
+    return uri + ("?immutable=1" if profile == "immutable" else "?mode=ro")
+
+
+def enable_wal(path: str) -> str:
+    """Switch a database file to WAL (persistent, needs write access once). Returns the journal mode."""
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute("PRAGMA journal_mode = WAL").fetchone()[0]
+    finally:
+        conn.close()
+
+
+def connect_sqlite(path: str, profile: str = "readonly", mmap_mb: int = 1024, cache_mb: int = 0,
+                   temp_store: str = "default", check_same_thread: bool = False) -> sqlite3.Connection:
+    """
+    Open `path` with one of SQLITE_PROFILES. The page cache is per connection,
+    mmap'd pages are shared through the OS page cache, so mmap_mb can be large
+    (up to the file size) while cache_mb = 0 keeps SQLite's default (~2 MB).
+    temp_store = "memory" keeps sorter spills off disk, but large GROUP BY sorts
+    ran about 2x slower with it in benchmarks/bench_sqlite_profiles.py.
+    """
+    if profile not in SQLITE_PROFILES:
+        raise ValueError(f"Unknown SQLite profile {profile!r}; expected one of {', '.join(SQLITE_PROFILES)}")
+    if temp_store not in TEMP_STORES:
+        raise ValueError(f"Unknown temp_store {temp_store!r}; expected one of {', '.join(TEMP_STORES)}")
+    if profile == "default":
+        return sqlite3.connect(path, check_same_thread=check_same_thread)
+    if not os.path.exists(path):
+        # mode=ro would fail with a bare "unable to open database file"
+        raise sqlite3.OperationalError(f"SQLite database {path} does not exist")
+    conn = sqlite3.connect(sqlite_uri(path, profile), uri=True, check_same_thread=check_same_thread)
+    if profile == "replica" and conn.execute("PRAGMA journal_mode").fetchone()[0] != "wal":
+        conn.close()
+        enable_wal(path)
+        conn = sqlite3.connect(sqlite_uri(path, profile), uri=True, check_same_thread=check_same_thread)
+    conn.execute(f"PRAGMA mmap_size = {int(mmap_mb) * 1024 * 1024}")
+    if cache_mb:
+        conn.execute(f"PRAGMA cache_size = -{int(cache_mb) * 1024}")  # negative = KiB
+    conn.execute(f"PRAGMA temp_store = {temp_store.upper()}")
+    conn.execute("PRAGMA query_only = ON")
+    return conn
+
+
+def sqlite_file_id(path: str) -> Optional[Hashable]:
+    """Identity of the file at `path`; changes when it is replaced (os.replace of a fresh export)."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_dev, st.st_ino
+
+
+class SQLitePool:
+    """
+    One long-lived SQLite connection per thread. `max_size` bounds how many
+    threads may hold a connection at the same time; further checkouts wait up
+    to `timeout` seconds. Connections owned by threads that have exited are
+    closed the next time a connection is created, so the factory must open
+    them with check_same_thread=False. With `generation` (e.g. sqlite_file_id),
+    a connection is reopened when the value changes, so replacing the database
+    file takes effect without a restart.
+    """
+
+    backend = "sqlite"
+
+    def __init__(self, factory: Callable[[], sqlite3.Connection], max_size: int = 8,
+                 timeout: float = 30.0, health_check_interval: float = 30.0,
+                 generation: Optional[Callable[[], Hashable]] = None):
+        self.factory = factory
+        self.max_size = max_size
+        self.timeout = timeout
+        self.health_check_interval = health_check_interval
+        self.generation = generation
+        self.metrics = PoolMetrics()
+        self._slots = threading.BoundedSemaphore(max_size)
+        self._local = threading.local()
+        self._owners: Dict[threading.Thread, sqlite3.Connection] = {}
+        self._owners_lock = threading.Lock()
+
+    def _healthy(self, conn) -> bool:
+        try:
+            conn.execute("SELECT 1").fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def _thread_connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        now = time.monotonic()
+        gen = self.generation() if self.generation is not None else None
+        if conn is not None and gen != self._local.generation:
+            self._discard(threading.current_thread())
+            conn = None
+        if conn is not None and now - self._local.checked_at >= self.health_check_interval:
+            if not self._healthy(conn):
+                self._discard(threading.current_thread())
+                conn = None
+            self._local.checked_at = now
+        if conn is None:
+            self._prune_dead_threads()
+            conn = self.factory()
+            self._local.conn = conn
+            self._local.checked_at = now
+            self._local.generation = gen
+            with self._owners_lock:
+                self._owners[threading.current_thread()] = conn
+            self.metrics.incr("created")
+        return conn
+
+    def _discard(self, owner: threading.Thread):
+        with self._owners_lock:
+            conn = self._owners.pop(owner, None)
+        if conn is None:
+            return
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+        if owner is threading.current_thread():
+            self._local.conn = None
+        self.metrics.incr("discarded")
+
+    def _prune_dead_threads(self):
+        with self._owners_lock:
+            dead = [t for t in self._owners if not t.is_alive()]
+        for t in dead:
+            self._discard(t)
+
+    @contextmanager
+    def connection(self):
+        start = time.perf_counter()
+        if not self._slots.acquire(timeout=self.timeout):
+            self.metrics.incr("timeouts")
+            raise PoolTimeout(f"No SQLite connection slot free after {self.timeout}s")
+        self.metrics.checked_out(time.perf_counter() - start)
+        try:
+            conn = self._thread_connection()
+            try:
+                yield conn
+            finally:
+                if conn.in_transaction:
+                    conn.rollback()
+        finally:
+            self.metrics.checked_in()
+            self._slots.release()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._owners_lock:
+            open_conns = len(self._owners)
+        return {"backend": self.backend, "max_size": self.max_size, "open": open_conns, **self.metrics.snapshot()}
+
+    def close(self):
+        with self._owners_lock:
+            owners = list(self._owners)
+        for t in owners:
+            self._discard(t)
+
+
+class PostgresPool:
+    """
+    Bounded psycopg2 pool. Connections are created lazily up to `max_size`;
+    checkouts beyond that wait up to `timeout` seconds. A connection idle for
+    longer than `health_check_interval` is pinged before it is handed out.
+    """
+
+    backend = "postgres"
+
+    def __init__(self, factory: Callable[[], Any], max_size: int = 10,
+                 timeout: float = 30.0, health_check_interval: float = 30.0):
+        self.factory = factory
+        self.max_size = max_size
+        self.timeout = timeout
+        self.health_check_interval = health_check_interval
+        self.metrics = PoolMetrics()
+        self._cond = threading.Condition()
+        self._idle: List[Tuple[Any, float]] = []  # (conn, last_used)
+        self._size = 0
+
+    def _healthy(self, conn) -> bool:
+        if conn.closed:
+            return False
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except Exception:
+            return False
+
+    def _acquire(self):
+        deadline = time.monotonic() + self.timeout
+        with self._cond:
+            while True:
+                if self._idle:
+                    return self._idle.pop()
+                if self._size < self.max_size:
+                    self._size += 1
+                    return None
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.metrics.incr("timeouts")
+                    raise PoolTimeout(f"No Postgres connection free after {self.timeout}s")
+                self._cond.wait(remaining)
+
+    def _release(self, conn):
+        with self._cond:
+            if conn is None:
+                self._size -= 1
+            else:
+                self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    def _discard(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+        self.metrics.incr("discarded")
+
+    @contextmanager
+    def connection(self):
+        start = time.perf_counter()
+        entry = self._acquire()
+        conn = None
+        try:
+            if entry is not None:
+                conn, last_used = entry
+                if time.monotonic() - last_used >= self.health_check_interval and not self._healthy(conn):
+                    self._discard(conn)
+                    conn = None
+            if conn is None:
+                conn = self.factory()
+                self.metrics.incr("created")
+        except Exception:
+            self._release(None)
+            raise
+        self.metrics.checked_out(time.perf_counter() - start)
+        try:
+            yield conn
+        except Exception:
+            # A failed statement leaves the transaction aborted; reset it, and
+            # drop the connection entirely if that does not work.
+            try:
+                conn.rollback()
+            except Exception:
+                self._discard(conn)
+                conn = None
+            raise
+        else:
+            try:
+                conn.rollback()
+            except Exception:
+                self._discard(conn)
+                conn = None
+        finally:
+            self.metrics.checked_in()
+            self._release(None if conn is None or conn.closed else conn)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            size, idle = self._size, len(self._idle)
+        return {"backend": self.backend, "max_size": self.max_size, "open": size, "idle": idle,
+                **self.metrics.snapshot()}
+
+    def close(self):
+        with self._cond:
+            idle, self._idle = self._idle, []
+            self._size -= len(idle)
+        for conn, _ in idle:
+            self._discard(conn)
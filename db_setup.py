@@ -1,21 +1,29 @@
-import sqlite3
-from faker import Faker
-import random
+"""
+Create company.db with synthetic data.
+
+    python db_setup.py                          # 30 projects, 200 customers, 50 employees, 1000 sales
+    python db_setup.py --scale 100              # 100k sales
+    python db_setup.py --scale 10000 --db big.db --anchor-date 2025-01-01
 
-fake = Faker()
-conn = sqlite3.connect("company.db")
-cur = conn.cursor()
+Rows come from data_gen (seeded, generated in parallel processes) and are
+written with executemany() in one transaction, with journaling and syncing
+turned off for the load and restored afterwards.
+"""
+import time
+import sqlite3
+import argparse
+import multiprocessing
+from datetime import date
 
+from aggregates import DROP_SQL as DROP_SUMMARIES, refresh as refresh_aggregates
+from data_gen import COLUMNS, TABLES, add_generator_args, iter_rows, table_sizes
 
-cur.executescript("""
+SCHEMA = DROP_SUMMARIES + """
 DROP TABLE IF EXISTS sales;
 DROP TABLE IF EXISTS employees;
 DROP TABLE IF EXISTS customers;
 DROP TABLE IF EXISTS projects;
-""")
 
-
-cur.executescript("""
 CREATE TABLE projects (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
     name TEXT,
@@ -31,7 +39,6 @@ CREATE TABLE customers (
     join_date DATE
 );
 
-                  
 CREATE TABLE employees (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
     name TEXT,
@@ -50,49 +57,55 @@ CREATE TABLE sales (
     FOREIGN KEY(customer_id) REFERENCES customers(id),
     FOREIGN KEY(employee_id) REFERENCES employees(id)
 );
-""")
-
-PROJECTS = 30
-CUSTOMERS = 200
-EMPLOYEES = 50
-SALES = 1000
-
-for _ in range(PROJECTS):
-    start_date = fake.date_between('-2y', 'today')
-    end_date = fake.date_between(start_date, '+1y')
-    cur.execute(
-        "INSERT INTO projects (name, start_date, end_date, budget) VALUES (?, ?, ?, ?)",
-        (fake.bs().title(), start_date, end_date, random.randint(100000, 1000000))
-    )
-
-for _ in range(CUSTOMERS):
-    cur.execute(
-        "INSERT INTO customers (name, city, join_date) VALUES (?, ?, ?)",
-        (fake.name(), fake.city(), fake.date_between('-3y', 'today'))
-    )
-
-for _ in range(EMPLOYEES):
-    cur.execute(
-        "INSERT INTO employees (name, role, salary, project_id) VALUES (?, ?, ?, ?)",
-        (
-            fake.name(),
-            random.choice(['Manager', 'Analyst', 'Sales Executive', 'Engineer']),
-            random.randint(40000, 120000),
-            random.randint(1, PROJECTS)
-        )
-    )
-
-for _ in range(SALES):
-    cur.execute(
-        "INSERT INTO sales (customer_id, employee_id, amount, sale_date) VALUES (?, ?, ?, ?)",
-        (
-            random.randint(1, CUSTOMERS),
-            random.randint(1, EMPLOYEES),
-            random.randint(500, 10000),
-            fake.date_between('-2y', 'today')
-        )
-    )
-
-conn.commit()
-conn.close()
-print("company.db created successfully with fake random data")
+"""
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", default="company.db")
+    parser.add_argument("--aggregates", action="store_true", help="also build the summary tables (aggregates.py)")
+    add_generator_args(parser)
+    args = parser.parse_args()
+
+    sizes = table_sizes(args.scale)
+    anchor = date.fromisoformat(args.anchor_date)
+    started = time.perf_counter()
+
+    conn = sqlite3.connect(args.db, isolation_level=None)
+    # bulk-load settings: a crash mid-load just means re-running the script
+    conn.execute("PRAGMA journal_mode = OFF")
+    conn.execute("PRAGMA synchronous = OFF")
+    conn.execute("PRAGMA cache_size = -262144")  # 256 MB
+    conn.execute("PRAGMA temp_store = MEMORY")
+    conn.executescript(SCHEMA)
+
+    pool = multiprocessing.Pool(args.workers) if args.workers > 1 else None
+    try:
+        conn.execute("BEGIN")
+        for table in TABLES:
+            t0 = time.perf_counter()
+            cols = COLUMNS[table]
+            insert = f"INSERT INTO {table} ({', '.join(cols)}) VALUES ({', '.join('?' * len(cols))})"
+            for rows in iter_rows(table, sizes, args.seed, anchor, pool):
+                conn.executemany(insert, rows)
+            print(f"{table:10s} {sizes[table]:>12,d} rows  {time.perf_counter() - t0:8.1f} s")
+        conn.execute("COMMIT")
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    conn.execute("PRAGMA journal_mode = DELETE")
+    conn.execute("PRAGMA synchronous = FULL")
+    if args.aggregates:
+        t0 = time.perf_counter()
+        refresh_aggregates(conn, "sqlite", rebuild=True)
+        print(f"aggregates {time.perf_counter() - t0:22.1f} s")
+    conn.execute("ANALYZE")
+    conn.close()
+    print(f"{args.db} created with fake random data (scale {args.scale:g}, seed {args.seed}) "
+          f"in {time.perf_counter() - started:.1f} s")
+
+
+if __name__ == "__main__":
+    main()
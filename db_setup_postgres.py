@@ -1,11 +1,27 @@
 # db_setup_postgres.py
+"""
+Create the company tables in Postgres and bulk-load synthetic data.
+
+    python db_setup_postgres.py --scale 100 --seed 42 --anchor-date 2025-01-01
+
+Rows come from the same data_gen chunks as db_setup.py, so the same --scale,
+--seed and --anchor-date give both backends identical data. Each table is
+streamed through one COPY FROM STDIN; primary keys, foreign keys and the
+sequences are set up after the load, followed by ANALYZE.
+"""
 import os
+import time
+import argparse
+import multiprocessing
+from datetime import date
+from typing import Iterable, Iterator, List
+
 from dotenv import load_dotenv
 load_dotenv()
 import psycopg2
-from faker import Faker
-import random
-from datetime import date, timedelta
+
+from aggregates import DROP_SQL as DROP_SUMMARIES
+from data_gen import COLUMNS, TABLES, add_generator_args, iter_rows, table_sizes
 
 PG_HOST = os.getenv("PG_HOST", "localhost")
 PG_PORT = os.getenv("PG_PORT", "5432")
@@ -13,83 +29,126 @@ PG_DATABASE = os.getenv("PG_DATABASE", "company")
 PG_USER = os.getenv("PG_USER", "postgres")
 PG_PASSWORD = os.getenv("PG_PASSWORD", "")
 
-conn = psycopg2.connect(host=PG_HOST, port=PG_PORT, dbname=PG_DATABASE, user=PG_USER, password=PG_PASSWORD)
-cur = conn.cursor()
-
-
-# Drop/create tables
-cur.execute("""
+# Tables are created bare; keys are added once the rows are in.
+SCHEMA = DROP_SUMMARIES + """
 DROP TABLE IF EXISTS sales;
 DROP TABLE IF EXISTS employees;
 DROP TABLE IF EXISTS customers;
 DROP TABLE IF EXISTS projects;
-""")
 
-cur.execute("""
 CREATE TABLE projects (
-    id SERIAL PRIMARY KEY,
+    id SERIAL,
     name TEXT,
     start_date DATE,
     end_date DATE,
     budget INTEGER
 );
-""")
-cur.execute("""
+
 CREATE TABLE customers (
-    id SERIAL PRIMARY KEY,
+    id SERIAL,
     name TEXT,
     city TEXT,
     join_date DATE
 );
-""")
-cur.execute("""
+
 CREATE TABLE employees (
-    id SERIAL PRIMARY KEY,
+    id SERIAL,
     name TEXT,
     role TEXT,
     salary INTEGER,
-    project_id INTEGER REFERENCES projects(id)
+    project_id INTEGER
 );
-""")
-cur.execute("""
+
 CREATE TABLE sales (
-    id SERIAL PRIMARY KEY,
-    customer_id INTEGER REFERENCES customers(id),
-    employee_id INTEGER REFERENCES employees(id),
+    id SERIAL,
+    customer_id INTEGER,
+    employee_id INTEGER,
     amount INTEGER,
     sale_date DATE
 );
-""")
-conn.commit()
-
-# Populate
-fake = Faker()
-NUM_PROJECTS = 30
-NUM_CUSTOMERS = 200
-NUM_EMPLOYEES = 50
-NUM_SALES = 1000
-
-for _ in range(NUM_PROJECTS):
-    start = fake.date_between(start_date='-2y', end_date='today')
-    end = fake.date_between(start_date=start, end_date='+1y')
-    cur.execute("INSERT INTO projects (name, start_date, end_date, budget) VALUES (%s,%s,%s,%s)",
-                (fake.bs().title(), start, end, random.randint(100000, 1000000)))
-
-for _ in range(NUM_CUSTOMERS):
-    cur.execute("INSERT INTO customers (name, city, join_date) VALUES (%s,%s,%s)",
-                (fake.name(), fake.city(), fake.date_between(start_date='-3y', end_date='today')))
-
-for _ in range(NUM_EMPLOYEES):
-    cur.execute("INSERT INTO employees (name, role, salary, project_id) VALUES (%s,%s,%s,%s)",
-                (fake.name(), random.choice(['Manager','Analyst','Sales Executive','Engineer']),
-                 random.randint(40000,120000), random.randint(1,NUM_PROJECTS)))
-
-for _ in range(NUM_SALES):
-    cur.execute("INSERT INTO sales (customer_id, employee_id, amount, sale_date) VALUES (%s,%s,%s,%s)",
-                (random.randint(1,NUM_CUSTOMERS), random.randint(1,NUM_EMPLOYEES),
-                 random.randint(500,10000), fake.date_between(start_date='-2y', end_date='today')))
-
-conn.commit()
-cur.close()
-conn.close()
-print("Postgres DB populated.")
+"""
+
+CONSTRAINTS = """
+ALTER TABLE projects ADD PRIMARY KEY (id);
+ALTER TABLE customers ADD PRIMARY KEY (id);
+ALTER TABLE employees ADD PRIMARY KEY (id);
+ALTER TABLE sales ADD PRIMARY KEY (id);
+ALTER TABLE employees ADD FOREIGN KEY (project_id) REFERENCES projects(id);
+ALTER TABLE sales ADD FOREIGN KEY (customer_id) REFERENCES customers(id);
+ALTER TABLE sales ADD FOREIGN KEY (employee_id) REFERENCES employees(id);
+"""
+
+
+def _copy_field(value) -> str:
+    if value is None:
+        return "\\N"
+    return str(value).replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n").replace("\r", "\\r")
+
+
+class CopyStream:
+    """File-like reader that renders row chunks as COPY text format on demand."""
+
+    def __init__(self, chunks: Iterable[List[tuple]]):
+        self._chunks: Iterator[List[tuple]] = iter(chunks)
+        self._buffer = ""
+        self.rows = 0
+
+    def read(self, size: int = -1) -> str:
+        while size < 0 or len(self._buffer) < size:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                break
+            self.rows += len(chunk)
+            self._buffer += "".join("\t".join(_copy_field(v) for v in row) + "\n" for row in chunk)
+        if size < 0:
+            out, self._buffer = self._buffer, ""
+        else:
+            out, self._buffer = self._buffer[:size], self._buffer[size:]
+        return out
+
+    readline = read
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_generator_args(parser)
+    args = parser.parse_args()
+
+    sizes = table_sizes(args.scale)
+    anchor = date.fromisoformat(args.anchor_date)
+    started = time.perf_counter()
+
+    conn = psycopg2.connect(host=PG_HOST, port=PG_PORT, dbname=PG_DATABASE, user=PG_USER, password=PG_PASSWORD)
+    cur = conn.cursor()
+    cur.execute("SET synchronous_commit = off")
+    cur.execute("SET maintenance_work_mem = '512MB'")  # faster key builds after the load
+    cur.execute(SCHEMA)
+
+    pool = multiprocessing.Pool(args.workers) if args.workers > 1 else None
+    try:
+        for table in TABLES:
+            t0 = time.perf_counter()
+            stream = CopyStream(iter_rows(table, sizes, args.seed, anchor, pool))
+            cur.copy_expert(f"COPY {table} ({', '.join(COLUMNS[table])}) FROM STDIN", stream, size=1 << 20)
+            print(f"{table:10s} {stream.rows:>12,d} rows  {time.perf_counter() - t0:8.1f} s")
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    t0 = time.perf_counter()
+    cur.execute(CONSTRAINTS)
+    for table in TABLES:
+        cur.execute(f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), (SELECT MAX(id) FROM {table}))")
+    conn.commit()
+    print(f"keys       {time.perf_counter() - t0:22.1f} s")
+
+    conn.autocommit = True
+    cur.execute("ANALYZE")
+    cur.close()
+    conn.close()
+    print(f"Postgres DB populated (scale {args.scale:g}, seed {args.seed}) in {time.perf_counter() - started:.1f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,248 @@
+import time
+import sqlite3
+import threading
+from typing import Any, Dict, List, Optional
+
+from query_cache import normalize_question
+from schema_index import BM25Index, tokenize
+
+
+def question_key(question: str) -> str:
+    """Exact-match key: the normalized question with its number literals."""
+    template, numbers = normalize_question(question)
+    return template + "|" + ",".join(numbers)
+
+
+class ExampleStore:
+    """
+    Persisted (question, SQL, success, latency) records from past executions.
+    Successful records are kept in a BM25 index over the question text so the
+    closest ones can be shown to the SQL Generator as few-shot examples, and an
+    exact question match (same backend and schema fingerprint) can reuse its
+    SQL without calling the LLM. The store holds at most `max_entries` records
+    (failures are evicted first, then the least recently used) and drops
+    records unused for `max_age` seconds.
+
+    Several worker processes can share one file: ids are assigned by SQLite,
+    and every `sync_interval` seconds rows added or used by other processes
+    are merged in. With `shared` (a SharedCache) the records live in an
+    `examples` table of the shared cache file and `path` is not used.
+    """
+
+    def __init__(self, path: str = "", max_entries: int = 5000, max_age: float = 90 * 86400.0, shared=None,
+                 sync_interval: float = 2.0):
+        self.max_entries = max_entries
+        self.max_age = max_age
+        if shared is not None:
+            path = shared.path
+        self.path = path
+        self.shared = shared
+        self.sync_interval = sync_interval
+        self._lock = threading.Lock()
+        self._records: Dict[int, Dict[str, Any]] = {}
+        self._by_sql: Dict[tuple, int] = {}  # (key, backend, sql) -> id
+        self._by_key: Dict[tuple, set] = {}  # (key, backend) -> ids
+        self._index = BM25Index()
+        self._max_id = 0  # highest id read from the file
+        self._synced_at = 0.0  # wall-clock time of the last read
+        self.exact_hits = 0
+        self.similar_hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        self._disk = None
+        if path:
+            self._disk = sqlite3.connect(path, timeout=5.0, check_same_thread=False)
+            self._disk.execute("PRAGMA journal_mode = WAL")  # other workers' reads never block on a write
+            self._disk.execute("""
+                CREATE TABLE IF NOT EXISTS examples (
+                    id INTEGER PRIMARY KEY,
+                    question TEXT NOT NULL,
+                    question_key TEXT NOT NULL,
+                    backend TEXT NOT NULL,
+                    fingerprint TEXT,
+                    sql_query TEXT NOT NULL,
+                    success INTEGER NOT NULL,
+                    latency_ms REAL NOT NULL,
+                    uses INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_used REAL NOT NULL
+                )
+            """)
+            self._disk.commit()
+            self._load()
+
+    _COLUMNS = ("id", "question", "question_key", "backend", "fingerprint", "sql_query", "success",
+                "latency_ms", "uses", "created_at", "last_used")
+
+    def _load(self):
+        with self._lock:
+            self._sync(force=True)
+            self._enforce_limits(time.time())
+            self._disk.commit()  # do not hold the write lock until the next record()
+
+    def _sync(self, force: bool = False):
+        """Merge rows other processes added or used since the last read. Caller holds the lock."""
+        now = time.time()
+        if self._disk is None or (not force and now - self._synced_at < self.sync_interval):
+            return
+        try:
+            rows = self._disk.execute(
+                f"SELECT {', '.join(self._COLUMNS)} FROM examples WHERE id > ? OR last_used >= ? ORDER BY id",
+                (self._max_id, self._synced_at - 1.0),  # slack for clock steps between processes
+            ).fetchall()
+        except sqlite3.Error:
+            return  # keep serving what this process has; the next call retries
+        self._synced_at = now
+        for row in rows:
+            rec = dict(zip(self._COLUMNS, row))
+            rec["success"] = bool(rec["success"])
+            self._max_id = max(self._max_id, rec["id"])
+            other = self._by_sql.get((rec["question_key"], rec["backend"], rec["sql_query"]))
+            if other is not None and other != rec["id"]:
+                continue  # two processes recorded the same pair at once; keep the one we have
+            self._remember(rec)
+
+    def _remember(self, rec: Dict[str, Any]):
+        self._records[rec["id"]] = rec
+        self._by_sql[(rec["question_key"], rec["backend"], rec["sql_query"])] = rec["id"]
+        self._by_key.setdefault((rec["question_key"], rec["backend"]), set()).add(rec["id"])
+        if rec["success"]:
+            self._index.add(str(rec["id"]), tokenize(rec["question"]))
+        else:
+            self._index.remove(str(rec["id"]))
+
+    def _forget_local(self, i: int):
+        rec = self._records.pop(i)
+        if self._by_sql.get((rec["question_key"], rec["backend"], rec["sql_query"])) == i:
+            del self._by_sql[(rec["question_key"], rec["backend"], rec["sql_query"])]
+        ids_for_key = self._by_key.get((rec["question_key"], rec["backend"]))
+        if ids_for_key is not None:
+            ids_for_key.discard(i)
+            if not ids_for_key:
+                del self._by_key[(rec["question_key"], rec["backend"])]
+        self._index.remove(str(i))
+
+    def _forget(self, ids: List[int]):
+        for i in ids:
+            self._forget_local(i)
+        self.evictions += len(ids)
+        if self._disk is not None and ids:
+            self._disk.executemany("DELETE FROM examples WHERE id = ?", [(i,) for i in ids])
+
+    def _enforce_limits(self, now: float):
+        expired = [i for i, r in self._records.items() if now - r["last_used"] > self.max_age]
+        self._forget(expired)
+        excess = len(self._records) - self.max_entries
+        if excess > 0:
+            order = sorted(self._records.values(), key=lambda r: (r["success"], r["last_used"]))
+            self._forget([r["id"] for r in order[:excess]])
+
+    def _persist(self, rec: Dict[str, Any]):
+        """Write a record; a new one (id None) gets its id from SQLite."""
+        if self._disk is None:
+            return
+        cols = self._COLUMNS[1:]
+        values = [int(rec[c]) if c == "success" else rec[c] for c in cols]
+        if rec["id"] is not None:
+            cur = self._disk.execute(f"UPDATE examples SET {', '.join(f'{c} = ?' for c in cols)} WHERE id = ?",
+                                     values + [rec["id"]])
+            if cur.rowcount:
+                return
+            self._forget_local(rec["id"])  # evicted by another process: store it again
+        cur = self._disk.execute(f"INSERT INTO examples ({', '.join(cols)}) VALUES ({', '.join('?' * len(cols))})",
+                                 values)
+        rec["id"] = cur.lastrowid
+        self._max_id = max(self._max_id, rec["id"])
+
+    def record(self, question: str, backend: str, fingerprint: Optional[str], sql_query: str,
+               success: bool, latency_ms: float):
+        """Add an execution; repeats of the same question and SQL update the existing record."""
+        key = question_key(question)
+        now = time.time()
+        with self._lock:
+            self._sync()
+            rid = self._by_sql.get((key, backend, sql_query))
+            if rid is not None:
+                rec = dict(self._records[rid])
+                rec["uses"] += 1
+                rec["latency_ms"] += (latency_ms - rec["latency_ms"]) / rec["uses"]
+                rec.update(success=success, fingerprint=fingerprint, last_used=now)
+            else:
+                rec = {
+                    "id": None, "question": question.strip(), "question_key": key, "backend": backend,
+                    "fingerprint": fingerprint, "sql_query": sql_query, "success": success,
+                    "latency_ms": latency_ms, "uses": 1, "created_at": now, "last_used": now,
+                }
+            try:
+                self._persist(rec)
+                if rec["id"] is None:  # memory only
+                    rec["id"] = self._max_id = self._max_id + 1
+                self._remember(rec)
+                self.stores += 1
+                self._enforce_limits(now)
+            finally:
+                if self._disk is not None:
+                    self._disk.commit()
+
+    def lookup(self, question: str, backend: str, fingerprint: Optional[str], k: int = 3,
+               exact: bool = True) -> Dict[str, Any]:
+        """
+        Return {'exact': record or None, 'similar': [records]} for a question.
+        'exact' is the most used successful record for the same question, backend
+        and schema fingerprint; 'similar' holds up to k successful records for
+        other questions on the same backend and fingerprint, closest first.
+        """
+        key = question_key(question)
+        with self._lock:
+            self._sync()
+            match = None
+            if exact and fingerprint is not None:
+                candidates = [self._records[i] for i in self._by_key.get((key, backend), ())]
+                candidates = [r for r in candidates if r["fingerprint"] == fingerprint and r["success"]]
+                if candidates:
+                    match = dict(max(candidates, key=lambda r: (r["uses"], r["last_used"])))
+            similar = []
+            if k > 0:
+                scored = self._index.scores(tokenize(question))
+                for doc_id, _ in sorted(scored.items(), key=lambda kv: (-kv[1], kv[0])):
+                    rec = self._records[int(doc_id)]
+                    if rec["backend"] != backend or rec["question_key"] == key:
+                        continue
+                    if rec["fingerprint"] != fingerprint:  # SQL written for another schema
+                        continue
+                    if any(s["sql_query"] == rec["sql_query"] for s in similar):
+                        continue
+                    similar.append(dict(rec))
+                    if len(similar) >= k:
+                        break
+            if match is not None:
+                self.exact_hits += 1
+            elif similar:
+                self.similar_hits += 1
+            else:
+                self.misses += 1
+        return {"exact": match, "similar": similar}
+
+    def clear(self):
+        with self._lock:
+            self._records.clear()
+            self._by_sql.clear()
+            self._by_key.clear()
+            self._index = BM25Index()
+            if self._disk is not None:
+                self._disk.execute("DELETE FROM examples")
+                self._disk.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "entries": len(self._records),
+                "successful": len(self._index),
+                "exact_hits": self.exact_hits,
+                "similar_hits": self.similar_hits,
+                "misses": self.misses,
+                "stores": self.stores,
+                "evictions": self.evictions,
+                "persistent": self._disk is not None,
+            }
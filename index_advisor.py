@@ -0,0 +1,483 @@
+"""
+Workload-driven index advisor.
+
+The app appends every executed statement to a workload log (WORKLOAD_LOG_PATH).
+This script aggregates the join keys, filter predicates, grouping/ordering and
+other columns the logged statements touch, proposes covering indexes for the
+configured backend, and replays the workload before and after creating them.
+
+    python index_advisor.py                      # propose, measure on a copy / rolled-back transaction
+    python index_advisor.py --apply              # create the indexes for real
+    python index_advisor.py --from-corpus benchmarks/question_corpus.json
+"""
+import os
+import re
+import sys
+import time
+import json
+import atexit
+import sqlite3
+import argparse
+import tempfile
+import threading
+from statistics import median
+from typing import Any, Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+from query_guard import statement_timeout, table_aliases
+from result_cache import normalize_sql
+from schema_catalog import introspect_postgres, introspect_sqlite
+
+COVER_MAX_COLUMNS = 4  # key + covered columns per proposed index
+
+TOKEN_RE = re.compile(r"'(?:[^']|'')*'|\"\w+\"(?:\.\"?\w+\"?)?|\w+(?:\.\w+)?|<=|>=|<>|!=|[=<>(),*]|\S")
+CLAUSES = {"SELECT": "select", "FROM": "from", "JOIN": "from", "ON": "on", "WHERE": "where", "GROUP": "group",
+           "ORDER": "order", "HAVING": "having", "LIMIT": "limit", "UNION": None, "WITH": None}
+KEYWORDS = {"AND", "OR", "NOT", "IN", "IS", "NULL", "AS", "BY", "ASC", "DESC", "BETWEEN", "LIKE", "EXISTS",
+            "CASE", "WHEN", "THEN", "ELSE", "END", "DISTINCT", "LEFT", "RIGHT", "INNER", "OUTER", "CROSS",
+            "OFFSET", "ALL", "USING", "NATURAL", "TRUE", "FALSE"}
+RANGE_OPS = {"<", ">", "<=", ">=", "BETWEEN", "LIKE", "<>", "!="}
+
+
+class WorkloadLog:
+    """
+    Append-only log of executed statements in a SQLite file. record() only
+    appends to an in-memory buffer; a background thread writes it out in
+    batches every `flush_interval` seconds (sooner once `flush_every` records
+    are waiting), so logging stays off the query path. Write failures (a
+    read-only directory, a file locked by another worker) drop that batch and
+    are counted in `errors`; at most `max_buffer` records wait, newer ones are
+    dropped and counted in `dropped`.
+    """
+
+    def __init__(self, path: str, flush_every: int = 50, flush_interval: float = 2.0, max_buffer: int = 10000):
+        self.path = path
+        self.flush_every = flush_every
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+        self._lock = threading.Lock()  # guards the buffer
+        self._write_lock = threading.Lock()  # guards the connection
+        self._buffer: List[Tuple] = []
+        self._wake = threading.Event()
+        self.errors = 0
+        self.dropped = 0
+        self._conn = sqlite3.connect(path, timeout=1.0, check_same_thread=False)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS workload (
+                sql TEXT NOT NULL,
+                backend TEXT NOT NULL,
+                duration_ms REAL NOT NULL,
+                row_count INTEGER NOT NULL,
+                executed_at REAL NOT NULL
+            )
+        """)
+        self._conn.commit()
+        threading.Thread(target=self._flusher, name="workload-log", daemon=True).start()
+        atexit.register(self.flush)
+
+    def record(self, sql: str, backend: str, duration_ms: float, row_count: int):
+        try:
+            row = (normalize_sql(sql), backend, duration_ms, row_count, time.time())
+        except Exception:
+            self.errors += 1
+            return
+        with self._lock:
+            if len(self._buffer) >= self.max_buffer:
+                self.dropped += 1
+                return
+            self._buffer.append(row)
+            due = len(self._buffer) >= self.flush_every
+        if due:
+            self._wake.set()
+
+    def _flusher(self):
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            rows, self._buffer = self._buffer, []
+        if not rows:
+            return
+        with self._write_lock:
+            try:
+                self._conn.executemany("INSERT INTO workload VALUES (?, ?, ?, ?, ?)", rows)
+                self._conn.commit()
+            except sqlite3.Error:
+                if self._conn.in_transaction:
+                    self._conn.rollback()
+                self.errors += 1
+                self.dropped += len(rows)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"path": self.path, "buffered": len(self._buffer), "errors": self.errors, "dropped": self.dropped}
+
+    def statements(self, backend: str) -> List[Dict[str, Any]]:
+        """Distinct logged statements for a backend with execution count and total time."""
+        self.flush()
+        with self._write_lock:
+            rows = self._conn.execute("""
+                SELECT sql, COUNT(*), SUM(duration_ms) FROM workload WHERE backend = ?
+                GROUP BY sql ORDER BY SUM(duration_ms) DESC
+            """, (backend,)).fetchall()
+        return [{"sql": s, "count": n, "total_ms": t} for s, n, t in rows]
+
+
+def _columns(catalog: Dict[str, Any]) -> Dict[str, Dict[str, bool]]:
+    """table -> {column: is primary key}, all lower-cased."""
+    return {t.lower(): {c["name"].lower(): c["primary_key"] for c in info["columns"]}
+            for t, info in catalog["tables"].items()}
+
+
+def analyze_statement(stmt: str, catalog: Dict[str, Any]) -> Dict[str, Dict[str, set]]:
+    """
+    Columns a statement uses, per table and role: 'join' (equality between two
+    tables), 'eq' and 'range' (filters), 'function' (wrapped in a function, so
+    a plain index cannot serve it), 'group', 'order' and 'other' (selected or
+    aggregated).
+    """
+    columns = _columns(catalog)
+    aliases = {a: t.lower() for a, t in table_aliases(stmt).items() if t.lower() in columns}
+    tables = set(aliases.values())
+    tokens = [t.replace('"', "") for t in TOKEN_RE.findall(stmt)]
+    usage: Dict[str, Dict[str, set]] = {}
+
+    def resolve(tok: str) -> Optional[Tuple[str, str]]:
+        if tok.upper() in KEYWORDS or tok.upper() in CLAUSES or tok[0] in "'0123456789":
+            return None
+        if "." in tok:
+            q, c = tok.lower().split(".", 1)
+            t = aliases.get(q)
+            return (t, c) if t and c in columns[t] else None
+        owners = [t for t in tables if tok.lower() in columns[t]]
+        return (owners[0], tok.lower()) if len(owners) == 1 else None
+
+    def use(table: str, column: str, role: str):
+        usage.setdefault(table, {}).setdefault(role, set()).add(column)
+
+    clause = None
+    calls: List[Optional[str]] = []  # enclosing parentheses: function name, or None for grouping
+    for i, tok in enumerate(tokens):
+        up = tok.upper()
+        if tok == "(":
+            prev = tokens[i - 1].upper() if i else ""
+            is_call = re.match(r'^\w+$', prev) and prev not in KEYWORDS and prev not in CLAUSES
+            calls.append(prev if is_call else None)
+            continue
+        if tok == ")":
+            if calls:
+                calls.pop()
+            continue
+        if up in CLAUSES:
+            clause = CLAUSES[up]
+            continue
+        if clause in (None, "from", "limit"):
+            continue
+        ref = resolve(tok)
+        if ref is None:
+            continue
+        table, column = ref
+        if clause in ("select", "having"):
+            use(table, column, "other")
+        elif clause in ("group", "order"):
+            use(table, column, clause)
+        else:
+            nxt = tokens[i + 1].upper() if i + 1 < len(tokens) else ""
+            other = resolve(tokens[i + 2]) if nxt == "=" and i + 2 < len(tokens) else None
+            if any(calls):
+                use(table, column, "function")
+            elif other is not None and other[0] != table:
+                use(table, column, "join")
+                use(other[0], other[1], "join")
+            elif tokens[i - 2:i] and tokens[i - 1] == "=":
+                prior = resolve(tokens[i - 2]) if i > 1 else None
+                use(table, column, "join" if prior is not None and prior[0] != table else "eq")
+            elif nxt in ("=", "IN"):
+                use(table, column, "eq")
+            elif nxt in RANGE_OPS or nxt == "NOT":
+                use(table, column, "range")
+            else:
+                use(table, column, "other")
+    return usage
+
+
+def candidate_indexes(usage: Dict[str, Dict[str, set]], catalog: Dict[str, Any]) -> List[Tuple[str, tuple, tuple, str]]:
+    """(table, key columns, covered columns, 'join' | 'filter' | 'group') index candidates for one statement."""
+    columns = _columns(catalog)
+    out = []
+    for table, roles in usage.items():
+        pk = {c for c, is_pk in columns[table].items() if is_pk}
+        eq = sorted(roles.get("eq", set()) - pk)
+        rng = sorted(roles.get("range", set()) - pk)
+        joins = sorted(roles.get("join", set()) - pk)
+        used = set().union(*roles.values()) - pk
+
+        keys = []
+        for j in joins:
+            keys.append((tuple(eq) + (j,), "join"))
+        if eq or rng:
+            keys.append((tuple(eq) + tuple(rng[:1]), "filter"))
+        if not keys and roles.get("group"):
+            keys.append((tuple(sorted(roles["group"] - pk)), "group"))
+        for key, kind in keys:
+            if not key:
+                continue
+            covered = tuple(sorted(used - set(key)))
+            if len(key) + len(covered) > COVER_MAX_COLUMNS:
+                covered = ()
+            out.append((table, key, covered, kind))
+    return out
+
+
+def existing_indexes(conn, backend: str) -> Dict[str, List[List[str]]]:
+    """table -> column lists of its indexes (primary keys included)."""
+    out: Dict[str, List[List[str]]] = {}
+    if backend == "postgres":
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT t.relname, array_agg(a.attname ORDER BY k.ord)
+            FROM pg_index i
+            JOIN pg_class t ON t.oid = i.indrelid
+            JOIN pg_namespace n ON n.oid = t.relnamespace AND n.nspname = 'public'
+            CROSS JOIN LATERAL unnest(i.indkey::int2[]) WITH ORDINALITY AS k(attnum, ord)
+            JOIN pg_attribute a ON a.attrelid = t.oid AND a.attnum = k.attnum
+            GROUP BY t.relname, i.indexrelid
+        """)
+        for table, cols in cur.fetchall():
+            out.setdefault(table.lower(), []).append([c.lower() for c in cols])
+        cur.close()
+        return out
+    tables = [r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table' "
+                                         "AND name NOT LIKE 'sqlite_%'")]
+    for t in tables:
+        for idx in conn.execute(f'PRAGMA index_list("{t}")').fetchall():
+            cols = [r[2].lower() for r in conn.execute(f'PRAGMA index_info("{idx[1]}")') if r[2]]
+            out.setdefault(t.lower(), []).append(cols)
+    return out
+
+
+def table_rows(conn, backend: str) -> Dict[str, int]:
+    """Approximate row count per table (planner statistics on Postgres)."""
+    if backend == "postgres":
+        cur = conn.cursor()
+        cur.execute("SELECT c.relname, c.reltuples::bigint FROM pg_class c JOIN pg_namespace n "
+                    "ON n.oid = c.relnamespace WHERE n.nspname = 'public' AND c.relkind = 'r'")
+        out = {t.lower(): max(int(n), 0) for t, n in cur.fetchall()}
+        cur.close()
+        return out
+    tables = [r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table' "
+                                         "AND name NOT LIKE 'sqlite_%'")]
+    return {t.lower(): conn.execute(f'SELECT COUNT(*) FROM "{t}"').fetchone()[0] for t in tables}
+
+
+def propose_indexes(statements: List[Dict[str, Any]], catalog: Dict[str, Any],
+                    existing: Dict[str, List[List[str]]], max_indexes: int = 5,
+                    rows: Optional[Dict[str, int]] = None, min_rows: int = 1000) -> List[Dict[str, Any]]:
+    """
+    Score every candidate by the logged time of the statements that would use it,
+    fold candidates whose columns are a prefix of a wider one into it, and drop
+    those an existing index already provides. Tables smaller than `min_rows`
+    only get indexes for join lookups.
+    """
+    scored: Dict[Tuple[str, tuple, tuple], Dict[str, Any]] = {}
+    for s in statements:
+        for table, key, covered, kind in set(candidate_indexes(analyze_statement(s["sql"], catalog), catalog)):
+            entry = scored.setdefault((table, key, covered),
+                                      {"score_ms": 0.0, "statements": 0, "executions": 0, "join": False})
+            entry["join"] = entry["join"] or kind == "join"
+            entry["score_ms"] += s["total_ms"]
+            entry["statements"] += 1
+            entry["executions"] += s["count"]
+
+    def columns_of(c):
+        return list(c[1]) + list(c[2])
+
+    merged: Dict[Tuple[str, tuple, tuple], Dict[str, Any]] = {}
+    for cand in sorted(scored, key=lambda c: -len(columns_of(c))):
+        target = next((m for m in merged if m[0] == cand[0] and columns_of(m)[:len(cand[1])] == list(cand[1])
+                       and set(columns_of(cand)) <= set(columns_of(m))), None)
+        if target is None:
+            merged[cand] = dict(scored[cand])
+        else:
+            for k in ("score_ms", "statements", "executions"):
+                merged[target][k] += scored[cand][k]
+            merged[target]["join"] = merged[target]["join"] or scored[cand]["join"]
+
+    proposals = []
+    for (table, key, covered), entry in merged.items():
+        wanted = list(key) + list(covered)
+        if rows is not None and rows.get(table, 0) < min_rows and not entry["join"]:
+            continue
+        if any(idx[:len(wanted)] == wanted for idx in existing.get(table, [])):
+            continue
+        proposals.append({"table": table, "columns": list(key), "include": list(covered),
+                          **{k: v for k, v in entry.items() if k != "join"}})
+    proposals.sort(key=lambda p: (-p["score_ms"], p["table"], p["columns"]))
+    return proposals[:max_indexes]
+
+
+def index_ddl(proposal: Dict[str, Any], backend: str) -> str:
+    name = "idx_" + "_".join([proposal["table"]] + proposal["columns"] + proposal["include"])[:59]
+    if backend == "postgres":
+        include = f" INCLUDE ({', '.join(proposal['include'])})" if proposal["include"] else ""
+        return f'CREATE INDEX IF NOT EXISTS {name} ON {proposal["table"]} ({", ".join(proposal["columns"])}){include}'
+    cols = proposal["columns"] + proposal["include"]
+    return f'CREATE INDEX IF NOT EXISTS {name} ON "{proposal["table"]}" ({", ".join(cols)})'
+
+
+def apply_indexes(conn, proposals: List[Dict[str, Any]], backend: str) -> List[str]:
+    """Create the proposed indexes and refresh planner statistics. Does not commit."""
+    ddl = [index_ddl(p, backend) for p in proposals]
+    cur = conn.cursor()
+    for stmt in ddl:
+        cur.execute(stmt)
+    for table in sorted({p["table"] for p in proposals}):
+        cur.execute(f'ANALYZE "{table}"')
+    cur.close()
+    return ddl
+
+
+def replay(conn, statements: List[Dict[str, Any]], backend: str, repeat: int = 3,
+           timeout: float = 30.0) -> Dict[str, Optional[float]]:
+    """
+    Median wall time (ms) of each statement over `repeat` runs; None if it failed or timed out.
+    On Postgres each run is wrapped in a savepoint that is rolled back, so a failure or timeout
+    never rolls back the transaction holding the indexes being measured.
+    """
+    out: Dict[str, Optional[float]] = {}
+    for s in statements:
+        times = []
+        for _ in range(repeat):
+            cur = conn.cursor()
+            failed = False
+            if backend == "postgres":
+                cur.execute("SAVEPOINT replay")
+                cur.execute("SET LOCAL statement_timeout = %s", (int(timeout * 1000),))
+            started = time.perf_counter()
+            try:
+                if backend == "postgres":
+                    cur.execute(s["sql"])
+                    cur.fetchall()
+                else:
+                    with statement_timeout(conn, backend, timeout):
+                        cur.execute(s["sql"])
+                        cur.fetchall()
+            except Exception:
+                failed = True
+            elapsed = (time.perf_counter() - started) * 1000
+            if backend == "postgres":
+                # also undoes the SET LOCAL, so later DDL in this transaction runs without the limit
+                cur.execute("ROLLBACK TO SAVEPOINT replay")
+                cur.execute("RELEASE SAVEPOINT replay")
+            cur.close()
+            if failed:
+                times = []
+                break
+            times.append(elapsed)
+        out[s["sql"]] = median(times) if times else None
+    return out
+
+
+def print_report(statements, before, after, proposals, ddl):
+    print("\nProposed indexes:")
+    for p, stmt in zip(proposals, ddl):
+        print(f"  {stmt}\n      used by {p['statements']} statement(s), {p['executions']} execution(s), "
+              f"{p['score_ms']:.1f} ms logged")
+    print(f"\n{'before ms':>10s} {'after ms':>10s} {'speedup':>8s} {'runs':>5s}  statement")
+    total_before = total_after = 0.0
+    for s in statements:
+        b, a = before.get(s["sql"]), after.get(s["sql"])
+        if b is None or a is None:
+            print(f"{'-':>10s} {'-':>10s} {'-':>8s} {s['count']:5d}  {s['sql'][:90]}")
+            continue
+        total_before += b * s["count"]
+        total_after += a * s["count"]
+        print(f"{b:10.2f} {a:10.2f} {b / a if a else 0:7.1f}x {s['count']:5d}  {s['sql'][:90]}")
+    if total_after:
+        print(f"\nworkload (weighted by executions): {total_before:.1f} ms -> {total_after:.1f} ms "
+              f"({total_before / total_after:.1f}x)")
+
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workload", default=os.getenv("WORKLOAD_LOG_PATH") or "workload.db")
+    parser.add_argument("--from-corpus", help="use the SQL of a question corpus as the workload instead of the log")
+    parser.add_argument("--apply", action="store_true", help="create the indexes on the configured database")
+    parser.add_argument("--max-indexes", type=int, default=5)
+    parser.add_argument("--min-rows", type=int, default=1000, help="skip tables smaller than this")
+    parser.add_argument("--replay", type=int, default=20, help="replay the N most expensive statements")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    backend = os.getenv("DB_BACKEND", "sqlite").lower()
+    if args.from_corpus:
+        with open(args.from_corpus, encoding="utf-8") as f:
+            corpus = json.load(f)
+        key = "sql_postgres" if backend == "postgres" else "sql"
+        by_sql: Dict[str, Dict[str, Any]] = {}
+        for item in corpus:
+            sql = normalize_sql(item.get(key) or item["sql"])
+            by_sql.setdefault(sql, {"sql": sql, "count": 0, "total_ms": None})["count"] += 1
+        statements = list(by_sql.values())
+    else:
+        if not os.path.exists(args.workload):
+            sys.exit(f"No workload log at {args.workload}; run the app with WORKLOAD_LOG_PATH set first.")
+        statements = WorkloadLog(args.workload).statements(backend)
+    if not statements:
+        sys.exit("The workload is empty.")
+
+    if backend == "postgres":
+        import psycopg2
+        conn = psycopg2.connect(host=os.getenv("PG_HOST", "localhost"), port=os.getenv("PG_PORT", "5432"),
+                                dbname=os.getenv("PG_DATABASE", "company"), user=os.getenv("PG_USER", "postgres"),
+                                password=os.getenv("PG_PASSWORD", ""))
+        catalog = introspect_postgres(conn)
+        conn.rollback()
+    else:
+        db_path = os.getenv("SQLITE_PATH", "company.db")
+        source = sqlite3.connect(db_path)
+        if args.apply:
+            conn = source
+        else:
+            # measure on a private copy so the real database is untouched
+            tmp = tempfile.NamedTemporaryFile(suffix=".db", delete=False)
+            tmp.close()
+            conn = sqlite3.connect(tmp.name)
+            source.backup(conn)
+            source.close()
+            atexit.register(os.remove, tmp.name)
+        catalog = introspect_sqlite(conn)
+
+    if args.from_corpus:
+        # no logged timings: time each statement once against the current database instead
+        timings = replay(conn, statements, backend, 1)
+        for s in statements:
+            s["total_ms"] = (timings.get(s["sql"]) or 0.0) * s["count"]
+        statements.sort(key=lambda s: -s["total_ms"])
+    proposals = propose_indexes(statements, catalog, existing_indexes(conn, backend), args.max_indexes,
+                                table_rows(conn, backend), args.min_rows)
+    if not proposals:
+        print("No new indexes to propose for this workload.")
+        return
+    sample = statements[:args.replay]
+    before = replay(conn, sample, backend, args.repeat)
+    ddl = apply_indexes(conn, proposals, backend)
+    if args.apply:
+        conn.commit()  # keep the indexes whatever happens while measuring them
+    after = replay(conn, sample, backend, args.repeat)
+    if args.apply:
+        conn.commit()
+    else:
+        conn.rollback()  # Postgres: the indexes only existed inside this transaction
+    conn.close()
+    print_report(sample, before, after, proposals, ddl)
+    print("\nIndexes created." if args.apply else "\nDry run: re-run with --apply to create them.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+import re
+import json
+import time
+import random
+from typing import Any, Dict, Iterator, List, Optional
+
+from query_cache import normalize_question
+
+
+class LLMProvider:
+    """Text-in, text-out model used by every agent stage."""
+
+    name = "base"
+
+    def generate(self, prompt: str) -> str:
+        raise NotImplementedError
+
+    def stream(self, prompt: str) -> Iterator[str]:
+        yield self.generate(prompt)
+
+
+class GeminiProvider(LLMProvider):
+    name = "gemini"
+
+    def __init__(self, genai, model: str):
+        self.genai = genai  # configured google.generativeai module, or None
+        self.model = model
+
+    def generate(self, prompt: str) -> str:
+        if self.genai is None:
+            return "LLM not configured. Set GEMINI_API_KEY in .env."
+        model = self.genai.GenerativeModel(self.model)
+        resp = model.generate_content(prompt)
+        return resp.text if hasattr(resp, "text") else str(resp)
+
+    def stream(self, prompt: str) -> Iterator[str]:
+        if self.genai is None:
+            yield "LLM not configured. Set GEMINI_API_KEY in .env."
+            return
+        model = self.genai.GenerativeModel(self.model)
+        for chunk in model.generate_content(prompt, stream=True):
+            text = getattr(chunk, "text", "")
+            if text:
+                yield text
+
+
+def load_corpus(path: str) -> List[Dict[str, Any]]:
+    """Question corpus: a JSON list of {'question', 'tables', 'sql', 'sql_postgres'?, 'answer'}."""
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+class FakeLLMProvider(LLMProvider):
+    """
+    Deterministic offline stand-in for Gemini. It recognises which agent a
+    prompt is for, looks the question up in a corpus and returns the canned
+    Schema Agent answer, SQL or final answer after sleeping `latency` seconds
+    (plus up to `jitter` seconds drawn from a seeded RNG). Unknown questions
+    get a generic answer and a count over `sales`; repair requests get the
+    offending SQL back unchanged.
+    """
+
+    name = "fake"
+    DEFAULT_SQL = "SELECT COUNT(*) AS total_sales, SUM(amount) AS total_amount FROM sales"
+
+    def __init__(self, corpus: Optional[List[Dict[str, Any]]] = None, latency: float = 0.0,
+                 jitter: float = 0.0, seed: int = 0):
+        self.latency = latency
+        self.jitter = jitter
+        self._rng = random.Random(seed)
+        self.corpus = {}
+        for item in corpus or []:
+            self.corpus[normalize_question(item["question"])[0]] = item
+        self.calls = 0
+
+    def _sleep(self, fraction: float = 1.0):
+        delay = self.latency + (self._rng.uniform(0, self.jitter) if self.jitter else 0.0)
+        if delay > 0:
+            time.sleep(delay * fraction)
+
+    @staticmethod
+    def _question(prompt: str) -> str:
+        m = re.search(r'User question:\s*(.+)', prompt) or re.search(r'Question:\s*\n(.+)', prompt)
+        return m.group(1).strip() if m else ""
+
+    def _lookup(self, prompt: str) -> Dict[str, Any]:
+        return self.corpus.get(normalize_question(self._question(prompt))[0], {})
+
+    def _respond(self, prompt: str) -> str:
+        self.calls += 1
+        item = self._lookup(prompt)
+        if "SQL Generator Agent" in prompt:
+            if "PostgreSQL" in prompt and item.get("sql_postgres"):
+                sql = item["sql_postgres"]
+            else:
+                sql = item.get("sql", self.DEFAULT_SQL)
+            return f"```sql\n{sql}\n```"
+        if "Schema Agent" in prompt:
+            tables = item.get("tables", ["sales"])
+            return ("Relevant Tables:\n" + "\n".join(f" - {t}" for t in tables) +
+                    "\n\nRelevant Columns:\n" + "\n".join(f" - {t}.*" for t in tables))
+        if "SQL Repair Agent" in prompt:
+            # no way to know the intended query: hand the SQL back unchanged
+            m = re.search(r'SQL:\s*\n(.*?)\n\s*\n', prompt, flags=re.DOTALL)
+            return f"```sql\n{m.group(1).strip() if m else self.DEFAULT_SQL}\n```"
+        if "Synthesizer Agent" in prompt:
+            return item.get("answer", "Here is the summary of the query result.")
+        return "OK"
+
+    def generate(self, prompt: str) -> str:
+        self._sleep()
+        return self._respond(prompt)
+
+    def stream(self, prompt: str) -> Iterator[str]:
+        words = self._respond(prompt).split(" ")
+        for i, word in enumerate(words):
+            self._sleep(1.0 / len(words))
+            yield word if i == len(words) - 1 else word + " "
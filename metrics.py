@@ -0,0 +1,119 @@
+import bisect
+import threading
+from typing import Callable, Dict, List, Sequence, Tuple
+
+# Seconds: covers sub-millisecond cache hits up to slow LLM calls.
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+SIZE_BUCKETS = (10, 100, 500, 1000, 2500, 5000, 10000, 25000, 50000, 100000, 250000)
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = (), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._series: Dict[LabelValues, List] = {}  # labels -> [bucket counts, sum, count]
+
+    def observe(self, value: float, *label_values: str):
+        idx = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * len(self.buckets), 0.0, 0]
+            if idx < len(self.buckets):
+                series[0][idx] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted(self._series.items())
+            items = [(k, (list(v[0]), v[1], v[2])) for k, v in items]
+        for label_values, (counts, total, count) in items:
+            cumulative = 0
+            for bound, c in zip(self.buckets, counts):
+                cumulative += c
+                le = _format_labels(self.labels, label_values, f'le="{bound}"')
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            inf = _format_labels(self.labels, label_values, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{inf} {count}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, label_values)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, label_values)} {count}")
+        return lines
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, *label_values: str, amount: float = 1.0):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0.0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for label_values, value in items:
+            lines.append(f"{self.name}{_format_labels(self.labels, label_values)} {value}")
+        return lines
+
+
+class Registry:
+    """
+    Minimal Prometheus text-format registry. Gauges are read from callbacks at
+    scrape time so components such as the connection pool keep their own state.
+    """
+
+    def __init__(self):
+        self._metrics: List = []
+        self._gauges: List[Tuple[str, str, Callable[[], Dict[LabelValues, float]], Tuple[str, ...]]] = []
+
+    def histogram(self, name: str, help_text: str, labels: Sequence[str] = (), buckets=DEFAULT_BUCKETS) -> Histogram:
+        h = Histogram(name, help_text, labels, buckets)
+        self._metrics.append(h)
+        return h
+
+    def counter(self, name: str, help_text: str, labels: Sequence[str] = ()) -> Counter:
+        c = Counter(name, help_text, labels)
+        self._metrics.append(c)
+        return c
+
+    def gauge_callback(self, name: str, help_text: str, fn: Callable[[], Dict[LabelValues, float]],
+                       labels: Sequence[str] = ()):
+        self._gauges.append((name, help_text, fn, tuple(labels)))
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for m in self._metrics:
+            lines.extend(m.render())
+        for name, help_text, fn, labels in self._gauges:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} gauge")
+            try:
+                values = fn()
+            except Exception:
+                continue
+            for label_values, value in sorted(values.items()):
+                lines.append(f"{name}{_format_labels(labels, label_values)} {value}")
+        return "\n".join(lines) + "\n"
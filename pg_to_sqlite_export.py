@@ -1,5 +1,39 @@
 # pg_to_sqlite_export.py
-import sqlite3, psycopg2, os
+"""
+Copy the Postgres public schema into a SQLite replica.
+
+    python pg_to_sqlite_export.py                          # full export (replaces the file atomically)
+    python pg_to_sqlite_export.py --incremental            # only new/changed rows
+    python pg_to_sqlite_export.py --incremental --watermark sales=updated_at
+    python pg_to_sqlite_export.py --tables sales           # recopy only sales, keep the rest
+
+Rows are read through server-side (named) cursors and written with chunked
+executemany(), so memory stays at a few chunks whatever the table size.
+Tables are read in parallel, each on its own Postgres connection, while a
+single writer fills SQLite. Column types map to INTEGER/REAL/NUMERIC/TEXT/
+BLOB, and primary keys, foreign keys and plain indexes are recreated.
+
+Incremental mode copies, per table, rows whose watermark column is at or
+past the replica's current maximum (upserted by primary key), or with no
+watermark, rows whose integer primary key is above the replica's maximum.
+Tables without either, and tables whose columns changed, are copied in
+full. Deleted rows are not propagated; run a full export for that.
+
+A full export of selected tables (--tables without --incremental) drops and
+recreates just those tables inside the existing replica, in one transaction.
+"""
+import os
+import json
+import time
+import queue
+import sqlite3
+import argparse
+import threading
+from datetime import date, datetime, time as dtime
+from decimal import Decimal
+from typing import Any, Callable, Dict, List, Optional
+
+import psycopg2
 from dotenv import load_dotenv
 load_dotenv()
 
@@ -9,51 +43,303 @@ PG_DATABASE = os.getenv("PG_DATABASE", "company")
 PG_USER = os.getenv("PG_USER", "postgres")
 PG_PASSWORD = os.getenv("PG_PASSWORD", "")
 
-sqlite_db = os.getenv("SQLITE_PATH", "company.db")
-
-pg = psycopg2.connect(host=PG_HOST, port=PG_PORT, dbname=PG_DATABASE, user=PG_USER, password=PG_PASSWORD)
-pg_cur = pg.cursor()
-
-# create sqlite and tables
-if os.path.exists(sqlite_db):
-    os.remove(sqlite_db)
-sconn = sqlite3.connect(sqlite_db)
-scur = sconn.cursor()
-
-# Fetch table list from Postgres public schema
-pg_cur.execute("""
-SELECT table_name FROM information_schema.tables
-WHERE table_schema = 'public' AND table_type='BASE TABLE';
-""")
-tables = [r[0] for r in pg_cur.fetchall()]
-
-for t in tables:
-    # fetch create-like structure (we'll create simple columns using information_schema)
-    pg_cur.execute("SELECT column_name, data_type FROM information_schema.columns WHERE table_name = %s ORDER BY ordinal_position;", (t,))
-    cols = pg_cur.fetchall()
-    # Build simple CREATE TABLE with TEXT for safety or map types
-    col_defs = []
-    for col_name, data_type in cols:
-        # map some types
-        if data_type.startswith("integer") or "int" in data_type:
-            dt = "INTEGER"
-        elif data_type in ("date","timestamp without time zone","timestamp with time zone"):
-            dt = "TEXT"
+COLUMNS_SQL = """
+SELECT table_name, column_name, data_type
+FROM information_schema.columns
+WHERE table_schema = 'public'
+  AND table_name IN (SELECT table_name FROM information_schema.tables
+                     WHERE table_schema = 'public' AND table_type = 'BASE TABLE')
+ORDER BY table_name, ordinal_position
+"""
+
+KEYS_SQL = """
+SELECT tc.table_name, tc.constraint_type, tc.constraint_name, kcu.column_name,
+       ccu.table_name AS ref_table, ccu.column_name AS ref_column
+FROM information_schema.table_constraints tc
+JOIN information_schema.key_column_usage kcu
+  ON tc.constraint_name = kcu.constraint_name AND tc.table_schema = kcu.table_schema
+LEFT JOIN information_schema.constraint_column_usage ccu
+  ON tc.constraint_name = ccu.constraint_name AND tc.table_schema = ccu.table_schema
+ AND tc.constraint_type = 'FOREIGN KEY'
+WHERE tc.table_schema = 'public' AND tc.constraint_type IN ('PRIMARY KEY', 'FOREIGN KEY')
+ORDER BY tc.table_name, tc.constraint_name, kcu.ordinal_position
+"""
+
+# Plain (non-expression, non-partial) indexes other than primary keys.
+INDEXES_SQL = """
+SELECT t.relname, i.relname, ix.indisunique, array_agg(a.attname ORDER BY k.ord)
+FROM pg_index ix
+JOIN pg_class t ON t.oid = ix.indrelid
+JOIN pg_class i ON i.oid = ix.indexrelid
+JOIN pg_namespace n ON n.oid = t.relnamespace AND n.nspname = 'public'
+CROSS JOIN LATERAL unnest(ix.indkey::int2[]) WITH ORDINALITY AS k(attnum, ord)
+JOIN pg_attribute a ON a.attrelid = t.oid AND a.attnum = k.attnum
+WHERE NOT ix.indisprimary AND ix.indexprs IS NULL AND ix.indpred IS NULL
+  AND k.ord <= ix.indnkeyatts
+GROUP BY t.relname, i.relname, ix.indisunique
+"""
+
+WATERMARK_NAMES = ("updated_at", "modified_at", "last_modified", "updated")
+
+
+def sqlite_type(data_type: str) -> str:
+    """SQLite column type for an information_schema data_type."""
+    dt = data_type.lower()
+    if dt in ("smallint", "integer", "bigint", "boolean") or dt.endswith("serial"):
+        return "INTEGER"
+    if dt in ("real", "double precision"):
+        return "REAL"
+    if dt in ("numeric", "decimal", "money"):
+        return "NUMERIC"
+    if dt == "bytea":
+        return "BLOB"
+    return "TEXT"  # text, varchar, dates and timestamps (ISO strings), json, uuid, ...
+
+
+def converter(data_type: str) -> Optional[Callable[[Any], Any]]:
+    """Value conversion for a column, or None when psycopg2's value binds to SQLite as is."""
+    dt = data_type.lower()
+    if dt in ("numeric", "decimal", "money"):
+        return lambda v: float(v) if isinstance(v, Decimal) else v
+    if dt == "boolean":
+        return lambda v: None if v is None else int(v)
+    if dt.startswith(("date", "timestamp", "time")):
+        return lambda v: v.isoformat() if isinstance(v, (date, datetime, dtime)) else v
+    if dt == "bytea":
+        return lambda v: None if v is None else bytes(v)
+    if dt in ("json", "jsonb", "array", "user-defined", "interval", "uuid"):
+        return lambda v: v if v is None or isinstance(v, str) else (
+            json.dumps(v, default=str) if isinstance(v, (dict, list)) else str(v))
+    return None
+
+
+def row_converter(columns: List[Dict[str, str]]) -> Callable[[tuple], tuple]:
+    convs = [(i, c) for i, c in enumerate(converter(col["type"]) for col in columns) if c is not None]
+    if not convs:
+        return tuple
+
+    def convert(row):
+        row = list(row)
+        for i, c in convs:
+            row[i] = c(row[i])
+        return tuple(row)
+    return convert
+
+
+def pg_connect():
+    return psycopg2.connect(host=PG_HOST, port=PG_PORT, dbname=PG_DATABASE, user=PG_USER, password=PG_PASSWORD)
+
+
+def read_catalog(conn) -> Dict[str, Dict[str, Any]]:
+    """table -> {'columns': [{name, type}], 'primary_key': [...], 'foreign_keys': [...], 'indexes': [...]}"""
+    cur = conn.cursor()
+    cur.execute(COLUMNS_SQL)
+    tables: Dict[str, Dict[str, Any]] = {}
+    for t, col, dtype in cur.fetchall():
+        tables.setdefault(t, {"columns": [], "primary_key": [], "foreign_keys": {}, "indexes": []})
+        tables[t]["columns"].append({"name": col, "type": dtype})
+    cur.execute(KEYS_SQL)
+    for t, ctype, cname, col, ref_table, ref_col in cur.fetchall():
+        if t not in tables:
+            continue
+        if ctype == "PRIMARY KEY":
+            tables[t]["primary_key"].append(col)
+        else:
+            fk = tables[t]["foreign_keys"].setdefault(cname, {"columns": [], "ref_table": ref_table,
+                                                             "ref_columns": []})
+            if col not in fk["columns"]:
+                fk["columns"].append(col)
+            if ref_col not in fk["ref_columns"]:
+                fk["ref_columns"].append(ref_col)
+    cur.execute(INDEXES_SQL)
+    for t, name, unique, cols in cur.fetchall():
+        if t in tables:
+            tables[t]["indexes"].append({"name": name, "unique": unique, "columns": list(cols)})
+    cur.close()
+    conn.rollback()
+    return tables
+
+
+def create_table_sql(table: str, info: Dict[str, Any]) -> str:
+    pk = info["primary_key"]
+    defs = []
+    rowid_pk = False
+    for col in info["columns"]:
+        ctype = sqlite_type(col["type"])
+        if pk == [col["name"]] and ctype == "INTEGER":
+            defs.append(f'"{col["name"]}" INTEGER PRIMARY KEY')  # rowid alias: no separate key index
+            rowid_pk = True
         else:
-            dt = "TEXT"
-        col_defs.append(f"{col_name} {dt}")
-    create_sql = f"CREATE TABLE {t} ({', '.join(col_defs)});"
-    scur.execute(create_sql)
-
-    # copy rows
-    pg_cur.execute(f"SELECT * FROM {t};")
-    rows = pg_cur.fetchall()
-    if rows:
-        placeholders = ",".join(["?"] * len(rows[0]))
-        scur.executemany(f"INSERT INTO {t} VALUES ({placeholders})", rows)
-    sconn.commit()
-
-pg_cur.close()
-pg.close()
-sconn.close()
-print("Exported PostgreSQL data to", sqlite_db)
+            defs.append(f'"{col["name"]}" {ctype}')
+    if pk and not rowid_pk:
+        pk_cols = ", ".join(f'"{c}"' for c in pk)
+        defs.append(f"PRIMARY KEY ({pk_cols})")
+    for fk in info["foreign_keys"].values():
+        cols = ", ".join(f'"{c}"' for c in fk["columns"])
+        refs = ", ".join(f'"{c}"' for c in fk["ref_columns"])
+        defs.append(f'FOREIGN KEY ({cols}) REFERENCES "{fk["ref_table"]}" ({refs})')
+    return f'CREATE TABLE "{table}" ({", ".join(defs)})'
+
+
+def create_index_sql(table: str, index: Dict[str, Any]) -> str:
+    unique = "UNIQUE " if index["unique"] else ""
+    cols = ", ".join(f'"{c}"' for c in index["columns"])
+    return f'CREATE {unique}INDEX IF NOT EXISTS "{index["name"]}" ON "{table}" ({cols})'
+
+
+def pick_watermark(info: Dict[str, Any], overrides: Dict[str, str], table: str) -> Optional[str]:
+    if table in overrides:
+        return overrides[table]
+    names = {c["name"] for c in info["columns"]}
+    return next((n for n in WATERMARK_NAMES if n in names), None)
+
+
+def plan_table(table: str, info: Dict[str, Any], sconn: sqlite3.Connection, incremental: bool,
+               watermarks: Dict[str, str]) -> Dict[str, Any]:
+    """
+    How to copy one table: {'mode': 'full' | 'watermark' | 'pk', 'where': SQL, 'params': [...]}.
+    """
+    if not incremental:
+        return {"mode": "full", "where": "", "params": []}
+    existing = [r[1] for r in sconn.execute(f'PRAGMA table_info("{table}")')]
+    if existing != [c["name"] for c in info["columns"]]:
+        return {"mode": "full", "where": "", "params": []}
+    wm = pick_watermark(info, watermarks, table)
+    if wm and info["primary_key"]:
+        (high,) = sconn.execute(f'SELECT MAX("{wm}") FROM "{table}"').fetchone()
+        if high is None:
+            return {"mode": "full", "where": "", "params": []}
+        # >= so rows sharing the last copied watermark value are re-checked
+        return {"mode": "watermark", "where": f' WHERE "{wm}" >= %s', "params": [high]}
+    pk = info["primary_key"]
+    if len(pk) == 1 and sqlite_type(next(c["type"] for c in info["columns"] if c["name"] == pk[0])) == "INTEGER":
+        (high,) = sconn.execute(f'SELECT MAX("{pk[0]}") FROM "{table}"').fetchone()
+        return {"mode": "pk", "where": f' WHERE "{pk[0]}" > %s' if high is not None else "",
+                "params": [high] if high is not None else []}
+    return {"mode": "full", "where": "", "params": []}
+
+
+def read_table(table: str, info: Dict[str, Any], plan: Dict[str, Any], chunk_size: int, out: "queue.Queue"):
+    """Stream one table through a named cursor, putting (table, rows) chunks on `out`."""
+    conn = pg_connect()
+    try:
+        conn.set_session(readonly=True)
+        cur = conn.cursor(name=f"export_{table}")
+        cur.itersize = chunk_size
+        cols = ", ".join(f'"{c["name"]}"' for c in info["columns"])
+        cur.execute(f'SELECT {cols} FROM "{table}"{plan["where"]}', plan["params"])
+        convert = row_converter(info["columns"])
+        while True:
+            rows = cur.fetchmany(chunk_size)
+            if not rows:
+                break
+            out.put((table, [convert(r) for r in rows]))
+        cur.close()
+        out.put((table, None))
+    except Exception as e:
+        out.put((table, e))
+    finally:
+        conn.close()
+
+
+def export(sqlite_path: str, tables: Optional[List[str]] = None, incremental: bool = False,
+           watermarks: Optional[Dict[str, str]] = None, workers: int = 4, chunk_size: int = 10000) -> Dict[str, Any]:
+    pg = pg_connect()
+    catalog = read_catalog(pg)
+    pg.close()
+    if tables:
+        catalog = {t: catalog[t] for t in tables}
+
+    incremental = incremental and os.path.exists(sqlite_path)
+    # a new file would only hold the selected tables, so those are replaced in the existing one
+    in_place = incremental or (bool(tables) and os.path.exists(sqlite_path))
+    target = sqlite_path if in_place else sqlite_path + ".tmp"
+    if not in_place and os.path.exists(target):
+        os.remove(target)
+    sconn = sqlite3.connect(target, isolation_level=None)
+    if in_place:
+        sconn.execute("PRAGMA journal_mode = WAL")  # readers of the replica keep working during the refresh
+        sconn.execute("PRAGMA synchronous = NORMAL")
+    else:
+        sconn.execute("PRAGMA journal_mode = OFF")
+        sconn.execute("PRAGMA synchronous = OFF")
+
+    plans = {t: plan_table(t, info, sconn, incremental, watermarks or {}) for t, info in catalog.items()}
+    sconn.execute("BEGIN")
+    for t, plan in plans.items():
+        if plan["mode"] == "full":
+            sconn.execute(f'DROP TABLE IF EXISTS "{t}"')
+            sconn.execute(create_table_sql(t, catalog[t]))
+
+    # readers run in parallel and block on a bounded queue; this thread is the only SQLite writer
+    chunks: "queue.Queue" = queue.Queue(maxsize=max(2, workers * 2))
+    pending = list(plans)
+    running: List[threading.Thread] = []
+    stats = {t: {"mode": plans[t]["mode"], "rows": 0} for t in plans}
+    started = time.perf_counter()
+
+    def start_next():
+        t = pending.pop(0)
+        th = threading.Thread(target=read_table, args=(t, catalog[t], plans[t], chunk_size, chunks), daemon=True)
+        th.start()
+        running.append(th)
+
+    while pending and len(running) < workers:
+        start_next()
+    active = len(running)
+    try:
+        while active:
+            table, rows = chunks.get()
+            if rows is None or isinstance(rows, Exception):
+                active -= 1
+                if isinstance(rows, Exception):
+                    raise RuntimeError(f"export of {table} failed: {rows}") from rows
+                if pending:
+                    start_next()
+                    active += 1
+                continue
+            cols = catalog[table]["columns"]
+            verb = "INSERT" if plans[table]["mode"] == "full" else "INSERT OR REPLACE"
+            sconn.executemany(f'{verb} INTO "{table}" VALUES ({", ".join("?" * len(cols))})', rows)
+            stats[table]["rows"] += len(rows)
+        for t, plan in plans.items():
+            for index in catalog[t]["indexes"]:
+                sconn.execute(create_index_sql(t, index))
+        sconn.execute("COMMIT")
+    except BaseException:
+        if sconn.in_transaction:
+            sconn.execute("ROLLBACK")
+        sconn.close()
+        if not in_place:
+            os.remove(target)
+        raise
+
+    sconn.execute("ANALYZE")
+    if not in_place:
+        sconn.execute("PRAGMA journal_mode = DELETE")
+    sconn.close()
+    if not in_place:
+        os.replace(target, sqlite_path)  # readers of the old file never see a half-written replica
+    return {"seconds": round(time.perf_counter() - started, 2), "tables": stats}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sqlite", default=os.getenv("SQLITE_PATH", "company.db"))
+    parser.add_argument("--tables", nargs="*", help="only these tables (default: the whole public schema)")
+    parser.add_argument("--incremental", action="store_true")
+    parser.add_argument("--watermark", action="append", default=[], metavar="TABLE=COLUMN",
+                        help="watermark column for incremental mode (default: updated_at/modified_at if present)")
+    parser.add_argument("--workers", type=int, default=4, help="tables read in parallel")
+    parser.add_argument("--chunk-size", type=int, default=10000)
+    args = parser.parse_args()
+
+    watermarks = dict(w.split("=", 1) for w in args.watermark)
+    result = export(args.sqlite, args.tables, args.incremental, watermarks, args.workers, args.chunk_size)
+    for t, s in result["tables"].items():
+        print(f"{t:24s} {s['mode']:10s} {s['rows']:>12,d} rows")
+    print("Exported PostgreSQL data to", args.sqlite, f"in {result['seconds']} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,192 @@
+import re
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+NUMBER_RE = re.compile(r'(?<![\w.])\d+(?:\.\d+)?(?![\w.])')
+
+
+def normalize_question(question: str) -> Tuple[str, List[str]]:
+    """
+    Case-, whitespace- and punctuation-insensitive form of a question, with
+    number literals replaced by <num>. Returns (template, numbers) so callers
+    can tell "top 5 customers" from "top 10 customers".
+    """
+    q = question.lower().replace(",", "")  # "1,000" -> "1000"
+    numbers = NUMBER_RE.findall(q)
+    q = NUMBER_RE.sub(" <num> ", q)
+    q = re.sub(r"[^\w<>\s]", " ", q)
+    return " ".join(q.split()), numbers
+
+
+def _sql_template(sql: str, numbers: List[str]) -> Optional[str]:
+    """
+    Turn the question's number literals into NUL-delimited slots in the SQL. Only
+    possible when every number appears exactly once as a standalone literal;
+    otherwise the SQL is only reusable for the exact same numbers.
+    """
+    if not numbers or len(set(numbers)) != len(numbers):
+        return None
+    template = sql
+    for i, n in enumerate(numbers):
+        pattern = re.compile(r'(?<![\w.])' + re.escape(n) + r'(?![\w.])')
+        if len(pattern.findall(template)) != 1:
+            return None
+        template = pattern.sub("\x00%d\x00" % i, template)
+    return template
+
+
+def _fill_template(template: str, numbers: List[str]) -> str:
+    out = template
+    for i, n in enumerate(numbers):
+        out = out.replace("\x00%d\x00" % i, n)
+    return out
+
+
+class SQLCache:
+    """
+    Question -> (Schema Agent output, SQL) cache keyed on the normalized
+    question, the schema fingerprint and the DB backend. Entries live in an
+    in-memory LRU with a TTL; with `path` set they are also written to a
+    SQLite file so they survive restarts. With `shared` (a SharedCache) that
+    second tier is shared with the other worker processes instead.
+    """
+
+    def __init__(self, max_entries: int = 1000, ttl: float = 86400.0, path: str = "", shared=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.path = path
+        self.shared = shared
+        self._lock = threading.Lock()
+        self._mem: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        self._disk = None
+        if path and shared is None:
+            self._disk = sqlite3.connect(path, check_same_thread=False)
+            self._disk.execute("""
+                CREATE TABLE IF NOT EXISTS sql_cache (
+                    key TEXT PRIMARY KEY,
+                    entry TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_used REAL NOT NULL
+                )
+            """)
+            self._disk.commit()
+
+    @staticmethod
+    def make_key(template: str, fingerprint: str, backend: str) -> str:
+        return hashlib.sha1(f"{backend}|{fingerprint}|{template}".encode("utf-8")).hexdigest()
+
+    def _load(self, key: str, now: float) -> Optional[Dict[str, Any]]:
+        entry = self._mem.get(key)
+        if entry is not None:
+            self._mem.move_to_end(key)
+        elif self.shared is not None:
+            entry = self.shared.get("sql", key)
+            if entry is not None:
+                self._remember(key, entry)
+        elif self._disk is not None:
+            row = self._disk.execute("SELECT entry FROM sql_cache WHERE key = ?", (key,)).fetchone()
+            if row:
+                entry = json.loads(row[0])
+                self._remember(key, entry)
+        if entry is not None and now - entry["created_at"] > self.ttl:
+            self._drop(key)
+            return None
+        return entry
+
+    def _remember(self, key: str, entry: Dict[str, Any]):
+        self._mem[key] = entry
+        self._mem.move_to_end(key)
+        while len(self._mem) > self.max_entries:
+            self._mem.popitem(last=False)
+            self.evictions += 1
+
+    def _drop(self, key: str):
+        self._mem.pop(key, None)
+        if self.shared is not None:
+            self.shared.delete("sql", key)
+        if self._disk is not None:
+            self._disk.execute("DELETE FROM sql_cache WHERE key = ?", (key,))
+            self._disk.commit()
+
+    def get(self, question: str, fingerprint: str, backend: str) -> Optional[Dict[str, Any]]:
+        """Return {'schema_agent_output', 'sql_query'} for a cached question, or None."""
+        template, numbers = normalize_question(question)
+        key = self.make_key(template, fingerprint, backend)
+        now = time.time()
+        with self._lock:
+            entry = self._load(key, now)
+            if entry is not None:
+                if entry["sql_template"] is not None:
+                    sql = _fill_template(entry["sql_template"], numbers)
+                elif entry["numbers"] == numbers:
+                    sql = entry["sql_query"]
+                else:
+                    entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            if self._disk is not None:
+                self._disk.execute("UPDATE sql_cache SET last_used = ? WHERE key = ?", (now, key))
+                self._disk.commit()
+        return {"schema_agent_output": entry["schema_agent_output"], "sql_query": sql}
+
+    def put(self, question: str, fingerprint: str, backend: str, schema_agent_output: str, sql_query: str):
+        template, numbers = normalize_question(question)
+        key = self.make_key(template, fingerprint, backend)
+        now = time.time()
+        entry = {
+            "schema_agent_output": schema_agent_output,
+            "sql_query": sql_query,
+            "sql_template": _sql_template(sql_query, numbers),
+            "numbers": numbers,
+            "created_at": now,
+        }
+        with self._lock:
+            self._remember(key, entry)
+            self.stores += 1
+            if self.shared is not None:
+                self.shared.put("sql", key, entry, self.ttl)
+            if self._disk is not None:
+                self._disk.execute(
+                    "INSERT OR REPLACE INTO sql_cache (key, entry, created_at, last_used) VALUES (?, ?, ?, ?)",
+                    (key, json.dumps(entry), now, now),
+                )
+                self._disk.execute("""
+                    DELETE FROM sql_cache WHERE created_at < ? OR key IN (
+                        SELECT key FROM sql_cache ORDER BY last_used DESC LIMIT -1 OFFSET ?
+                    )
+                """, (now - self.ttl, self.max_entries))
+                self._disk.commit()
+
+    def clear(self):
+        with self._lock:
+            self._mem.clear()
+            if self.shared is not None:
+                self.shared.clear("sql")
+            if self._disk is not None:
+                self._disk.execute("DELETE FROM sql_cache")
+                self._disk.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._mem),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "stores": self.stores,
+                "evictions": self.evictions,
+                "persistent": self._disk is not None or self.shared is not None,
+                "shared": self.shared is not None,
+            }
@@ -0,0 +1,201 @@
+import re
+import json
+import math
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional, Tuple
+
+PG_QUERY_CANCELED = "57014"
+
+NOT_ALIASES = ("ON", "WHERE", "JOIN", "GROUP", "ORDER", "LIMIT", "OFFSET", "LEFT", "RIGHT", "FULL", "INNER", "OUTER",
+               "CROSS", "USING", "NATURAL", "HAVING", "UNION", "EXCEPT", "INTERSECT", "WINDOW", "FROM")
+TABLE_REF_RE = re.compile(r'(?:\bFROM|\bJOIN|,)\s+"?(\w+)"?(?![.(\w])(?:\s+(?:AS\s+)?(?!(?:%s)\b)(\w+))?'
+                          % "|".join(NOT_ALIASES), re.IGNORECASE)
+AGGREGATE_RE = re.compile(r'\b(COUNT|SUM|AVG|MIN|MAX|GROUP_CONCAT|STRING_AGG)\s*\(|\bGROUP\s+BY\b|\bDISTINCT\b',
+                          re.IGNORECASE)
+
+
+class QueryGuardError(Exception):
+    """A statement stopped by the guard: error_type is 'timeout' or 'cost_limit'."""
+
+    def __init__(self, error_type: str, message: str, **detail):
+        super().__init__(message)
+        self.error_type = error_type
+        self.detail = detail
+
+    def as_result(self) -> Dict[str, Any]:
+        return {"error": str(self), "error_type": self.error_type, **self.detail}
+
+
+def _is_pg_cancel(exc: Optional[BaseException]) -> bool:
+    # closing a server-side cursor in the aborted transaction can raise a second error
+    # that hides the cancellation, so look at the chained exception as well
+    while exc is not None:
+        if getattr(exc, "pgcode", None) == PG_QUERY_CANCELED:
+            return True
+        exc = exc.__context__
+    return False
+
+
+@contextmanager
+def statement_timeout(conn, backend: str, seconds: float):
+    """
+    Abort the statement(s) run inside the block after `seconds` (0 = no limit):
+    a progress handler on SQLite, SET LOCAL statement_timeout on Postgres (it
+    lasts until the pool rolls the connection back).
+    Raises QueryGuardError('timeout') when the budget runs out.
+    """
+    if not seconds or seconds <= 0:
+        yield
+        return
+    if backend == "postgres":
+        cur = conn.cursor()
+        cur.execute("SET LOCAL statement_timeout = %s", (int(seconds * 1000),))
+        cur.close()
+        try:
+            yield
+        except Exception as e:
+            if not _is_pg_cancel(e):
+                raise
+            conn.rollback()
+            raise QueryGuardError("timeout", f"Query cancelled after {seconds:g} s.", timeout_s=seconds) from e
+        return
+
+    deadline = time.monotonic() + seconds
+    conn.set_progress_handler(lambda: 1 if time.monotonic() > deadline else 0, 10000)
+    try:
+        yield
+    except Exception as e:
+        if time.monotonic() > deadline and "interrupted" in str(e).lower():
+            raise QueryGuardError("timeout", f"Query interrupted after {seconds:g} s.", timeout_s=seconds) from e
+        raise
+    finally:
+        conn.set_progress_handler(None, 0)
+
+
+def table_aliases(stmt: str) -> Dict[str, str]:
+    """Alias (or bare table name) -> table name for FROM/JOIN references in a statement."""
+    aliases = {}
+    for table, alias in TABLE_REF_RE.findall(stmt):
+        aliases[table.lower()] = table
+        if alias:
+            aliases[alias.lower()] = table
+    return aliases
+
+
+def sqlite_plan_cost(plan: List[Tuple], aliases: Dict[str, str], row_counts: Dict[str, int],
+                     default_rows: int = 1000) -> float:
+    """
+    Estimated rows visited for an EXPLAIN QUERY PLAN result. Loops under the
+    same parent are nested, so their factors multiply: a SCAN costs the table's
+    row count, an index SEARCH about log2 of it. Sibling groups (subqueries,
+    CTEs) add up; correlated subqueries run once per row of their parent group.
+    """
+    children: Dict[int, List[Tuple[int, str]]] = {}
+    for row in plan:
+        node_id, parent, detail = row[0], row[1], row[-1]
+        children.setdefault(parent, []).append((node_id, detail))
+
+    def rows_for(name: str) -> int:
+        table = aliases.get(name.lower(), name)
+        return row_counts.get(table.lower(), default_rows)
+
+    def group_cost(parent: int, outer: float) -> float:
+        loop = 1.0
+        extra = 0.0
+        for node_id, detail in children.get(parent, []):
+            m = re.match(r'(SCAN|SEARCH)\s+(\w+)', detail)
+            if m:
+                rows = rows_for(m.group(2))
+                if m.group(1) == "SCAN":
+                    loop *= max(rows, 1)
+                else:
+                    loop *= math.log2(rows + 1) + 1
+                    if "AUTOMATIC" in detail:
+                        extra += rows  # building the automatic index reads the table once
+            elif node_id in children:
+                repeat = outer * loop if "CORRELATED" in detail else 1.0
+                extra += group_cost(node_id, repeat)
+        return outer * loop + extra
+
+    return group_cost(0, 1.0)
+
+
+def add_limit(stmt: str, limit: int) -> str:
+    if re.search(r'\bLIMIT\s+\d+(\s+OFFSET\s+\d+)?\s*$', stmt, flags=re.IGNORECASE):
+        return f"SELECT * FROM ({stmt}) AS limited LIMIT {int(limit)}"
+    return f"{stmt} LIMIT {int(limit)}"
+
+
+class CostGuard:
+    """
+    Pre-execution cost check. Postgres uses the planner's total cost from
+    EXPLAIN (FORMAT JSON); SQLite uses sqlite_plan_cost() over EXPLAIN QUERY
+    PLAN and cheap row-count estimates (max rowid). Statements above
+    `max_cost` are rejected, or with action='limit' wrapped in a LIMIT when
+    that brings them under the threshold.
+    """
+
+    def __init__(self, backend: str, max_cost: float, action: str = "reject", limit: int = 1000,
+                 row_count_ttl: float = 60.0):
+        self.backend = backend
+        self.max_cost = max_cost
+        self.action = action
+        self.limit = limit
+        self.row_count_ttl = row_count_ttl
+        self._row_counts: Dict[str, int] = {}
+        self._row_counts_at = 0.0
+        self.rejected = 0
+        self.limited = 0
+
+    def _sqlite_row_counts(self, conn) -> Dict[str, int]:
+        now = time.monotonic()
+        if now - self._row_counts_at > self.row_count_ttl:
+            counts = {}
+            tables = [r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table' "
+                                                 "AND name NOT LIKE 'sqlite_%'")]
+            for t in tables:
+                try:
+                    counts[t.lower()] = conn.execute(f'SELECT MAX(rowid) FROM "{t}"').fetchone()[0] or 0
+                except Exception:
+                    counts[t.lower()] = conn.execute(f'SELECT COUNT(*) FROM "{t}"').fetchone()[0]
+            self._row_counts, self._row_counts_at = counts, now
+        return self._row_counts
+
+    def estimate(self, conn, stmt: str) -> float:
+        if self.backend == "postgres":
+            cur = conn.cursor()
+            try:
+                cur.execute(f"EXPLAIN (FORMAT JSON) {stmt}")
+                plan = cur.fetchone()[0]
+            finally:
+                cur.close()
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            return float(plan[0]["Plan"]["Total Cost"])
+        plan = conn.execute(f"EXPLAIN QUERY PLAN {stmt}").fetchall()
+        cost = sqlite_plan_cost(plan, table_aliases(stmt), self._sqlite_row_counts(conn))
+        if re.search(r'\bLIMIT\s+\d+\s*$', stmt, flags=re.IGNORECASE) and not AGGREGATE_RE.search(stmt) \
+                and not any("TEMP B-TREE" in row[-1] for row in plan):
+            # a streamed plan stops once the outer LIMIT is reached
+            cost = min(cost, float(re.search(r'LIMIT\s+(\d+)\s*$', stmt, flags=re.IGNORECASE).group(1)))
+        return cost
+
+    def check(self, conn, stmt: str) -> Tuple[str, Dict[str, Any]]:
+        """Return (statement to run, guard info); raise QueryGuardError('cost_limit') to reject."""
+        cost = self.estimate(conn, stmt)
+        info = {"estimated_cost": round(cost, 1)}
+        if cost <= self.max_cost:
+            return stmt, info
+        if self.action == "limit":
+            limited = add_limit(stmt, self.limit)
+            limited_cost = self.estimate(conn, limited)
+            if limited_cost <= self.max_cost:
+                self.limited += 1
+                return limited, {**info, "limit_added": self.limit, "limited_cost": round(limited_cost, 1)}
+        self.rejected += 1
+        raise QueryGuardError("cost_limit", f"Query rejected: estimated cost {cost:,.0f} exceeds {self.max_cost:,.0f}.",
+                              estimated_cost=round(cost, 1), max_cost=self.max_cost)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"max_cost": self.max_cost, "action": self.action, "rejected": self.rejected, "limited": self.limited}
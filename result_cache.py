@@ -0,0 +1,159 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+import orjson
+
+
+def normalize_sql(sql: str) -> str:
+    """Collapse whitespace outside string literals and drop a trailing ';'."""
+    out = []
+    quote = None
+    pending_space = False
+    for ch in sql.strip().rstrip(";").strip():
+        if quote:
+            out.append(ch)
+            if ch == quote:
+                quote = None
+            continue
+        if ch.isspace():
+            pending_space = True
+            continue
+        if pending_space and out:
+            out.append(" ")
+        pending_space = False
+        if ch in ("'", '"'):
+            quote = ch
+        out.append(ch)
+    return "".join(out)
+
+
+def sqlite_data_version(db_path: str) -> Hashable:
+    """
+    Changes whenever another process commits to the database. PRAGMA data_version
+    is only comparable within one connection, and pooled connections differ per
+    thread, so the main file and WAL stat()s are used instead.
+    """
+    token = []
+    for path in (db_path, db_path + "-wal"):
+        try:
+            st = os.stat(path)
+            token.append((st.st_mtime_ns, st.st_size))
+        except OSError:
+            token.append(None)
+    return tuple(token)
+
+
+PG_TABLE_CHANGES_SQL = """
+    SELECT coalesce(sum(n_tup_ins + n_tup_upd + n_tup_del), 0)
+    FROM pg_stat_user_tables
+    WHERE schemaname = 'public' AND relname = ANY(%s);
+"""
+
+
+def pg_table_changes(conn, tables) -> Hashable:
+    """
+    Write counters for the given tables. The statistics system publishes them
+    shortly after commit rather than synchronously, so pair this with a TTL.
+    """
+    cur = conn.cursor()
+    cur.execute(PG_TABLE_CHANGES_SQL, (sorted(tables),))
+    return int(cur.fetchone()[0])
+
+
+def _version_token(version: Hashable) -> str:
+    # stat tuples and change counters are JSON-representable and equal across processes
+    return orjson.dumps(version).decode()
+
+
+class ResultCache:
+    """
+    LRU cache of statement results bounded by the approximate size of the
+    cached rows. Each entry records the data version it was computed at and
+    is discarded when the caller presents a different one or the TTL expires.
+    With `shared` (a SharedCache), results are also written there and local
+    misses are looked up there, so other worker processes reuse them.
+    """
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024, max_entry_bytes: int = 8 * 1024 * 1024,
+                 ttl: float = 3600.0, shared=None):
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes
+        self.ttl = ttl
+        self.shared = shared
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.evictions = 0
+        self.skipped_too_large = 0
+        self.shared_hits = 0
+
+    def _remove(self, key: str):
+        entry = self._entries.pop(key)
+        self.bytes -= entry["size"]
+
+    def get(self, key: str, version: Hashable) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and (entry["version"] != version or time.monotonic() - entry["at"] > self.ttl):
+                self._remove(key)
+                self.invalidations += 1
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry["value"]
+        value = self.shared.get("results", key, _version_token(version)) if self.shared is not None else None
+        with self._lock:
+            if value is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.shared_hits += 1
+        self._store(key, version, value, len(orjson.dumps(value, default=str)))
+        return value
+
+    def put(self, key: str, version: Hashable, value: Dict[str, Any]):
+        size = len(orjson.dumps(value, default=str))
+        if size > self.max_entry_bytes:
+            self.skipped_too_large += 1
+            return
+        self._store(key, version, value, size)
+        if self.shared is not None:
+            self.shared.put("results", key, value, self.ttl, _version_token(version))
+
+    def _store(self, key: str, version: Hashable, value: Dict[str, Any], size: int):
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = {"value": value, "version": version, "size": size, "at": time.monotonic()}
+            self.bytes += size
+            while self.bytes > self.max_bytes and self._entries:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self.bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "invalidations": self.invalidations,
+                "evictions": self.evictions,
+                "skipped_too_large": self.skipped_too_large,
+                "shared_hits": self.shared_hits,
+            }
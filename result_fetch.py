@@ -0,0 +1,262 @@
+import time
+from decimal import Decimal
+from typing import Any, Callable, Dict, List, Optional
+
+import orjson
+
+
+def _is_number(v) -> bool:
+    return isinstance(v, (int, float, Decimal)) and not isinstance(v, bool)
+
+
+class ColumnStats:
+    """Running min/max/sum for columns whose non-null values are all numeric."""
+
+    def __init__(self, columns: List[str]):
+        self.columns = columns
+        self.numeric = [True] * len(columns)
+        self.min: List[Any] = [None] * len(columns)
+        self.max: List[Any] = [None] * len(columns)
+        self.sum: List[Any] = [0] * len(columns)
+        self.non_null = [0] * len(columns)
+
+    def add(self, row):
+        for i, v in enumerate(row):
+            if v is None or not self.numeric[i]:
+                continue
+            if not _is_number(v):
+                self.numeric[i] = False
+                continue
+            self.non_null[i] += 1
+            self.sum[i] += v
+            if self.min[i] is None or v < self.min[i]:
+                self.min[i] = v
+            if self.max[i] is None or v > self.max[i]:
+                self.max[i] = v
+
+    def as_dict(self) -> Dict[str, Dict[str, Any]]:
+        out = {}
+        for i, name in enumerate(self.columns):
+            if self.numeric[i] and self.non_null[i]:
+                out[name] = {
+                    "min": float(self.min[i]) if isinstance(self.min[i], Decimal) else self.min[i],
+                    "max": float(self.max[i]) if isinstance(self.max[i], Decimal) else self.max[i],
+                    "sum": float(self.sum[i]) if isinstance(self.sum[i], Decimal) else self.sum[i],
+                    "count": self.non_null[i],
+                }
+        return out
+
+
+def json_default(obj):
+    """orjson fallback for values no column converter handled (e.g. mixed-type SQLite columns)."""
+    if isinstance(obj, Decimal):
+        return float(obj)
+    if isinstance(obj, (bytes, bytearray, memoryview)):
+        return bytes(obj).decode("utf-8", errors="replace")
+    if hasattr(obj, "isoformat"):
+        return obj.isoformat()
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    return str(obj)
+
+
+def _to_float(v):
+    return float(v) if isinstance(v, Decimal) else v
+
+
+def _to_iso(v):
+    return v.isoformat() if hasattr(v, "isoformat") else v
+
+
+def _to_text(v):
+    return bytes(v).decode("utf-8", errors="replace") if isinstance(v, (bytes, bytearray, memoryview)) else v
+
+
+def _to_json(v):
+    # containers (Postgres arrays, composite values) may hold Decimals or dates
+    return orjson.loads(orjson.dumps(v, default=json_default))
+
+
+# psycopg2 type OIDs -> converter; types missing here are sniffed from their first value
+PG_TYPE_CONVERTERS: Dict[int, Optional[Callable[[Any], Any]]] = {
+    1700: _to_float,                                          # numeric
+    790: str,                                                 # money
+    1082: _to_iso, 1083: _to_iso, 1266: _to_iso,              # date, time, timetz
+    1114: _to_iso, 1184: _to_iso,                             # timestamp, timestamptz
+    1186: str, 2950: str, 869: str, 650: str, 829: str,       # interval, uuid, inet, cidr, macaddr
+    17: _to_text,                                             # bytea
+    20: None, 21: None, 23: None, 26: None,                   # integers, oid
+    700: None, 701: None, 16: None,                           # float4, float8, bool
+    25: None, 1043: None, 1042: None, 19: None,               # text, varchar, char, name
+    114: None, 3802: None,                                    # json, jsonb (already decoded)
+}
+
+
+def _converter_for_value(v) -> Optional[Callable[[Any], Any]]:
+    if isinstance(v, Decimal):
+        return _to_float
+    if isinstance(v, (bytes, bytearray, memoryview)):
+        return _to_text
+    if hasattr(v, "isoformat"):
+        return _to_iso
+    if isinstance(v, (list, tuple, dict)):
+        return _to_json
+    return None
+
+
+class RowEncoder:
+    """
+    Converts rows to JSON-native values in one pass, with one converter per
+    column instead of an isinstance chain per value. Converters come from the
+    cursor's type codes where the driver reports them (psycopg2); otherwise
+    (SQLite) from the type of the column's first non-null value. Columns that
+    need nothing are left alone, so rows of plain ints, floats and strings are
+    passed through untouched.
+    """
+
+    def __init__(self, description):
+        self.converters: List[Optional[Callable[[Any], Any]]] = []
+        self._unknown: List[int] = []
+        for i, d in enumerate(description or ()):
+            type_code = d[1] if len(d) > 1 else None
+            if isinstance(type_code, int) and type_code in PG_TYPE_CONVERTERS:
+                self.converters.append(PG_TYPE_CONVERTERS[type_code])
+            else:
+                self.converters.append(None)
+                self._unknown.append(i)
+        self._active = [(i, c) for i, c in enumerate(self.converters) if c is not None]
+
+    def _sniff(self, rows):
+        still_unknown = []
+        for i in self._unknown:
+            value = next((r[i] for r in rows if r[i] is not None), None)
+            if value is None:
+                still_unknown.append(i)
+                continue
+            self.converters[i] = _converter_for_value(value)
+        self._unknown = still_unknown
+        self._active = [(i, c) for i, c in enumerate(self.converters) if c is not None]
+
+    def encode(self, rows: List[Any]) -> List[Any]:
+        if self._unknown:
+            self._sniff(rows)
+        active = self._active
+        if not active:
+            return rows
+        out = []
+        for row in rows:
+            row = list(row)
+            for i, convert in active:
+                v = row[i]
+                if v is not None:
+                    row[i] = convert(v)
+            out.append(row)
+        return out
+
+
+def fetch_bounded(cur, max_rows: int, max_bytes: int, batch_size: int = 500,
+                  count_limit: int = 100000) -> Dict[str, Any]:
+    """
+    Read a result set in fetchmany() batches. Rows are kept until `max_rows`
+    or `max_bytes` (JSON-encoded size) is reached; after that the cursor is
+    only drained to count rows and update numeric column stats, up to
+    `count_limit` rows in total. Kept rows are converted to JSON-native values
+    here, once (see RowEncoder).
+    Returns {'columns', 'rows', 'truncated', 'total_rows', 'total_rows_exact',
+    'numeric_stats', 'encode_ms'}.
+    """
+    if cur.description is None:
+        # server-side cursors only describe the result after the first fetch
+        first = cur.fetchmany(batch_size)
+    else:
+        first = None
+    cols = [d[0] for d in cur.description] if cur.description else []
+    encoder = RowEncoder(cur.description)
+    stats = ColumnStats(cols)
+    rows: List[Any] = []
+    kept_bytes = 0
+    total = 0
+    truncated = False
+    exhausted = False
+    encode_s = 0.0
+
+    batch = first if first is not None else cur.fetchmany(batch_size)
+    while batch:
+        total += len(batch)
+        for row in batch:
+            stats.add(row)
+        if not truncated:
+            started = time.perf_counter()
+            encoded = encoder.encode(batch[:max_rows - len(rows)])
+            # size the whole batch at once; only go row by row when it would cross the limit
+            size = len(orjson.dumps(encoded, default=json_default))
+            if len(encoded) == len(batch) and kept_bytes + size <= max_bytes:
+                rows.extend(encoded)
+                kept_bytes += size
+            else:
+                for row in encoded:
+                    size = len(orjson.dumps(row, default=json_default))
+                    if kept_bytes + size > max_bytes:
+                        break
+                    rows.append(row)
+                    kept_bytes += size
+                truncated = True
+            encode_s += time.perf_counter() - started
+        if total >= count_limit:
+            # a result of exactly count_limit rows is still complete: look one row past it
+            exhausted = cur.fetchone() is None
+            break
+        batch = cur.fetchmany(batch_size)
+    else:
+        exhausted = True
+
+    return {
+        "columns": cols,
+        "rows": rows,
+        "truncated": truncated or not exhausted,
+        "total_rows": total,
+        "total_rows_exact": exhausted,
+        "numeric_stats": stats.as_dict(),
+        "encode_ms": round(encode_s * 1000, 2),
+    }
+
+
+def summarize_statement(result: Dict[str, Any], top_n: int) -> Dict[str, Any]:
+    """Compact stand-in for a large statement result: counts, numeric stats and the first rows."""
+    summary = {
+        "query": result.get("query"),
+        "columns": result.get("columns", []),
+        "total_rows": result.get("total_rows", len(result.get("rows", []))),
+        "total_rows_exact": result.get("total_rows_exact", True),
+        "numeric_stats": result.get("numeric_stats", {}),
+        f"first_{top_n}_rows": result.get("rows", [])[:top_n],
+    }
+    if result.get("truncated"):
+        summary["note"] = "Result truncated; statistics cover every counted row."
+    return summary
+
+
+def compact_result_for_prompt(run_result: Dict[str, Any], max_rows: int, top_n: int) -> Dict[str, Any]:
+    """Replace statement results with more than `max_rows` rows by their summary."""
+    if not run_result or "multi_results" not in run_result:
+        return run_result
+    compact = []
+    for r in run_result["multi_results"]:
+        if "rows" in r and (len(r["rows"]) > max_rows or r.get("truncated")):
+            compact.append(summarize_statement(r, top_n))
+        else:
+            compact.append({k: v for k, v in r.items() if k != "numeric_stats"})
+    return {"multi_results": compact}
+
+
+def statement_result(fetched: Dict[str, Any]) -> Dict[str, Any]:
+    """Shape a fetch_bounded() result (already JSON-native) for the API."""
+    return {
+        "columns": fetched["columns"],
+        "rows": fetched["rows"],
+        "row_count": len(fetched["rows"]),
+        "total_rows": fetched["total_rows"],
+        "total_rows_exact": fetched["total_rows_exact"],
+        "truncated": fetched["truncated"],
+        "numeric_stats": fetched["numeric_stats"],
+    }
@@ -0,0 +1,92 @@
+import sys
+import base64
+from array import array
+from typing import Any, Dict, List, Optional
+
+try:
+    import pyarrow as pa
+except ImportError:  # Arrow output is optional
+    pa = None
+
+FORMATS = ("rows", "columnar", "arrow")
+
+# array typecodes by width; the smallest one that holds every value of a column is used
+INT_TYPES = (("int8", "b", 1 << 7), ("int16", "h", 1 << 15), ("int32", "i", 1 << 31), ("int64", "q", 1 << 63))
+
+
+def _pack(typecode: str, values) -> str:
+    packed = array(typecode, values)
+    if sys.byteorder == "big":
+        packed.byteswap()  # always little-endian, as JS typed arrays expect
+    return base64.b64encode(packed.tobytes()).decode("ascii")
+
+
+def pack_column(values: List[Any]) -> Dict[str, Any]:
+    """
+    One column in its most compact form:
+      int8..int64 / float64 -> {'type', 'data': base64 little-endian, 'nulls': [row indexes]}
+      dict   -> {'type': 'dict', 'dictionary': [...], 'data': base64 int32 codes, -1 = null}
+      string / json -> {'type', 'values': [...]} (plain list, nulls inline)
+    """
+    non_null = [v for v in values if v is not None]
+    nulls = [i for i, v in enumerate(values) if v is None]
+    if non_null and all(type(v) is int for v in non_null):
+        lo, hi = min(non_null), max(non_null)
+        for name, code, bound in INT_TYPES:
+            if -bound <= lo and hi < bound:
+                return {"type": name, "data": _pack(code, (0 if v is None else v for v in values)), "nulls": nulls}
+        return {"type": "json", "values": values}  # beyond int64: float64 would lose digits
+    if non_null and all(type(v) in (int, float) for v in non_null):
+        return {"type": "float64", "data": _pack("d", (0.0 if v is None else v for v in values)), "nulls": nulls}
+    if non_null and all(type(v) is str for v in non_null):
+        codes: Dict[str, int] = {}
+        for v in non_null:
+            codes.setdefault(v, len(codes))
+        if len(codes) * 2 <= len(values):
+            return {"type": "dict", "dictionary": list(codes),
+                    "data": _pack("i", (-1 if v is None else codes[v] for v in values))}
+        return {"type": "string", "values": values}
+    return {"type": "json", "values": values}
+
+
+def columnar(columns: List[str], rows: List[Any]) -> Dict[str, Any]:
+    return {"columns": columns, "length": len(rows),
+            "data": [pack_column([r[i] for r in rows]) for i in range(len(columns))]}
+
+
+def _arrow_column(values: List[Any]):
+    """Arrow array of one column; mixed types (SQLite allows them) become a string column."""
+    try:
+        return pa.array(values)
+    except (pa.ArrowInvalid, pa.ArrowTypeError, OverflowError):
+        return pa.array([None if v is None else str(v) for v in values], type=pa.string())
+
+
+def arrow_ipc(columns: List[str], rows: List[Any]) -> bytes:
+    """Rows as an Arrow IPC stream (one record batch)."""
+    if pa is None:
+        raise RuntimeError("format=arrow needs pyarrow (pip install pyarrow)")
+    arrays = [_arrow_column([r[i] for r in rows]) for i in range(len(columns))]
+    table = pa.Table.from_arrays(arrays, names=columns)  # keeps duplicate names (s.id, c.id)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def encode_statement(result: Dict[str, Any], fmt: str) -> Dict[str, Any]:
+    """A statement result with its 'rows' replaced by the requested encoding."""
+    if fmt == "rows" or "rows" not in result:
+        return result
+    out = {k: v for k, v in result.items() if k != "rows"}
+    if fmt == "columnar":
+        out["columnar"] = columnar(result["columns"], result["rows"])
+    else:
+        out["arrow"] = base64.b64encode(arrow_ipc(result["columns"], result["rows"])).decode("ascii")
+    return out
+
+
+def encode_result(query_result: Optional[Dict[str, Any]], fmt: str) -> Optional[Dict[str, Any]]:
+    if fmt == "rows" or not query_result or "multi_results" not in query_result:
+        return query_result
+    return {**query_result, "multi_results": [encode_statement(r, fmt) for r in query_result["multi_results"]]}
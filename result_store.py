@@ -0,0 +1,91 @@
+import time
+import uuid
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+
+class ResultStore:
+    """
+    Full query results kept for paging after /ask has sent a preview. LRU,
+    bounded by entry count, entries expire `ttl` seconds after they were stored.
+    With `shared` (a SharedCache) they are also stored there, so a page request
+    served by another worker process finds them.
+    """
+
+    def __init__(self, max_entries: int = 256, ttl: float = 900, shared=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.shared = shared
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stored = 0
+        self.evictions = 0
+        self.expired = 0
+
+    def put(self, run_result: Dict[str, Any]) -> str:
+        result_id = uuid.uuid4().hex
+        with self._lock:
+            self._entries[result_id] = {"value": run_result, "at": time.monotonic()}
+            self.stored += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        if self.shared is not None:
+            self.shared.put("result_store", result_id, run_result, self.ttl)
+        return result_id
+
+    def get(self, result_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._entries.get(result_id)
+            if entry is not None and time.monotonic() - entry["at"] > self.ttl:
+                del self._entries[result_id]
+                self.expired += 1
+                return None
+            if entry is not None:
+                self._entries.move_to_end(result_id)
+                return entry["value"]
+        return self.shared.get("result_store", result_id) if self.shared is not None else None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"entries": len(self._entries), "max_entries": self.max_entries, "stored": self.stored,
+                    "evictions": self.evictions, "expired": self.expired}
+
+
+def needs_paging(run_result: Optional[Dict[str, Any]], preview_rows: int) -> bool:
+    return bool(preview_rows and run_result and any(
+        len(r.get("rows", ())) > preview_rows for r in run_result.get("multi_results", ())))
+
+
+def preview(run_result: Optional[Dict[str, Any]], preview_rows: int) -> Optional[Dict[str, Any]]:
+    """
+    The client-facing copy of a result: statements with more than `preview_rows`
+    rows keep only the first ones and are marked `has_more`; the rest is paged
+    from /results/{result_id}.
+    """
+    if not needs_paging(run_result, preview_rows):
+        return run_result
+    statements = []
+    for r in run_result["multi_results"]:
+        if len(r.get("rows", ())) > preview_rows:
+            r = {**r, "rows": r["rows"][:preview_rows], "preview_rows": preview_rows, "has_more": True}
+        statements.append(r)
+    return {**run_result, "multi_results": statements}
+
+
+def page(statement: Dict[str, Any], offset: int, limit: int) -> Dict[str, Any]:
+    rows = statement.get("rows", [])
+    chunk = rows[offset:offset + limit]
+    end = offset + len(chunk)
+    return {
+        "query": statement.get("query"),
+        "columns": statement.get("columns", []),
+        "rows": chunk,
+        "offset": offset,
+        "row_count": len(rows),
+        "truncated": statement.get("truncated", False),
+        "total_rows": statement.get("total_rows", len(rows)),
+        "has_more": end < len(rows),
+        "next_offset": end if end < len(rows) else None,
+    }
@@ -0,0 +1,234 @@
+import time
+import hashlib
+import threading
+from typing import Any, Callable, Dict, List, Optional
+
+from schema_stats import render_compact_schema
+
+
+# Version probes: cheap queries that change whenever the schema changes.
+# SQLite bumps PRAGMA schema_version on every DDL statement. On Postgres any
+# CREATE/ALTER/DROP rewrites the pg_class row of the table (new xmin) or
+# adds/removes a row, so hashing (oid, xmin, relnatts) detects DDL without
+# touching information_schema.
+PG_VERSION_SQL = """
+    SELECT md5(coalesce(string_agg(c.oid::text || ':' || c.xmin::text || ':' || c.relnatts::text,
+                                   ',' ORDER BY c.oid), ''))
+    FROM pg_class c
+    JOIN pg_namespace n ON n.oid = c.relnamespace
+    WHERE n.nspname = 'public' AND c.relkind IN ('r', 'p');
+"""
+
+PG_COLUMNS_SQL = """
+    SELECT c.table_name, c.column_name, c.data_type
+    FROM information_schema.columns c
+    JOIN information_schema.tables t
+      ON t.table_schema = c.table_schema AND t.table_name = c.table_name
+    WHERE c.table_schema = 'public' AND t.table_type = 'BASE TABLE'
+    ORDER BY c.table_name, c.ordinal_position;
+"""
+
+PG_KEYS_SQL = """
+    SELECT tc.table_name, tc.constraint_type, kcu.column_name,
+           ccu.table_name AS ref_table, ccu.column_name AS ref_column
+    FROM information_schema.table_constraints tc
+    JOIN information_schema.key_column_usage kcu
+      ON kcu.constraint_name = tc.constraint_name AND kcu.table_schema = tc.table_schema
+    LEFT JOIN information_schema.constraint_column_usage ccu
+      ON ccu.constraint_name = tc.constraint_name AND ccu.table_schema = tc.table_schema
+    WHERE tc.table_schema = 'public' AND tc.constraint_type IN ('PRIMARY KEY', 'FOREIGN KEY');
+"""
+
+
+def introspect_sqlite(conn) -> Dict[str, Any]:
+    """Read tables, columns, types and foreign keys from a SQLite connection."""
+    cur = conn.cursor()
+    cur.execute("SELECT name FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%';")
+    tables = {}
+    for (t,) in cur.fetchall():
+        cur.execute(f'PRAGMA table_info("{t}");')
+        columns = [
+            {"name": r[1], "type": (r[2] or "").upper(), "primary_key": bool(r[5])}
+            for r in cur.fetchall()
+        ]
+        cur.execute(f'PRAGMA foreign_key_list("{t}");')
+        fks = [{"column": r[3], "ref_table": r[2], "ref_column": r[4]} for r in cur.fetchall()]
+        tables[t] = {"columns": columns, "foreign_keys": fks}
+    return {"tables": tables}
+
+
+def introspect_postgres(conn) -> Dict[str, Any]:
+    """Read the whole public schema from Postgres in two round trips."""
+    cur = conn.cursor()
+    cur.execute(PG_COLUMNS_SQL)
+    tables: Dict[str, Dict[str, Any]] = {}
+    for t, col, dtype in cur.fetchall():
+        tables.setdefault(t, {"columns": [], "foreign_keys": []})
+        tables[t]["columns"].append({"name": col, "type": dtype.upper(), "primary_key": False})
+    cur.execute(PG_KEYS_SQL)
+    for t, ctype, col, ref_table, ref_col in cur.fetchall():
+        if t not in tables:
+            continue
+        if ctype == "PRIMARY KEY":
+            for c in tables[t]["columns"]:
+                if c["name"] == col:
+                    c["primary_key"] = True
+        else:
+            tables[t]["foreign_keys"].append({"column": col, "ref_table": ref_table, "ref_column": ref_col})
+    return {"tables": tables}
+
+
+def schema_version(conn, backend: str) -> str:
+    cur = conn.cursor()
+    if backend == "postgres":
+        cur.execute(PG_VERSION_SQL)
+    else:
+        cur.execute("PRAGMA schema_version;")
+    return str(cur.fetchone()[0])
+
+
+def render_schema_text(catalog: Dict[str, Any]) -> str:
+    """
+    Prompt form of the catalog: one `table(col, col, ...)` line per table, followed
+    by `-- note` for tables the catalog's 'notes' describe, and its 'footer' if any.
+    """
+    notes = catalog.get("notes", {})
+    lines = [
+        f"{t}({', '.join(c['name'] for c in info['columns'])})" + (f"  -- {notes[t]}" if t in notes else "")
+        for t, info in catalog["tables"].items()
+    ]
+    if catalog.get("footer") and notes.keys() & catalog["tables"].keys():
+        lines.append(catalog["footer"])
+    return "Tables:\n" + "\n".join(lines)
+
+
+def catalog_fingerprint(catalog: Dict[str, Any]) -> str:
+    parts: List[str] = []
+    for t in sorted(catalog["tables"]):
+        info = catalog["tables"][t]
+        cols = ",".join(f"{c['name']}:{c['type']}:{int(c['primary_key'])}" for c in info["columns"])
+        fks = ",".join(f"{f['column']}>{f['ref_table']}.{f['ref_column']}" for f in info["foreign_keys"])
+        parts.append(f"{t}({cols})[{fks}]")
+    return hashlib.sha1("|".join(parts).encode("utf-8")).hexdigest()[:16]
+
+
+class SchemaCatalog:
+    """
+    In-process schema cache. The catalog is introspected once and rebuilt only
+    when the backend's schema version changes or the TTL expires. The version
+    probe itself is skipped for `check_interval` seconds so hot request paths
+    do no DB work at all. `annotate(catalog, conn)` post-processes each
+    introspected catalog (hide tables, add notes); when what it shows depends
+    on the data, `extra_version(conn)` returns a token that is added to the
+    version so a change rebuilds the catalog.
+
+    With `stats` (a SchemaStats) the text is the compact form with types, keys
+    and value statistics, limited to `token_budget`. The statistics are
+    refreshed on a background thread after each rebuild and every
+    `stats_interval` seconds, and the new text is swapped in when it finishes
+    (the fingerprint does not change); requests never wait for them.
+    """
+
+    def __init__(self, connection: Callable, backend: str, ttl: float = 300.0, check_interval: float = 5.0,
+                 annotate: Optional[Callable[[Dict[str, Any], Any], Dict[str, Any]]] = None,
+                 extra_version: Optional[Callable[[Any], str]] = None, stats=None,
+                 stats_interval: float = 60.0, token_budget: int = 0):
+        self.connection = connection  # returns a context manager yielding a DB connection
+        self.backend = backend
+        self.annotate = annotate
+        self.extra_version = extra_version
+        self.ttl = ttl
+        self.check_interval = check_interval
+        self.stats = stats
+        self.stats_interval = stats_interval
+        self.token_budget = token_budget
+        self._stats_at = 0.0
+        self._stats_running = False
+        self._stats_lock = threading.Lock()  # one refresh at a time
+        self.stats_errors = 0
+        self._lock = threading.Lock()
+        self._snapshot: Optional[Dict[str, Any]] = None
+        self._version: Optional[str] = None
+        self._built_at = 0.0
+        self._checked_at = 0.0
+        self.builds = 0
+
+    def render(self, catalog: Dict[str, Any]) -> str:
+        """Prompt text for `catalog` or a subset of its tables."""
+        if self.stats is None:
+            return render_schema_text(catalog)
+        return render_compact_schema(catalog, self.stats.tables, self.token_budget)
+
+    def refresh_stats(self):
+        """Refresh the statistics for the current catalog and re-render its text (blocking)."""
+        try:
+            with self._stats_lock:
+                snap = self._snapshot
+                if snap is None:
+                    return
+                with self.connection() as conn:
+                    self.stats.refresh(conn, snap["catalog"])
+                with self._lock:
+                    if self._snapshot is not None and self._snapshot["fingerprint"] == snap["fingerprint"]:
+                        self._snapshot = {**self._snapshot, "text": self.render(self._snapshot["catalog"])}
+        except Exception:
+            self.stats_errors += 1  # keep the previous statistics; the next interval retries
+        finally:
+            self._stats_running = False
+
+    def _maybe_refresh_stats(self, now: float):
+        if self.stats is None or self._stats_running or now - self._stats_at < self.stats_interval:
+            return
+        with self._lock:
+            if self._stats_running:
+                return
+            self._stats_running = True
+            self._stats_at = now
+        threading.Thread(target=self.refresh_stats, name="schema-stats", daemon=True).start()
+
+    def invalidate(self):
+        with self._lock:
+            self._snapshot = None
+
+    def get(self) -> Dict[str, Any]:
+        """
+        Return {'text', 'catalog', 'fingerprint', 'version'} for the current schema.
+        'catalog' is {'tables': {name: {'columns': [...], 'foreign_keys': [...]}}}.
+        """
+        now = time.monotonic()
+        snap = self._snapshot
+        if snap is not None and now - self._built_at < self.ttl and now - self._checked_at < self.check_interval:
+            self._maybe_refresh_stats(now)
+            return snap
+        snap = self._build()
+        self._maybe_refresh_stats(now)
+        return snap
+
+    def _build(self) -> Dict[str, Any]:
+        with self._lock:
+            now = time.monotonic()
+            with self.connection() as conn:
+                version = schema_version(conn, self.backend)
+                if self.extra_version is not None:
+                    version += ":" + self.extra_version(conn)
+                self._checked_at = now
+                if (self._snapshot is not None and version == self._version
+                        and now - self._built_at < self.ttl):
+                    return self._snapshot
+                if self.backend == "postgres":
+                    catalog = introspect_postgres(conn)
+                else:
+                    catalog = introspect_sqlite(conn)
+                if self.annotate is not None:
+                    catalog = self.annotate(catalog, conn)
+            self._snapshot = {
+                "text": self.render(catalog),
+                "catalog": catalog,
+                "fingerprint": catalog_fingerprint(catalog),
+                "version": version,
+            }
+            self._version = version
+            self._built_at = now
+            self._stats_at = 0.0  # statistics for the new catalog are due now
+            self.builds += 1
+            return self._snapshot
@@ -0,0 +1,192 @@
+import re
+import math
+import hashlib
+import threading
+from collections import Counter
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set
+
+STOP_WORDS = {
+    "a", "an", "the", "of", "in", "on", "for", "to", "by", "and", "or", "with", "from", "at", "is", "are",
+    "was", "were", "be", "what", "which", "who", "whom", "how", "many", "much", "show", "list", "give", "me",
+    "all", "each", "per", "do", "does", "did", "have", "has", "their", "its", "that", "this", "these", "those",
+    "top", "total", "average", "avg", "sum", "count", "number", "last", "first", "year", "month", "day",
+}
+
+# Question words that usually mean a differently named table or column.
+SYNONYMS = {
+    "purchase": ["sale", "order"], "bought": ["sale", "order"], "buy": ["sale", "order"], "sold": ["sale"],
+    "revenue": ["sale", "amount"], "spent": ["amount", "sale"], "client": ["customer"], "buyer": ["customer"],
+    "staff": ["employee"], "worker": ["employee"], "pay": ["salary"], "paid": ["salary", "amount"],
+    "job": ["role"], "title": ["role"], "team": ["project"],
+}
+
+
+def _stem(word: str) -> str:
+    if len(word) > 4 and word.endswith("ies"):
+        return word[:-3] + "y"
+    if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+        return word[:-1]
+    return word
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased word tokens; identifiers are split on '_' and camelCase, plurals folded."""
+    text = re.sub(r"([a-z])([A-Z])", r"\1 \2", str(text))
+    words = re.findall(r"[a-zA-Z]+|\d+", text.lower())
+    return [_stem(w) for w in words if w not in STOP_WORDS]
+
+
+class BM25Index:
+    """Okapi BM25 over token lists, with documents that can be added, replaced or removed one at a time."""
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._postings: Dict[str, Dict[str, int]] = {}
+        self._doc_terms: Dict[str, List[str]] = {}
+        self._doc_len: Dict[str, int] = {}
+        self._total_len = 0
+
+    def __len__(self):
+        return len(self._doc_len)
+
+    def __contains__(self, doc_id: str):
+        return doc_id in self._doc_len
+
+    def add(self, doc_id: str, tokens: Iterable[str]):
+        if doc_id in self._doc_len:
+            self.remove(doc_id)
+        counts = Counter(tokens)
+        for term, tf in counts.items():
+            self._postings.setdefault(term, {})[doc_id] = tf
+        length = sum(counts.values())
+        self._doc_terms[doc_id] = list(counts)
+        self._doc_len[doc_id] = length
+        self._total_len += length
+
+    def remove(self, doc_id: str):
+        length = self._doc_len.pop(doc_id, None)
+        if length is None:
+            return
+        self._total_len -= length
+        for term in self._doc_terms.pop(doc_id):
+            docs = self._postings[term]
+            docs.pop(doc_id, None)
+            if not docs:
+                del self._postings[term]
+
+    def scores(self, query_tokens: Iterable[str]) -> Dict[str, float]:
+        n = len(self._doc_len)
+        if not n:
+            return {}
+        avgdl = self._total_len / n
+        out: Dict[str, float] = {}
+        for term in set(query_tokens):
+            docs = self._postings.get(term)
+            if not docs:
+                continue
+            idf = math.log(1 + (n - len(docs) + 0.5) / (len(docs) + 0.5))
+            for doc_id, tf in docs.items():
+                norm = tf + self.k1 * (1 - self.b + self.b * self._doc_len[doc_id] / avgdl)
+                out[doc_id] = out.get(doc_id, 0.0) + idf * tf * (self.k1 + 1) / norm
+        return out
+
+    def top(self, query_tokens: Iterable[str], k: int) -> List[str]:
+        scored = self.scores(query_tokens)
+        return [d for d, _ in sorted(scored.items(), key=lambda kv: (-kv[1], kv[0]))[:k]]
+
+
+def table_definition_hash(info: Dict[str, Any]) -> str:
+    cols = ",".join(f"{c['name']}:{c['type']}" for c in info["columns"])
+    fks = ",".join(f"{f['column']}>{f['ref_table']}" for f in info["foreign_keys"])
+    return hashlib.sha1(f"{cols}|{fks}".encode("utf-8")).hexdigest()
+
+
+def sample_text_values(conn, table: str, limit: int = 20, per_column: int = 5) -> Dict[str, List[str]]:
+    """A few distinct short text values per column, from one small read of the table."""
+    cur = conn.cursor()
+    cur.execute(f'SELECT * FROM "{table}" LIMIT {int(limit)}')
+    cols = [d[0] for d in cur.description]
+    values: Dict[str, List[str]] = {c: [] for c in cols}
+    for row in cur.fetchall():
+        for c, v in zip(cols, row):
+            if isinstance(v, str) and len(v) <= 40 and v not in values[c] and len(values[c]) < per_column:
+                values[c].append(v)
+    return {c: v for c, v in values.items() if v}
+
+
+class SchemaIndex:
+    """
+    Lexical index with one document per table: name, column names and types,
+    foreign-key targets and sampled text values. Table names and column names
+    are weighted by repetition. refresh() re-indexes (and re-samples) only
+    tables whose definition changed since the last refresh.
+    """
+
+    def __init__(self, connection: Optional[Callable] = None, sample_values: bool = True):
+        self.connection = connection  # context-manager factory used for sampling values
+        self.sample_values = sample_values
+        self.index = BM25Index()
+        self._lock = threading.Lock()
+        self._hashes: Dict[str, str] = {}
+        self._fingerprint: Optional[str] = None
+        self._tables: Dict[str, Any] = {}
+        self.reindexed = 0
+
+    def _document(self, table: str, info: Dict[str, Any], samples: Dict[str, List[str]]) -> List[str]:
+        tokens = tokenize(table) * 3
+        for c in info["columns"]:
+            tokens += tokenize(c["name"]) * 2 + tokenize(c["type"])
+        for f in info["foreign_keys"]:
+            tokens += tokenize(f["ref_table"])
+        for vals in samples.values():
+            for v in vals:
+                tokens += tokenize(v)
+        return tokens
+
+    def refresh(self, snapshot: Dict[str, Any]):
+        """Bring the index in line with a schema snapshot from SchemaCatalog.get()."""
+        if snapshot.get("fingerprint") == self._fingerprint:
+            return
+        with self._lock:
+            if snapshot.get("fingerprint") == self._fingerprint:
+                return
+            tables = snapshot["catalog"]["tables"]
+            changed = [t for t, info in tables.items() if self._hashes.get(t) != table_definition_hash(info)]
+            for t in set(self._hashes) - set(tables):
+                self.index.remove(t)
+                del self._hashes[t]
+            samples: Dict[str, Dict[str, List[str]]] = {}
+            if changed and self.sample_values and self.connection is not None:
+                with self.connection() as conn:
+                    for t in changed:
+                        try:
+                            samples[t] = sample_text_values(conn, t)
+                        except Exception:
+                            samples[t] = {}
+            for t in changed:
+                self.index.add(t, self._document(t, tables[t], samples.get(t, {})))
+                self._hashes[t] = table_definition_hash(tables[t])
+            self.reindexed += len(changed)
+            self._tables = tables
+            self._fingerprint = snapshot.get("fingerprint")
+
+    def retrieve(self, question: str, k: int) -> List[str]:
+        """
+        Top-k tables for the question plus the tables they reference by foreign
+        key, and tables referencing them that also matched the question.
+        Empty when nothing matches.
+        """
+        tokens = tokenize(question)
+        tokens += [s for t in tokens for s in SYNONYMS.get(t, [])]
+        scored = self.index.scores(tokens)
+        top = [t for t, _ in sorted(scored.items(), key=lambda kv: (-kv[1], kv[0]))[:k]]
+        selected: Set[str] = set(top)
+        for t in top:
+            for f in self._tables.get(t, {}).get("foreign_keys", []):
+                if f["ref_table"] in self._tables:
+                    selected.add(f["ref_table"])
+        for t, info in self._tables.items():
+            if t in scored and any(f["ref_table"] in top for f in info["foreign_keys"]):
+                selected.add(t)
+        return [t for t in self._tables if t in selected]
@@ -0,0 +1,320 @@
+import re
+import csv
+import time
+import threading
+from typing import Any, Dict, List, Optional
+
+from schema_index import table_definition_hash
+
+# A text column is rendered as a date range when its sampled values all look like this.
+DATE_RE = re.compile(r"^\d{4}-\d{2}-\d{2}([ T]\d{2}:\d{2}(:\d{2})?)?")
+
+# Postgres statistics come from the planner's catalogs (kept current by autovacuum's
+# ANALYZE), so a refresh reads two catalog views instead of scanning any table.
+PG_ROWS_SQL = """
+    SELECT c.relname, c.reltuples
+    FROM pg_class c
+    JOIN pg_namespace n ON n.oid = c.relnamespace
+    WHERE n.nspname = 'public' AND c.relkind IN ('r', 'p');
+"""
+
+PG_STATS_SQL = """
+    SELECT tablename, attname, n_distinct, most_common_vals::text, histogram_bounds::text
+    FROM pg_stats
+    WHERE schemaname = 'public';
+"""
+
+# Shorter spellings of common type names, to save prompt tokens.
+SHORT_TYPES = {
+    "INTEGER": "int", "BIGINT": "bigint", "SMALLINT": "smallint", "CHARACTER VARYING": "varchar",
+    "DOUBLE PRECISION": "double", "TIMESTAMP WITHOUT TIME ZONE": "timestamp",
+    "TIMESTAMP WITH TIME ZONE": "timestamptz", "BOOLEAN": "bool",
+}
+
+
+def short_type(type_name: str) -> str:
+    return SHORT_TYPES.get(type_name.upper(), type_name.lower())
+
+
+def _is_text(type_name: str) -> bool:
+    t = type_name.upper()
+    return not t or any(k in t for k in ("CHAR", "TEXT", "CLOB"))
+
+
+def _is_date(type_name: str) -> bool:
+    t = type_name.upper()
+    return "DATE" in t or "TIME" in t
+
+
+def _quote(table: str) -> str:
+    return '"' + table.replace('"', '""') + '"'
+
+
+def classify_columns(conn, table: str, info: Dict[str, Any], sample_rows: int,
+                     max_values: int) -> Dict[str, Any]:
+    """
+    From the first `sample_rows` rows: which columns hold dates (declared or
+    ISO-formatted text) and which text columns have at most `max_values`
+    distinct, repeating values. When the sample is not the whole table, each
+    such column's values are read again from the whole table, since the first
+    rows are often clustered (one month, one region).
+    """
+    cols = [c for c in info["columns"] if not c["primary_key"]]
+    if not cols:
+        return {"dates": [], "values": {}}
+    cur = conn.cursor()
+    names = ", ".join(_quote(c["name"]) for c in cols)
+    cur.execute(f"SELECT {names} FROM {_quote(table)} LIMIT {int(sample_rows)}")
+    rows = cur.fetchall()
+    dates, values = [], {}
+    for i, c in enumerate(cols):
+        seen = [r[i] for r in rows if r[i] is not None]
+        if not seen:
+            continue
+        if _is_date(c["type"]) or (_is_text(c["type"])
+                                   and all(isinstance(v, str) and DATE_RE.match(v) for v in seen)):
+            dates.append(c["name"])
+        elif _is_text(c["type"]) and all(isinstance(v, str) for v in seen):
+            distinct = sorted(set(seen))
+            # values that never repeat in the sample are names or codes, not categories
+            if len(distinct) <= max_values and len(distinct) < len(seen):
+                values[c["name"]] = distinct
+    if len(rows) >= sample_rows:
+        for col in list(values):
+            cur.execute(f"SELECT DISTINCT {_quote(col)} FROM {_quote(table)} "
+                        f"WHERE {_quote(col)} IS NOT NULL LIMIT {int(max_values) + 1}")
+            found = [r[0] for r in cur.fetchall()]
+            if len(found) <= max_values:
+                values[col] = sorted(found)
+            else:
+                del values[col]
+    return {"dates": dates, "values": values}
+
+
+def _aggregate(conn, table: str, dates: List[str], where: str = "", args=()) -> Dict[str, Any]:
+    """Row count and min/max of each date column in one scan."""
+    parts = ["COUNT(*)"] + [f"MIN({_quote(d)}), MAX({_quote(d)})" for d in dates]
+    cur = conn.cursor()
+    cur.execute(f"SELECT {', '.join(parts)} FROM {_quote(table)} {where}", args)
+    row = cur.fetchone()
+    ranges = {d: [row[1 + 2 * i], row[2 + 2 * i]] for i, d in enumerate(dates)}
+    return {"rows": int(row[0]), "ranges": {d: r for d, r in ranges.items() if r[0] is not None}}
+
+
+def _sqlite_mark(conn, table: str) -> Optional[int]:
+    try:
+        cur = conn.cursor()
+        cur.execute(f"SELECT COALESCE(MAX(rowid), 0) FROM {_quote(table)}")
+        return int(cur.fetchone()[0])
+    except Exception:  # WITHOUT ROWID tables
+        return None
+
+
+def _pg_array(text: Optional[str]) -> List[str]:
+    """Elements of a Postgres array literal such as {Analyst,"Sales Executive"}."""
+    if not text or len(text) < 2:
+        return []
+    return next(csv.reader([text[1:-1]], escapechar="\\"), [])
+
+
+def pg_table_stats(conn, catalog: Dict[str, Any], max_values: int) -> Dict[str, Dict[str, Any]]:
+    """
+    Row counts from pg_class.reltuples; date ranges from the ends of each column's
+    histogram and most common values; category values from most_common_vals when
+    the planner counts at most `max_values` distinct values. Estimates, as of the
+    table's last ANALYZE; tables never analyzed get no statistics.
+    """
+    cur = conn.cursor()
+    cur.execute(PG_ROWS_SQL)
+    rows = {t: n for t, n in cur.fetchall()}
+    cur.execute(PG_STATS_SQL)
+    columns: Dict[str, Dict[str, tuple]] = {}
+    for t, col, n_distinct, mcv, hist in cur.fetchall():
+        columns.setdefault(t, {})[col] = (n_distinct, _pg_array(mcv), _pg_array(hist))
+    out = {}
+    for t, info in catalog["tables"].items():
+        if rows.get(t) is None or rows[t] < 0 or t not in columns:
+            continue
+        dates, ranges, values = [], {}, {}
+        for c in info["columns"]:
+            if c["primary_key"] or c["name"] not in columns[t]:
+                continue
+            n_distinct, mcv, hist = columns[t][c["name"]]
+            seen = mcv + hist
+            if not seen:
+                continue
+            if _is_date(c["type"]) or (_is_text(c["type"]) and all(DATE_RE.match(v) for v in seen)):
+                dates.append(c["name"])
+                ranges[c["name"]] = [min(seen), max(seen)]
+            elif _is_text(c["type"]) and not hist:
+                # negative n_distinct is a fraction of the row count
+                distinct = n_distinct if n_distinct >= 0 else -n_distinct * rows[t]
+                if 0 < distinct <= max_values and len(mcv) >= distinct:
+                    values[c["name"]] = sorted(mcv)
+        out[t] = {"hash": table_definition_hash(info), "mark": None, "computed_at": time.monotonic(),
+                  "dates": dates, "rows": int(rows[t]), "ranges": ranges, "values": values}
+    return out
+
+
+class SchemaStats:
+    """
+    Per-table statistics for the schema prompt: row count, min/max of date
+    columns and the values of low-cardinality text columns (sampled).
+
+    On SQLite, refresh() only touches tables that changed. A table's change
+    mark is MAX(rowid): when it grew, only the new rows are scanned and merged
+    in, when it shrank (or the definition changed) the table is recomputed.
+    Updates that leave MAX(rowid) alone are picked up by the full recompute
+    every `full_interval` seconds. On Postgres every refresh reads the planner
+    statistics (pg_table_stats) and scans no table.
+
+    refresh() can take seconds on large SQLite tables; SchemaCatalog runs it on
+    a background thread.
+    """
+
+    def __init__(self, backend: str, sample_rows: int = 10000, max_values: int = 8, full_interval: float = 3600.0):
+        self.backend = backend
+        self.sample_rows = sample_rows
+        self.max_values = max_values
+        self.full_interval = full_interval
+        self._lock = threading.Lock()
+        self.tables: Dict[str, Dict[str, Any]] = {}
+        self.computed = 0  # full per-table passes
+        self.merged = 0  # incremental per-table passes
+
+    def _compute(self, conn, table: str, info: Dict[str, Any], mark) -> Dict[str, Any]:
+        kinds = classify_columns(conn, table, info, self.sample_rows, self.max_values)
+        agg = _aggregate(conn, table, kinds["dates"])
+        self.computed += 1
+        return {"hash": table_definition_hash(info), "mark": mark, "computed_at": time.monotonic(),
+                "dates": kinds["dates"], **agg, "values": kinds["values"]}
+
+    def _merge(self, conn, table: str, old: Dict[str, Any], mark: int) -> Dict[str, Any]:
+        """Fold the rows appended since old['mark'] into a SQLite table's stats."""
+        new = _aggregate(conn, table, old["dates"], "WHERE rowid > ?", (old["mark"],))
+        ranges = dict(old["ranges"])
+        for d, (lo, hi) in new["ranges"].items():
+            cur_lo, cur_hi = ranges.get(d, (lo, hi))
+            ranges[d] = [min(cur_lo, lo), max(cur_hi, hi)]
+        values = {}
+        cur = conn.cursor()
+        for col, known in old["values"].items():
+            cur.execute(f"SELECT DISTINCT {_quote(col)} FROM {_quote(table)} WHERE rowid > ? "
+                        f"AND {_quote(col)} IS NOT NULL LIMIT {self.max_values + 1}", (old["mark"],))
+            merged = sorted(set(known) | {r[0] for r in cur.fetchall()})
+            if len(merged) <= self.max_values:  # otherwise no longer low-cardinality
+                values[col] = merged
+        self.merged += 1
+        return {**old, "mark": mark, "rows": old["rows"] + new["rows"], "ranges": ranges, "values": values}
+
+    def refresh(self, conn, catalog: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+        """Bring the stats in line with `catalog` (as returned by introspection) and return them."""
+        with self._lock:
+            if self.backend == "postgres":
+                self.tables = pg_table_stats(conn, catalog, self.max_values)
+                return self.tables
+            now = time.monotonic()
+            out = {}
+            for t, info in catalog["tables"].items():
+                old = self.tables.get(t)
+                mark = _sqlite_mark(conn, t)
+                stale = (old is None or old["hash"] != table_definition_hash(info)
+                         or now - old["computed_at"] >= self.full_interval)
+                if stale or mark is None or mark < old["mark"]:
+                    out[t] = self._compute(conn, t, info, mark)
+                elif mark == old["mark"]:
+                    out[t] = old
+                else:
+                    out[t] = self._merge(conn, t, old, mark)
+            self.tables = out
+            return out
+
+
+def inferred_foreign_keys(catalog: Dict[str, Any], table: str) -> List[Dict[str, str]]:
+    """
+    Declared foreign keys plus `<name>_id` columns that point at a table called
+    <name> or <name>s with an `id` column, for schemas that declare none.
+    """
+    tables = catalog["tables"]
+    fks = list(tables[table]["foreign_keys"])
+    declared = {f["column"] for f in fks}
+    for c in tables[table]["columns"]:
+        name = c["name"]
+        if name in declared or not name.lower().endswith("_id"):
+            continue
+        stem = name[:-3]
+        for ref in (stem, stem + "s", stem + "es"):
+            if ref in tables and ref != table and any(rc["name"] == "id" for rc in tables[ref]["columns"]):
+                fks.append({"column": name, "ref_table": ref, "ref_column": "id"})
+                break
+    return fks
+
+
+def _format_count(n: int) -> str:
+    if n >= 1_000_000:
+        return f"{n / 1_000_000:.1f}M".replace(".0M", "M")
+    if n >= 10_000:
+        return f"{n // 1000}k"
+    return str(n)
+
+
+def _literal(v: Any) -> str:
+    return "'" + str(v).replace("'", "''") + "'"
+
+
+# Detail dropped, in this order, until the text fits the token budget.
+DETAIL_LEVELS = ("types", "values", "ranges")
+
+
+def _table_line(catalog: Dict[str, Any], table: str, stats: Dict[str, Any], keep: set) -> str:
+    refs = {f["column"]: f"{f['ref_table']}.{f['ref_column']}" for f in inferred_foreign_keys(catalog, table)}
+    cols = []
+    for c in catalog["tables"][table]["columns"]:
+        col = c["name"]
+        if "types" in keep and c["type"]:
+            col += " " + short_type(c["type"])
+        if c["primary_key"]:
+            col += " PK"
+        if c["name"] in refs:
+            col += "->" + refs[c["name"]]
+        cols.append(col)
+    line = f"{table}({', '.join(cols)})"
+    extra = []
+    if stats and "ranges" in keep:
+        extra.append(f"{_format_count(stats['rows'])} rows")
+        extra += [f"{d} {_literal(lo)}..{_literal(hi)}" for d, (lo, hi) in stats["ranges"].items()]
+    if stats and "values" in keep:
+        extra += [f"{col} in {','.join(_literal(v) for v in vals)}" for col, vals in stats["values"].items()]
+    if extra:
+        line += " " + "; ".join(extra)
+    return line
+
+
+def render_compact_schema(catalog: Dict[str, Any], stats: Dict[str, Dict[str, Any]],
+                          token_budget: int = 0) -> str:
+    """
+    Prompt form of the catalog with types, keys and statistics, still one line
+    per table so per-table pruning keeps working:
+
+        sales(id int, customer_id int->customers.id, sale_date text) 1000 rows; sale_date '2023-01-01'..'2025-12-31'
+        employees(id int, role text, ...) 50 rows; role in 'Analyst','Engineer'
+
+    Notes and the footer render as in render_schema_text. With `token_budget`
+    (about 4 characters per token), types, then value lists, then row counts
+    and ranges are dropped until the text fits; keys are always kept. Ranges
+    go last because they also show the format of dates stored as text.
+    """
+    notes = catalog.get("notes", {})
+    keep = set(DETAIL_LEVELS)
+    for level in (None,) + DETAIL_LEVELS:
+        keep.discard(level)
+        lines = [
+            _table_line(catalog, t, stats.get(t), keep) + (f"  -- {notes[t]}" if t in notes else "")
+            for t in catalog["tables"]
+        ]
+        if catalog.get("footer") and notes.keys() & catalog["tables"].keys():
+            lines.append(catalog["footer"])
+        text = "Tables:\n" + "\n".join(lines)
+        if not token_budget or (len(text) + 3) // 4 <= token_budget:
+            break
+    return text
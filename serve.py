@@ -0,0 +1,107 @@
+"""
+Run the API under several uvicorn workers that share one cache file, and warm
+that cache from a question corpus.
+
+    python serve.py --workers 4 --port 8000
+    python serve.py --workers 4 --warm benchmarks/question_corpus.json
+
+Workers are separate processes, so in-process caches are per worker and lost on
+restart; SHARED_CACHE_PATH (default here: shared_cache.db) gives them a common
+SQLite-backed tier for generated SQL, query results, paged results and the
+few-shot example store. Warming
+posts every corpus question to /ask once the server answers, through whichever
+worker accepts it, so later requests on any worker skip the LLM calls for the
+SQL and the database work. It uses the configured LLM provider.
+"""
+import os
+import sys
+import time
+import json
+import signal
+import asyncio
+import argparse
+import subprocess
+
+import httpx
+from dotenv import load_dotenv
+
+
+def wait_ready(base_url: str, proc: subprocess.Popen, timeout: float) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            return False
+        try:
+            if httpx.get(base_url + "/", timeout=2).status_code == 200:
+                return True
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.5)
+    return False
+
+
+async def warm(base_url: str, questions, concurrency: int):
+    sem = asyncio.Semaphore(concurrency)
+    latencies, failed = [], []
+
+    async def one(client, question):
+        async with sem:
+            start = time.perf_counter()
+            try:
+                r = await client.post("/ask", json={"question": question})
+                r.raise_for_status()
+                if r.json().get("error"):
+                    failed.append(question)
+            except httpx.HTTPError:
+                failed.append(question)
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=None) as client:
+        await asyncio.gather(*(one(client, q) for q in questions))
+    return latencies, failed
+
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "8000")))
+    parser.add_argument("--warm", metavar="CORPUS", help="JSON list of {question, ...} to send through /ask")
+    parser.add_argument("--warm-concurrency", type=int, default=4)
+    parser.add_argument("--startup-timeout", type=float, default=120.0)
+    args = parser.parse_args()
+
+    env = dict(os.environ)
+    env.setdefault("SHARED_CACHE_PATH", "shared_cache.db")
+    if not env["SHARED_CACHE_PATH"] and args.workers > 1:
+        print("WARNING: SHARED_CACHE_PATH is empty; every worker keeps its own caches.")
+    cmd = [sys.executable, "-m", "uvicorn", "app:app", "--host", args.host, "--port", str(args.port),
+           "--workers", str(args.workers)]
+    print(f"starting {args.workers} worker(s) on {args.host}:{args.port}, "
+          f"shared cache: {env['SHARED_CACHE_PATH'] or 'off'}")
+    proc = subprocess.Popen(cmd, env=env)
+
+    try:
+        if args.warm:
+            base_url = f"http://127.0.0.1:{args.port}"
+            if not wait_ready(base_url, proc, args.startup_timeout):
+                print("server did not come up; not warming")
+            else:
+                with open(args.warm, encoding="utf-8") as f:
+                    questions = [item["question"] for item in json.load(f)]
+                start = time.perf_counter()
+                latencies, failed = asyncio.run(warm(base_url, questions, args.warm_concurrency))
+                print(f"warmed {len(questions) - len(failed)}/{len(questions)} questions in "
+                      f"{time.perf_counter() - start:.1f} s (median {sorted(latencies)[len(latencies) // 2]:.0f} ms)")
+                for q in failed:
+                    print(f"  failed: {q}")
+        proc.wait()
+    except KeyboardInterrupt:
+        proc.send_signal(signal.SIGINT)  # uvicorn shuts its workers down gracefully
+        proc.wait()
+    sys.exit(proc.returncode)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+import os
+import time
+import sqlite3
+import threading
+from typing import Any, Dict, Optional
+
+import orjson
+
+
+class SharedCache:
+    """
+    Key/value cache in one SQLite file, shared by every worker process on the
+    host. Values are stored as orjson-encoded JSON under a namespace and key,
+    each write is a single IMMEDIATE transaction (readers see the old value or
+    the new one, never part of it), and the file is held under `max_bytes` of
+    values by evicting the least recently used entries. Entries expire after
+    their TTL. An optional `version` lets callers invalidate entries that were
+    computed against older data.
+
+    A cache must never fail a request: lock timeouts and other SQLite errors
+    count as a miss (or a skipped write) and are tallied in stats().
+    """
+
+    def __init__(self, path: str, max_bytes: int = 256 * 1024 * 1024, touch_interval: float = 60.0,
+                 busy_timeout: float = 2.0):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.touch_interval = touch_interval  # last_used is refreshed at most this often per entry
+        self.busy_timeout = busy_timeout
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        self.errors = 0
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode = WAL")  # readers never wait for a writer
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS entries (
+                ns TEXT NOT NULL,
+                key TEXT NOT NULL,
+                value BLOB NOT NULL,
+                version TEXT,
+                size INTEGER NOT NULL,
+                expires_at REAL NOT NULL,
+                last_used REAL NOT NULL,
+                PRIMARY KEY (ns, key)
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS entries_last_used ON entries (last_used)")
+        conn.execute("CREATE INDEX IF NOT EXISTS entries_expires_at ON entries (expires_at)")
+        conn.execute("CREATE TABLE IF NOT EXISTS totals (id INTEGER PRIMARY KEY CHECK (id = 0), bytes INTEGER)")
+        conn.execute("INSERT OR IGNORE INTO totals VALUES (0, (SELECT COALESCE(SUM(size), 0) FROM entries))")
+
+    def _conn(self) -> sqlite3.Connection:
+        # one connection per thread and process; a forked child must not reuse its parent's
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=self.busy_timeout, isolation_level=None)
+            conn.execute("PRAGMA synchronous = NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _count(self, field: str):
+        with self._lock:
+            setattr(self, field, getattr(self, field) + 1)
+
+    def get(self, ns: str, key: str, version: Optional[str] = None) -> Optional[Any]:
+        now = time.time()
+        try:
+            conn = self._conn()
+            row = conn.execute("SELECT value, version, expires_at, last_used FROM entries WHERE ns = ? AND key = ?",
+                               (ns, key)).fetchone()
+            if row is not None and (row[2] < now or row[1] != version):
+                self.delete(ns, key)
+                row = None
+            if row is None:
+                self._count("misses")
+                return None
+            if now - row[3] >= self.touch_interval:
+                conn.execute("UPDATE entries SET last_used = ? WHERE ns = ? AND key = ?", (now, ns, key))
+            self._count("hits")
+            return orjson.loads(row[0])
+        except sqlite3.Error:
+            self._count("errors")
+            return None
+
+    def put(self, ns: str, key: str, value: Any, ttl: float, version: Optional[str] = None) -> bool:
+        blob = orjson.dumps(value, default=str)
+        if len(blob) > self.max_bytes:
+            return False
+        now = time.time()
+        conn = None
+        try:
+            conn = self._conn()
+            conn.execute("BEGIN IMMEDIATE")
+            old = conn.execute("SELECT size FROM entries WHERE ns = ? AND key = ?", (ns, key)).fetchone()
+            conn.execute("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?)",
+                         (ns, key, blob, version, len(blob), now + ttl, now))
+            conn.execute("UPDATE totals SET bytes = bytes + ? WHERE id = 0", (len(blob) - (old[0] if old else 0),))
+            self._evict(conn, now)
+            conn.execute("COMMIT")
+            self._count("stores")
+            return True
+        except sqlite3.Error:
+            if conn is not None and conn.in_transaction:
+                conn.execute("ROLLBACK")
+            self._count("errors")
+            return False
+
+    def _evict(self, conn: sqlite3.Connection, now: float):
+        """
+        Inside the write transaction: once over budget, drop expired entries, then
+        the least recently used down to 90% of max_bytes, so evictions come in batches.
+        """
+        total = conn.execute("SELECT bytes FROM totals WHERE id = 0").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        dropped = conn.execute("DELETE FROM entries WHERE expires_at < ? RETURNING size", (now,)).fetchall()
+        total -= sum(size for (size,) in dropped)
+        target = self.max_bytes * 0.9
+        drop = []
+        for ns, key, size in conn.execute("SELECT ns, key, size FROM entries ORDER BY last_used"):
+            if total <= target:
+                break
+            drop.append((ns, key))
+            total -= size
+        conn.executemany("DELETE FROM entries WHERE ns = ? AND key = ?", drop)
+        conn.execute("UPDATE totals SET bytes = ? WHERE id = 0", (total,))
+        with self._lock:
+            self.evictions += len(dropped) + len(drop)
+
+    def delete(self, ns: str, key: str):
+        conn = self._conn()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("DELETE FROM entries WHERE ns = ? AND key = ? RETURNING size", (ns, key)).fetchone()
+            if row:
+                conn.execute("UPDATE totals SET bytes = bytes - ? WHERE id = 0", (row[0],))
+            conn.execute("COMMIT")
+        except sqlite3.Error:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            self._count("errors")
+
+    def clear(self, ns: Optional[str] = None):
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        if ns is None:
+            conn.execute("DELETE FROM entries")
+        else:
+            conn.execute("DELETE FROM entries WHERE ns = ?", (ns,))
+        conn.execute("UPDATE totals SET bytes = (SELECT COALESCE(SUM(size), 0) FROM entries) WHERE id = 0")
+        conn.execute("COMMIT")
+
+    def stats(self) -> Dict[str, Any]:
+        """This process's hit/miss counters plus the file's totals (shared by all workers)."""
+        try:
+            conn = self._conn()
+            per_ns = dict(conn.execute("SELECT ns, COUNT(*) FROM entries GROUP BY ns").fetchall())
+            total = conn.execute("SELECT bytes FROM totals WHERE id = 0").fetchone()[0]
+        except sqlite3.Error:
+            per_ns, total = {}, None
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "path": self.path,
+                "entries": per_ns,
+                "bytes": total,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "stores": self.stores,
+                "evictions": self.evictions,
+                "errors": self.errors,
+            }
@@ -0,0 +1,78 @@
+import time
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence
+
+
+class Stage:
+    """
+    One pipeline step. `fn` receives the results of all finished stages keyed
+    by stage name and returns this stage's result. A stage starts as soon as
+    every stage named in `deps` has finished.
+    """
+
+    def __init__(self, name: str, fn: Callable[[Dict[str, Any]], Awaitable[Any]], deps: Sequence[str] = ()):
+        self.name = name
+        self.fn = fn
+        self.deps = tuple(deps)
+
+
+async def run_stages(stages: List[Stage],
+                     on_done: Optional[Callable[[str, Any], Awaitable[None]]] = None):
+    """
+    Run stages concurrently, serializing only along declared dependencies.
+    Returns (results, timings) where timings maps each stage to its start/end
+    offsets in milliseconds from the start of the run. An exception in a stage
+    cancels the remaining stages and is re-raised.
+    """
+    by_name = {s.name: s for s in stages}
+    for s in stages:
+        missing = [d for d in s.deps if d not in by_name]
+        if missing:
+            raise ValueError(f"Stage {s.name!r} depends on unknown stage(s): {missing}")
+
+    results: Dict[str, Any] = {}
+    timings: Dict[str, Dict[str, Any]] = {}
+    done = {s.name: asyncio.Event() for s in stages}
+    t0 = time.perf_counter()
+
+    async def run(stage: Stage):
+        for d in stage.deps:
+            await done[d].wait()
+        start = time.perf_counter()
+        result = await stage.fn(results)
+        end = time.perf_counter()
+        results[stage.name] = result
+        timings[stage.name] = {
+            "deps": list(stage.deps),
+            "start_ms": round((start - t0) * 1000, 1),
+            "end_ms": round((end - t0) * 1000, 1),
+            "duration_ms": round((end - start) * 1000, 1),
+        }
+        if on_done is not None:
+            await on_done(stage.name, result)
+        done[stage.name].set()
+
+    tasks = [asyncio.ensure_future(run(s)) for s in stages]
+    try:
+        await asyncio.gather(*tasks)
+    except BaseException:
+        for t in tasks:
+            t.cancel()
+        raise
+    return results, timings
+
+
+def critical_path(timings: Dict[str, Dict[str, Any]]) -> List[str]:
+    """
+    Stages that determined the total latency: start from the stage that
+    finished last and walk back through whichever dependency finished last.
+    """
+    if not timings:
+        return []
+    # timings is in completion order, so ties go to the stage that really finished last
+    name = max(reversed(list(timings)), key=lambda n: timings[n]["end_ms"])
+    path = [name]
+    while timings[name]["deps"]:
+        name = max(timings[name]["deps"], key=lambda n: timings[n]["end_ms"])
+        path.append(name)
+    return list(reversed(path))